@@ -0,0 +1,1036 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import textwrap
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+
+import openai
+
+from async_runtime import SyncFacade
+from context_budget import ContextBudget, count_message_tokens
+from llm_clients import key_fingerprint
+from metrics import CallRecord, cached_prompt_tokens, default_metrics, error_name
+from model_routing import FALLBACK_ERRORS, default_router, routed
+from rate_limit import RETRYABLE_ERRORS, default_rate_limiter, default_retry_policy
+from response_cache import cache_key
+from single_flight import default_single_flight
+from structured_outputs import CAST, CONCEPT, CONCEPTS, LOCATIONS, PLACEMENTS, SCRIPT_OUTLINE, StructuredOutputError
+
+# Concepts are requested one per completion choice (FilmConceptAgent.generate_concepts candidates=True)
+CONCEPT_CANDIDATES = os.environ.get("VADIS_CONCEPT_CANDIDATES", "0") == "1"
+
+# Agent System - Using OpenAI's GPT models
+def prompt_block(text):
+    # Dedented and trimmed, so a prompt template yields the same bytes however it is indented in code
+    return textwrap.dedent(text).strip()
+
+class GenerationError(Exception):
+    # Raised instead of returning error text, so a failed call can never be stored as an artifact
+    def __init__(self, agent_name, cause):
+        self.agent_name = agent_name
+        self.cause = cause
+        self.retryable = isinstance(cause, RETRYABLE_ERRORS)
+        super().__init__(f"{agent_name} could not generate a response: {cause}")
+
+class EmptyResponseError(Exception):
+    pass
+
+class Agent:
+    max_tokens = 4000
+    
+    def __init__(self, api_key, model="gpt-4o", temperature=0.7, client=None, cache=None, context_budget=None,
+                 rate_limiter=None, retry_policy=None, single_flight=None, metrics=None, router=None):
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.client = client if client is not None else self.create_client()
+        self.cache = cache
+        self.context_budget = context_budget if context_budget is not None else ContextBudget(model=model)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else default_rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else default_retry_policy
+        self.single_flight = single_flight if single_flight is not None else default_single_flight
+        self.metrics = metrics if metrics is not None else default_metrics
+        self.router = router if router is not None else default_router
+    
+    def create_client(self):
+        # Retries are handled by retry_policy, not inside the SDK
+        return openai.OpenAI(api_key=self.api_key, max_retries=0)
+    
+    def build_messages(self, prompt, system_message, conversation_history=None):
+        messages = [{"role": "system", "content": system_message}]
+        
+        if conversation_history:
+            # Older turns are folded into summaries once history would overrun the context budget
+            reserved = self.context_budget.count(system_message) + self.context_budget.count(prompt)
+            messages.extend(self.context_budget.fit_history(conversation_history, reserved_tokens=reserved))
+        
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    def route(self, task=None):
+        # model, fallback models and max_tokens for one of this agent's tasks (model_routing)
+        return self.router.resolve(self, task)
+    
+    def request_key(self, system_message, messages, schema=None, route=None, n=1):
+        # Content hash of everything that shapes the completion; shared by the cache and, per API key,
+        # by single-flight (flight_key).
+        # Keyed on the route's primary model, so a reply served by a fallback model is reused too
+        route = route if route is not None else self.route()
+        params = {"max_tokens": route.max_tokens}
+        if schema is not None:
+            params["response_format"] = schema.response_format()
+        if n > 1:
+            params["n"] = n
+        return cache_key(route.model, self.temperature, system_message, messages, **params)
+    
+    def flight_key(self, key):
+        # In-flight calls are only shared under one API key: a call billed to one key, or failed on its
+        # auth or quota, is never handed to a session using another
+        return f"{key_fingerprint(self.api_key or '')}:{key}"
+    
+    def similar_request(self, system_message, messages, schema=None, route=None, n=1, near_duplicates=False):
+        # (scope, prompt) for the cache's near-duplicate tier: everything before the final prompt is part
+        # of the scope and must match exactly, the prompt itself only closely. Opt-in per task: prompts
+        # built around a long artifact score as near-duplicates after an edit to that artifact
+        if not near_duplicates or self.cache is None or self.cache.semantic is None:
+            return None
+        return self.request_key(system_message, messages[:-1], schema, route, n), messages[-1]["content"]
+    
+    def lookup_cache(self, key, bypass_cache=False, similar=None):
+        # Bypassing skips the read only; the fresh result still replaces the entry
+        if self.cache is None:
+            return None
+        if bypass_cache:
+            self.cache.record_bypass()
+            return None
+        return self.cache.get(key, similar)
+    
+    def cache_status(self, bypass_cache=False):
+        if self.cache is None:
+            return "off"
+        return "bypass" if bypass_cache else "miss"
+    
+    def record_call(self, started, cache_status, messages=None, content=None, usage=None, stream=False,
+                    first_token_at=None, error=None, model=None):
+        # Streamed completions carry no usage block, so their counts are estimated locally
+        model = model if model is not None else self.model
+        if usage is not None:
+            prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+        else:
+            prompt_tokens = count_message_tokens(messages, model) if messages else 0
+            completion_tokens = self.context_budget.count(content) if content else 0
+        self.metrics.record(CallRecord(
+            type(self).__name__, model, cache_status, time.perf_counter() - started,
+            prompt_tokens, completion_tokens,
+            ttft=first_token_at - started if first_token_at is not None else None,
+            stream=stream,
+            error=error_name(error),
+            usage_estimated=usage is None and messages is not None,
+            cached_tokens=cached_prompt_tokens(usage) if usage is not None else 0,
+        ))
+    
+    def decode_content(self, content, schema=None):
+        # Returns (result, error); structured replies are parsed and validated before they can be cached
+        if not content:
+            return None, EmptyResponseError("the model returned an empty response")
+        if schema is None:
+            return content, None
+        try:
+            return schema.parse(content), None
+        except StructuredOutputError as e:
+            return None, e
+    
+    def estimate_tokens(self, messages, model, max_tokens):
+        # The API counts max_tokens against the tokens/min limit until the completion finishes
+        return count_message_tokens(messages, model) + max_tokens
+    
+    def completion_params(self, messages, stream=False, schema=None, route=None, model=None, n=1):
+        route = route if route is not None else self.route()
+        params = {
+            "model": model if model is not None else route.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": route.max_tokens,
+        }
+        if stream:
+            params["stream"] = True
+        if n > 1:
+            params["n"] = n
+        if schema is not None:
+            params["response_format"] = schema.response_format()
+        return params
+    
+    def request_completion(self, messages, route, stream=False, schema=None, n=1):
+        # Returns (response, model that served it). A timeout or rate limit moves on to the route's
+        # next model at once; only the last model backs off and retries
+        for model in route.models:
+            give_up_on = FALLBACK_ERRORS if model != route.models[-1] else ()
+            try:
+                return self.request_model(messages, route, model, stream, schema, give_up_on, n), model
+            except give_up_on as e:
+                self.router.record_fallback(route, model, e)
+    
+    def request_model(self, messages, route, model, stream, schema, give_up_on, n=1):
+        estimated = self.estimate_tokens(messages, model, route.max_tokens * n)
+        params = self.completion_params(messages, stream, schema, route, model, n)
+        
+        def attempt():
+            self.rate_limiter.acquire(estimated)
+            try:
+                return self.client.chat.completions.create(**params)
+            except Exception:
+                # The call failed before completing, so none of the reservation was used
+                self.rate_limiter.refund(estimated)
+                raise
+        
+        return self.retry_policy.call(attempt, give_up_on)
+    
+    def release_unused_tokens(self, completion_tokens, route, n=1):
+        self.rate_limiter.refund(route.max_tokens * n - completion_tokens)
+    
+    def generate_response(self, prompt, system_message, conversation_history=None, stream=False, bypass_cache=False,
+                          schema=None, task=None, near_duplicates=False):
+        # With a schema (structured_outputs.OutputSchema) the result is the parsed JSON record, not text.
+        # task names the calling method (set by @routed) and selects its model route
+        if stream:
+            if schema is not None:
+                raise ValueError("Structured outputs cannot be streamed")
+            return self.stream_response(prompt, system_message, conversation_history, bypass_cache, task,
+                                        near_duplicates)
+        started = time.perf_counter()
+        route = self.route(task)
+        messages = self.build_messages(prompt, system_message, conversation_history)
+        key = self.request_key(system_message, messages, schema, route)
+        similar = self.similar_request(system_message, messages, schema, route, near_duplicates=near_duplicates)
+        cached = self.lookup_cache(key, bypass_cache, similar)
+        if cached is not None:
+            self.record_call(started, "hit", model=route.model)
+            return self.decode_content(cached, schema)[0]
+        cache_status = self.cache_status(bypass_cache)
+        # Identical requests already in flight (any session) share that call instead of starting another
+        return self.single_flight.do(
+            self.flight_key(key), lambda: self.fetch_response(messages, key, started, cache_status, route, schema, similar))
+    
+    def generate_candidates(self, prompt, system_message, n, conversation_history=None, bypass_cache=False,
+                            schema=None, task=None, near_duplicates=False):
+        # n independent completions of one prompt, as a list: one request with the API's n parameter,
+        # or n parallel requests on routes with "supports_n": false
+        started = time.perf_counter()
+        route = self.route(task)
+        messages = self.build_messages(prompt, system_message, conversation_history)
+        key = self.request_key(system_message, messages, schema, route, n)
+        similar = self.similar_request(system_message, messages, schema, route, n, near_duplicates)
+        cached = self.lookup_cache(key, bypass_cache, similar)
+        if cached is not None:
+            self.record_call(started, "hit", model=route.model)
+            return [self.decode_content(content, schema)[0] for content in json.loads(cached)]
+        cache_status = self.cache_status(bypass_cache)
+        return self.single_flight.do(
+            self.flight_key(key), lambda: self.fetch_candidates(messages, key, started, cache_status, route, n, schema, similar))
+    
+    def fetch_candidates(self, messages, key, started, cache_status, route, n, schema=None, similar=None):
+        try:
+            if route.supports_n:
+                responses = [self.request_completion(messages, route, schema=schema, n=n)]
+            else:
+                with ThreadPoolExecutor(max_workers=n) as executor:
+                    responses = list(executor.map(
+                        lambda _: self.request_completion(messages, route, schema=schema), range(n)))
+        except Exception as e:
+            self.record_call(started, cache_status, error=e, model=route.model)
+            raise GenerationError(type(self).__name__, e) from e
+        return self.collect_candidates(responses, messages, key, started, cache_status, route, schema, similar)
+    
+    def collect_candidates(self, responses, messages, key, started, cache_status, route, schema=None, similar=None):
+        # Decodes every choice of every (response, model) pair; shared by the sync and async paths
+        contents, results, failure = [], [], None
+        for response, model in responses:
+            choices = sorted(response.choices, key=lambda choice: choice.index)
+            if response.usage is not None:
+                self.release_unused_tokens(response.usage.completion_tokens, route, len(choices))
+            texts = [choice.message.content for choice in choices]
+            decoded = [self.decode_content(text, schema) for text in texts]
+            error = next((error for _, error in decoded if error is not None), None)
+            self.record_call(started, cache_status, messages, "".join(text or "" for text in texts), response.usage,
+                             error=error, model=model)
+            failure = failure or error
+            contents.extend(texts)
+            results.extend(result for result, _ in decoded)
+        if failure is not None:
+            raise GenerationError(type(self).__name__, failure)
+        if self.cache is not None:
+            self.cache.set(key, json.dumps(contents), similar)
+        return results
+    
+    def task_message(self, instructions, schema=None):
+        # The system message for one task: persona, then the task's fixed instructions. User data goes in the
+        # final user message, so every call of a task starts with the same bytes and the provider can reuse
+        # its cached prefix
+        parts = [self.system_message, instructions]
+        if schema is not None:
+            parts.append(prompt_block(schema.instructions()))
+        return "\n\n".join(parts)
+    
+    def structured_response(self, prompt, schema, instructions, **options):
+        # Asks for JSON records instead of free text, so callers read fields rather than regex-parse prose
+        return self.generate_response(prompt, self.task_message(instructions, schema), schema=schema, **options)
+    
+    def fetch_response(self, messages, key, started, cache_status, route, schema=None, similar=None):
+        try:
+            response, model = self.request_completion(messages, route, schema=schema)
+        except Exception as e:
+            self.record_call(started, cache_status, error=e, model=route.model)
+            raise GenerationError(type(self).__name__, e) from e
+        
+        content = response.choices[0].message.content
+        if response.usage is not None:
+            self.release_unused_tokens(response.usage.completion_tokens, route)
+        result, error = self.decode_content(content, schema)
+        self.record_call(started, cache_status, messages, content, response.usage, error=error, model=model)
+        if error is not None:
+            raise GenerationError(type(self).__name__, error)
+        if self.cache is not None:
+            self.cache.set(key, content, similar)
+        return result
+    
+    def stream_response(self, prompt, system_message, conversation_history=None, bypass_cache=False, task=None,
+                        near_duplicates=False):
+        # Yields text deltas as they arrive so the UI can render before the completion finishes
+        started = time.perf_counter()
+        route = self.route(task)
+        messages = self.build_messages(prompt, system_message, conversation_history)
+        key = self.request_key(system_message, messages, route=route)
+        similar = self.similar_request(system_message, messages, route=route, near_duplicates=near_duplicates)
+        cached = self.lookup_cache(key, bypass_cache, similar)
+        if cached is not None:
+            self.record_call(started, "hit", stream=True, model=route.model)
+            yield cached
+            return
+        cache_status = self.cache_status(bypass_cache)
+        yield from self.single_flight.stream(
+            self.flight_key(key), lambda: self.fetch_stream(messages, key, started, cache_status, route, similar))
+    
+    def fetch_stream(self, messages, key, started, cache_status, route, similar=None):
+        chunks = []
+        first_token_at = None
+        response = None
+        try:
+            response, model = self.request_completion(messages, route, stream=True)
+            # Closed as well when the caller abandons the stream, so the API stops generating
+            with closing(response):
+                for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        chunks.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+        except Exception as e:
+            if response is not None:
+                # Broken off mid-stream: the part of the reservation not streamed yet is returned
+                self.release_unused_tokens(self.context_budget.count("".join(chunks)), route)
+            self.record_call(started, cache_status, stream=True, first_token_at=first_token_at, error=e,
+                             model=route.model)
+            raise GenerationError(type(self).__name__, e) from e
+        
+        content = "".join(chunks)
+        self.release_unused_tokens(self.context_budget.count(content), route)
+        error = self.decode_content(content)[1]
+        self.record_call(started, cache_status, messages, content, stream=True, first_token_at=first_token_at,
+                         error=error, model=model)
+        if error is not None:
+            raise GenerationError(type(self).__name__, error)
+        if self.cache is not None:
+            self.cache.set(key, content, similar)
+
+class FilmConceptAgent(Agent):
+    concepts_instructions = prompt_block("""
+        Generate the requested number of distinct film concepts based on the parameters the user provides.
+        
+        For each concept, provide:
+        1. Title
+        2. Logline (one sentence)
+        3. Synopsis (2-3 paragraphs)
+        4. Key selling points (what makes this marketable)
+        5. Potential audience appeal
+        """)
+    
+    def __init__(self, api_key, model="gpt-4o", **options):
+        super().__init__(api_key, model, temperature=0.8, **options)
+        self.system_message = prompt_block("""
+        You are an expert film concept creator with decades of experience in the film industry.
+        Your task is to generate innovative and compelling film concepts based on user inputs.
+        Consider current trends, audience preferences, and provide a range of options that vary in tone, style, and approach.
+        Each concept should include a catchy title, a brief logline, and a short synopsis that outlines the main plot.
+        Your concepts should be marketable, unique, and have strong potential for both critical acclaim and commercial success.
+        """)
+    
+    def concepts_system_message(self, structured=False, candidates=False):
+        if candidates:
+            schema = CONCEPT if structured else None
+            format_instructions = ("Return the concept as a JSON record." if structured
+                                   else "Format the concept clearly, starting with its title.")
+        else:
+            schema = CONCEPTS if structured else None
+            format_instructions = ("Return the concepts as JSON records." if structured
+                                   else "Format each concept clearly and label them as CONCEPT 1, CONCEPT 2, etc.")
+        return self.task_message(self.concepts_instructions + "\n\n" + format_instructions, schema)
+    
+    def concepts_prompt(self, user_inputs, num_concepts=3):
+        return f"""Number of concepts: {num_concepts}
+Genre: {user_inputs.get('genre', 'Not specified')}
+Target Rating: {user_inputs.get('rating', 'Not specified')}
+Key Themes: {user_inputs.get('themes', 'Not specified')}
+Target Audience: {user_inputs.get('audience', 'Not specified')}
+Additional Notes: {user_inputs.get('additional_notes', 'None')}"""
+    
+    @routed
+    def generate_concepts(self, user_inputs, num_concepts=3, structured=False, candidates=False, **options):
+        # structured=True returns {"concepts": [...]} records (structured_outputs.CONCEPTS) instead of text.
+        # candidates=True returns a list with one concept per completion choice (CONCEPT records when
+        # structured): num_concepts short completions written side by side instead of one long one.
+        # Concept prompts are short user inputs only, so they may reuse a near-duplicate's response
+        options.setdefault("near_duplicates", True)
+        if candidates:
+            if options.get("stream"):
+                raise ValueError("Concept candidates cannot be streamed")
+            prompt = self.concepts_prompt(user_inputs, 1)
+            return self.generate_candidates(prompt, self.concepts_system_message(structured, candidates=True),
+                                            num_concepts, schema=CONCEPT if structured else None, **options)
+        prompt = self.concepts_prompt(user_inputs, num_concepts)
+        if structured:
+            return self.generate_response(prompt, self.concepts_system_message(True), schema=CONCEPTS, **options)
+        return self.generate_response(prompt, self.concepts_system_message(), **options)
+
+class ScriptAgent(Agent):
+    treatment_instructions = prompt_block("""
+        Create a detailed film treatment based on the concept the user provides, incorporating any additional details they give.
+        
+        The treatment should include:
+        1. An expanded synopsis (5-7 paragraphs)
+        2. A clear three-act structure
+        3. Major plot points and turning points
+        4. Character development arcs for the main characters
+        5. Thematic elements to be explored
+        
+        This treatment will serve as the foundation for the full script development.
+        """)
+    outline_instructions = prompt_block("""
+        Based on the treatment the user provides, create a detailed script outline with approximately the requested number of key scenes.
+        
+        For each scene, provide:
+        1. Scene heading (INT/EXT, LOCATION, TIME)
+        2. Brief description of the setting
+        3. Characters present
+        4. Summary of the action (what happens)
+        5. Purpose of the scene in advancing the plot or character development
+        
+        Order the scenes chronologically and ensure they follow a cohesive narrative arc.
+        """)
+    scene_instructions = prompt_block("""
+        Write a professional screenplay scene based on the scene description and characters the user provides, continuing from any previous scenes given.
+        
+        Use proper screenplay format including:
+        - Scene heading
+        - Action descriptions
+        - Character names
+        - Dialogue
+        - Parentheticals where appropriate
+        - Transitions where appropriate
+        
+        Keep the scene concise but effective, with natural dialogue and clear action descriptions.
+        """)
+    
+    def __init__(self, api_key, model="gpt-4o", **options):
+        super().__init__(api_key, model, temperature=0.7, **options)
+        self.system_message = prompt_block("""
+        You are an experienced screenwriter with expertise in creating professional-quality film scripts.
+        Your writing adheres to industry-standard screenplay format.
+        You create compelling dialogue, clear action descriptions, and properly formatted scene headings.
+        Your scripts maintain consistent tone, voice, and pacing appropriate to the genre and project requirements.
+        """)
+    
+    @routed
+    def generate_treatment(self, concept, additional_details=None, **options):
+        prompt = f"""Concept:
+{concept}
+
+Additional details to incorporate: {additional_details if additional_details else 'None provided'}"""
+        return self.generate_response(prompt, self.task_message(self.treatment_instructions), **options)
+    
+    @routed
+    def generate_script_outline(self, treatment, num_scenes=12, structured=False, **options):
+        prompt = f"""Number of scenes: {num_scenes}
+
+Treatment:
+{treatment}"""
+        if structured:
+            return self.structured_response(prompt, SCRIPT_OUTLINE, self.outline_instructions, **options)
+        return self.generate_response(prompt, self.task_message(self.outline_instructions), **options)
+    
+    @routed
+    def generate_scene(self, scene_description, characters, previous_scenes=None, **options):
+        # previous_scenes may be a list of scene texts or one block; either is trimmed to the context budget
+        previous_scenes = self.context_budget.fit_scenes(previous_scenes)
+        context = f"Previous scenes: {previous_scenes}\n\n" if previous_scenes else ""
+        
+        prompt = f"""{context}Scene description: {scene_description}
+Characters present: {characters}"""
+        return self.generate_response(prompt, self.task_message(self.scene_instructions), **options)
+
+class CastingAgent(Agent):
+    casting_instructions = prompt_block("""
+        Suggest ideal casting choices for the characters the user describes, for a film of the given budget level.
+        Do not suggest any of the actors the user asks to exclude.
+        
+        For each character, provide:
+        1. Three potential actors who would excel in the role (prioritize actors who are currently active)
+        2. Brief explanation of why each actor would be suitable
+        3. Notable similar roles they've played that demonstrate their fit
+        4. Any potential scheduling, budget, or casting challenges to consider
+        
+        Provide a mix of established stars and rising talent as appropriate for the budget level.
+        """)
+    
+    def __init__(self, api_key, model="gpt-4o", **options):
+        super().__init__(api_key, model, temperature=0.7, **options)
+        self.system_message = prompt_block("""
+        You are an expert casting director with extensive knowledge of actors across Hollywood and international cinema.
+        Your specialty is matching character descriptions with ideal actors who would bring authenticity, star power, and the right qualities to a role.
+        You know actors' past performances, physical characteristics, acting styles, current popularity, and typical casting rates.
+        Make casting suggestions that balance artistic integrity with commercial viability, considering both established stars and promising new talent.
+        """)
+    
+    @routed
+    def suggest_cast(self, characters_descriptions, budget_level="medium", exclude_actors=None, structured=False,
+                     **options):
+        exclude_str = ", ".join(exclude_actors) if exclude_actors else "None"
+        
+        prompt = f"""Budget level: {budget_level}
+Actors to exclude from consideration: {exclude_str}
+
+Characters:
+{characters_descriptions}"""
+        if structured:
+            return self.structured_response(prompt, CAST, self.casting_instructions, **options)
+        return self.generate_response(prompt, self.task_message(self.casting_instructions), **options)
+
+class LocationAgent(Agent):
+    location_instructions = prompt_block("""
+        Recommend optimal filming locations for a film of the given budget level with the script elements and special requirements the user provides.
+        
+        For each major setting in the script, suggest:
+        1. Primary location recommendation (specific city/region/country)
+        2. Alternative location options that could work as substitutes
+        3. Key benefits of each location (visual style, authenticity, production incentives)
+        4. Practical considerations (weather seasons, permit requirements, logistical challenges)
+        5. Estimated cost impact (high/medium/low) relative to the budget level
+        
+        Focus on locations that offer the best combination of creative fit, production value, and financial incentives.
+        """)
+    
+    def __init__(self, api_key, model="gpt-4o", **options):
+        super().__init__(api_key, model, temperature=0.6, **options)
+        self.system_message = prompt_block("""
+        You are an experienced film location scout with global expertise in finding perfect filming locations.
+        You understand both the creative aspects (visual style, atmosphere, setting authenticity) and practical considerations (permits, costs, facilities, crew access, weather patterns).
+        You know which countries and regions offer film production incentives and tax benefits.
+        You provide specific, actionable location recommendations that balance creative vision with logistical reality.
+        """)
+    
+    @routed
+    def suggest_locations(self, script_elements, budget_level="medium", special_requirements=None, structured=False,
+                          **options):
+        requirements = special_requirements if special_requirements else "None specified"
+        
+        prompt = f"""Budget level: {budget_level}
+Special requirements: {requirements}
+
+Script elements:
+{script_elements}"""
+        if structured:
+            return self.structured_response(prompt, LOCATIONS, self.location_instructions, **options)
+        return self.generate_response(prompt, self.task_message(self.location_instructions), **options)
+
+class ProductPlacementAgent(Agent):
+    placement_instructions = prompt_block("""
+        Identify natural product placement opportunities for a film with the script elements, target audience and genre the user provides.
+        
+        For each placement opportunity, provide:
+        1. The scene or context where the placement would occur
+        2. Specific brands that would be ideal fits (suggest 2-3 options per opportunity)
+        3. How the product would be integrated (background, mentioned in dialogue, actively used by character, etc.)
+        4. Why this placement feels natural rather than forced
+        5. The potential value tier of the placement (high/medium/low)
+        
+        Suggest at least 5 different placement opportunities across various categories (e.g., technology, food/beverage, automotive, fashion, etc.).
+        Focus on placements that would feel authentic to the story and characters.
+        """)
+    
+    def __init__(self, api_key, model="gpt-4o", **options):
+        super().__init__(api_key, model, temperature=0.7, **options)
+        self.system_message = prompt_block("""
+        You are a product placement and brand integration specialist with expertise in seamlessly incorporating brands into film content.
+        You understand how to identify natural placement opportunities that don't feel forced but provide value to brands.
+        You know which brands align with different film genres, character types, and target audiences.
+        You can suggest both obvious and subtle placement opportunities, from featured products to background elements.
+        You understand the financial considerations of different placement types and their potential value.
+        """)
+    
+    @routed
+    def suggest_placements(self, script_elements, target_audience, genre, structured=False, **options):
+        prompt = f"""Genre: {genre}
+Target audience: {target_audience}
+
+Script elements:
+{script_elements}"""
+        if structured:
+            return self.structured_response(prompt, PLACEMENTS, self.placement_instructions, **options)
+        return self.generate_response(prompt, self.task_message(self.placement_instructions), **options)
+
+class MarketingAgent(Agent):
+    marketing_instructions = prompt_block("""
+        Create key marketing assets for the film the user describes.
+        
+        Provide:
+        
+        1. Three potential taglines that capture the film's essence
+        2. A detailed poster concept description (visual elements, style, composition)
+        3. A trailer strategy (what scenes/moments to highlight, tone, music suggestions)
+        4. Three key selling points to emphasize in marketing materials
+        5. Social media strategy (platform focus, content types, hashtag suggestions)
+        
+        Ensure all elements align with the target audience preferences and highlight what makes this film unique and appealing.
+        """)
+    
+    def __init__(self, api_key, model="gpt-4o", **options):
+        super().__init__(api_key, model, temperature=0.8, **options)
+        self.system_message = prompt_block("""
+        You are an expert film marketing strategist who specializes in creating compelling promotional materials and strategies.
+        You know how to position films to appeal to their target audiences while highlighting their unique selling points.
+        You understand both traditional marketing channels and digital/social media strategies.
+        You can create taglines, poster concepts, and trailer strategies that capture the essence of a film.
+        Your goal is to maximize audience interest and box office potential through effective marketing.
+        """)
+    
+    @routed
+    def generate_marketing_assets(self, film_details, target_audience, **options):
+        prompt = f"""Target audience: {target_audience}
+
+Film details:
+{film_details}"""
+        return self.generate_response(prompt, self.task_message(self.marketing_instructions), **options)
+
+def build_film_summary(project):
+    return f"""Title: {project['title']}
+Genre: {project['genre']}
+Concept: {project['concept'][:500]}..."""
+
+# Script outline parsing for full-draft generation
+SCENE_LABEL_PATTERN = re.compile(r"^[\s#*>_-]*scene\s+(\d+)\b", re.IGNORECASE | re.MULTILINE)
+NUMBERED_HEADING_PATTERN = re.compile(r"^[\s#*>_-]*(\d+)[.)]\s+[*_]*\s*(?:INT|EXT|I/E)\b", re.MULTILINE)
+SLUGLINE_PATTERN = re.compile(r"^[\s#*>_\d.)-]*((?:INT|EXT|I/E)[./][^\n]*)", re.MULTILINE)
+HEADING_PATTERN = re.compile(r"\b((?:INT|EXT|I/E)[./][^\n]*)")
+CHARACTERS_PATTERN = re.compile(r"characters(?:\s+present)?[*_]*\s*:[*_]*\s*([^\n]+)", re.IGNORECASE)
+SUMMARY_PATTERN = re.compile(r"(?:summary of the action|action summary|summary|action)[*_]*\s*:[*_]*\s*([^\n]+)", re.IGNORECASE)
+
+def parse_script_outline(script_outline):
+    # Splits a free-text outline into scene records, preferring explicit "Scene N" labels
+    starts = [m.start() for m in SCENE_LABEL_PATTERN.finditer(script_outline)]
+    if not starts:
+        starts = [m.start() for m in NUMBERED_HEADING_PATTERN.finditer(script_outline)]
+    if not starts:
+        starts = [m.start() for m in SLUGLINE_PATTERN.finditer(script_outline)]
+    
+    scenes = []
+    for index, start in enumerate(starts):
+        end = starts[index + 1] if index + 1 < len(starts) else len(script_outline)
+        block = script_outline[start:end].strip()
+        slugline = HEADING_PATTERN.search(block)
+        characters = CHARACTERS_PATTERN.search(block)
+        summary = SUMMARY_PATTERN.search(block)
+        heading = slugline.group(1) if slugline else block.splitlines()[0]
+        scenes.append({
+            "number": index + 1,
+            "heading": heading.strip(" *_#"),
+            "description": block,
+            "characters": characters.group(1).strip(" *_") if characters else "As described in the scene",
+            "summary": (summary.group(1) if summary else " ".join(block.split()))[:300].strip(" *_"),
+        })
+    return scenes
+
+def build_scene_context(scenes, index, context_scenes=3):
+    # Compact rolling context: outline summaries of the few scenes before this one, not their full text
+    if index == 0:
+        return None
+    window = scenes[max(0, index - context_scenes):index]
+    lines = []
+    if window[0]["number"] > 1:
+        lines.append(f"(Scenes before scene {window[0]['number']} omitted.)")
+    for scene in window:
+        lines.append(f"Scene {scene['number']} - {scene['heading']}: {scene['summary']}")
+    return "\n".join(lines)
+
+def outline_fingerprint(script_outline):
+    return hashlib.sha256(script_outline.encode("utf-8")).hexdigest()
+
+def assemble_script_draft(scenes, written_scenes):
+    parts = []
+    for scene in scenes:
+        text = written_scenes.get(str(scene["number"]))
+        parts.append(text if text else f"[Scene {scene['number']} - {scene['heading']}: not yet written]")
+    return "\n\n".join(parts)
+
+def completed_result(future):
+    # (result, error) for a finished future; only generation failures are reported, bugs still raise
+    error = future.exception()
+    if error is None:
+        return future.result(), None
+    if isinstance(error, GenerationError):
+        return None, error
+    raise error
+
+# Multi-Agent System Coordinator
+class FilmAISystem:
+    def __init__(self, api_key, client=None, cache=None, **agent_options):
+        # agent_options (context_budget, rate_limiter, retry_policy, single_flight, metrics, router) go to every agent
+        self.api_key = api_key
+        # All agents share one client so they reuse a single HTTP connection pool
+        self.client = client if client is not None else openai.OpenAI(api_key=api_key, max_retries=0)
+        self.cache = cache
+        self.context_budget = agent_options.get("context_budget")
+        self.concept_agent = FilmConceptAgent(api_key, client=self.client, cache=cache, **agent_options)
+        self.script_agent = ScriptAgent(api_key, client=self.client, cache=cache, **agent_options)
+        self.casting_agent = CastingAgent(api_key, client=self.client, cache=cache, **agent_options)
+        self.location_agent = LocationAgent(api_key, client=self.client, cache=cache, **agent_options)
+        self.placement_agent = ProductPlacementAgent(api_key, client=self.client, cache=cache, **agent_options)
+        self.marketing_agent = MarketingAgent(api_key, client=self.client, cache=cache, **agent_options)
+    
+    # Keyword options (stream, bypass_cache, and structured where supported) are forwarded to the agents
+    def generate_film_concept(self, user_inputs, **options):
+        return self.concept_agent.generate_concepts(user_inputs, **options)
+    
+    def develop_treatment(self, concept, additional_details=None, **options):
+        return self.script_agent.generate_treatment(concept, additional_details, **options)
+    
+    def create_script_outline(self, treatment, num_scenes=12, **options):
+        return self.script_agent.generate_script_outline(treatment, num_scenes, **options)
+    
+    def write_scene(self, scene_description, characters, previous_scenes=None, **options):
+        return self.script_agent.generate_scene(scene_description, characters, previous_scenes, **options)
+    
+    def suggest_cast(self, character_descriptions, budget_level="medium", exclude_actors=None, **options):
+        return self.casting_agent.suggest_cast(character_descriptions, budget_level, exclude_actors, **options)
+    
+    def suggest_locations(self, script_elements, budget_level="medium", special_requirements=None, **options):
+        return self.location_agent.suggest_locations(script_elements, budget_level, special_requirements, **options)
+    
+    def suggest_product_placements(self, script_elements, target_audience, genre, **options):
+        return self.placement_agent.suggest_placements(script_elements, target_audience, genre, **options)
+    
+    def create_marketing_assets(self, film_details, target_audience, **options):
+        return self.marketing_agent.generate_marketing_assets(film_details, target_audience, **options)
+    
+    def downstream_tasks(self, project, user_inputs=None):
+        # Casting, locations and placements only need the outline, marketing only the treatment
+        user_inputs = user_inputs or {}
+        outline = project.get("script_outline")
+        budget_level = user_inputs.get("budget_level", "medium")
+        audience = user_inputs.get("target_audience", "General audience")
+        
+        tasks = {}
+        if outline:
+            tasks["cast_suggestions"] = (self.suggest_cast, (
+                user_inputs.get("character_descriptions") or outline,
+                budget_level,
+                user_inputs.get("exclude_actors"),
+            ))
+            tasks["location_suggestions"] = (self.suggest_locations, (
+                user_inputs.get("script_elements") or outline,
+                budget_level,
+                user_inputs.get("special_requirements"),
+            ))
+            tasks["product_placements"] = (self.suggest_product_placements, (
+                user_inputs.get("script_elements") or outline,
+                audience,
+                project.get("genre", "Not specified"),
+            ))
+        if project.get("treatment"):
+            tasks["marketing_assets"] = (self.create_marketing_assets, (build_film_summary(project), audience))
+        return tasks
+    
+    def iter_downstream_assets(self, project, user_inputs=None, max_workers=4, **options):
+        # Yields (field, result, error) in completion order from a bounded thread pool;
+        # one failed agent does not stop the others
+        tasks = self.downstream_tasks(project, user_inputs)
+        if not tasks:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks)))) as executor:
+            futures = {executor.submit(method, *args, **options): key for key, (method, args) in tasks.items()}
+            for future in as_completed(futures):
+                yield (futures[future],) + completed_result(future)
+    
+    def generate_downstream_assets(self, project, user_inputs=None, on_result=None, on_error=None, max_workers=4,
+                                   **options):
+        # Callbacks run in the calling thread as each result lands, so they may touch session state
+        results = {}
+        for key, value, error in self.iter_downstream_assets(project, user_inputs, max_workers, **options):
+            if error is not None:
+                if on_error:
+                    on_error(key, error)
+                continue
+            results[key] = value
+            if on_result:
+                on_result(key, value)
+        return results
+    
+    def pending_scenes(self, script_outline, written_scenes=None):
+        scenes = parse_script_outline(script_outline)
+        written_scenes = written_scenes or {}
+        return scenes, [index for index, scene in enumerate(scenes) if not written_scenes.get(str(scene["number"]))]
+    
+    def iter_full_draft(self, script_outline, written_scenes=None, max_workers=4, context_scenes=3, **options):
+        # Yields (scene number, text, error) as scenes finish; scenes already in written_scenes are
+        # skipped so an interrupted or partly failed draft resumes where it stopped
+        scenes, pending = self.pending_scenes(script_outline, written_scenes)
+        if not pending:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+            futures = {
+                executor.submit(self.write_scene, scenes[index]["description"], scenes[index]["characters"],
+                                build_scene_context(scenes, index, context_scenes), **options): scenes[index]["number"]
+                for index in pending
+            }
+            for future in as_completed(futures):
+                yield (futures[future],) + completed_result(future)
+
+# Async Agent System - same prompt builders, driven by openai.AsyncOpenAI
+class AsyncAgentMixin:
+    # Mixed in ahead of an Agent subclass: its prompt-building methods return whatever
+    # generate_response returns, so they become awaitables (or async generators when streaming)
+    def create_client(self):
+        return openai.AsyncOpenAI(api_key=self.api_key, max_retries=0)
+    
+    def generate_response(self, prompt, system_message, conversation_history=None, stream=False, bypass_cache=False,
+                          schema=None, task=None, near_duplicates=False):
+        if stream:
+            if schema is not None:
+                raise ValueError("Structured outputs cannot be streamed")
+            return self.stream_response(prompt, system_message, conversation_history, bypass_cache, task,
+                                        near_duplicates)
+        return self.complete_response(prompt, system_message, conversation_history, bypass_cache, schema, task,
+                                      near_duplicates)
+    
+    async def request_completion(self, messages, route, stream=False, schema=None, n=1):
+        for model in route.models:
+            give_up_on = FALLBACK_ERRORS if model != route.models[-1] else ()
+            try:
+                return await self.request_model(messages, route, model, stream, schema, give_up_on, n), model
+            except give_up_on as e:
+                self.router.record_fallback(route, model, e)
+    
+    async def request_model(self, messages, route, model, stream, schema, give_up_on, n=1):
+        estimated = self.estimate_tokens(messages, model, route.max_tokens * n)
+        params = self.completion_params(messages, stream, schema, route, model, n)
+        
+        async def attempt():
+            await self.rate_limiter.acquire_async(estimated)
+            try:
+                return await self.client.chat.completions.create(**params)
+            except Exception:
+                self.rate_limiter.refund(estimated)
+                raise
+        
+        return await self.retry_policy.call_async(attempt, give_up_on)
+    
+    async def complete_response(self, prompt, system_message, conversation_history=None, bypass_cache=False,
+                                schema=None, task=None, near_duplicates=False):
+        started = time.perf_counter()
+        route = self.route(task)
+        messages = self.build_messages(prompt, system_message, conversation_history)
+        key = self.request_key(system_message, messages, schema, route)
+        similar = self.similar_request(system_message, messages, schema, route, near_duplicates=near_duplicates)
+        cached = self.lookup_cache(key, bypass_cache, similar)
+        if cached is not None:
+            self.record_call(started, "hit", model=route.model)
+            return self.decode_content(cached, schema)[0]
+        cache_status = self.cache_status(bypass_cache)
+        return await self.single_flight.do_async(
+            self.flight_key(key), lambda: self.fetch_response(messages, key, started, cache_status, route, schema, similar))
+    
+    async def fetch_response(self, messages, key, started, cache_status, route, schema=None, similar=None):
+        try:
+            response, model = await self.request_completion(messages, route, schema=schema)
+        except Exception as e:
+            self.record_call(started, cache_status, error=e, model=route.model)
+            raise GenerationError(type(self).__name__, e) from e
+        
+        content = response.choices[0].message.content
+        if response.usage is not None:
+            self.release_unused_tokens(response.usage.completion_tokens, route)
+        result, error = self.decode_content(content, schema)
+        self.record_call(started, cache_status, messages, content, response.usage, error=error, model=model)
+        if error is not None:
+            raise GenerationError(type(self).__name__, error)
+        if self.cache is not None:
+            self.cache.set(key, content, similar)
+        return result
+    
+    async def generate_candidates(self, prompt, system_message, n, conversation_history=None, bypass_cache=False,
+                                  schema=None, task=None, near_duplicates=False):
+        started = time.perf_counter()
+        route = self.route(task)
+        messages = self.build_messages(prompt, system_message, conversation_history)
+        key = self.request_key(system_message, messages, schema, route, n)
+        similar = self.similar_request(system_message, messages, schema, route, n, near_duplicates)
+        cached = self.lookup_cache(key, bypass_cache, similar)
+        if cached is not None:
+            self.record_call(started, "hit", model=route.model)
+            return [self.decode_content(content, schema)[0] for content in json.loads(cached)]
+        cache_status = self.cache_status(bypass_cache)
+        return await self.single_flight.do_async(
+            self.flight_key(key), lambda: self.fetch_candidates(messages, key, started, cache_status, route, n, schema, similar))
+    
+    async def fetch_candidates(self, messages, key, started, cache_status, route, n, schema=None, similar=None):
+        try:
+            if route.supports_n:
+                responses = [await self.request_completion(messages, route, schema=schema, n=n)]
+            else:
+                responses = await asyncio.gather(
+                    *(self.request_completion(messages, route, schema=schema) for _ in range(n)))
+        except Exception as e:
+            self.record_call(started, cache_status, error=e, model=route.model)
+            raise GenerationError(type(self).__name__, e) from e
+        return self.collect_candidates(responses, messages, key, started, cache_status, route, schema, similar)
+    
+    async def stream_response(self, prompt, system_message, conversation_history=None, bypass_cache=False, task=None,
+                              near_duplicates=False):
+        started = time.perf_counter()
+        route = self.route(task)
+        messages = self.build_messages(prompt, system_message, conversation_history)
+        key = self.request_key(system_message, messages, route=route)
+        similar = self.similar_request(system_message, messages, route=route, near_duplicates=near_duplicates)
+        cached = self.lookup_cache(key, bypass_cache, similar)
+        if cached is not None:
+            self.record_call(started, "hit", stream=True, model=route.model)
+            yield cached
+            return
+        cache_status = self.cache_status(bypass_cache)
+        stream = self.single_flight.stream_async(
+            self.flight_key(key), lambda: self.fetch_stream(messages, key, started, cache_status, route, similar))
+        async for chunk in stream:
+            yield chunk
+    
+    async def fetch_stream(self, messages, key, started, cache_status, route, similar=None):
+        chunks = []
+        first_token_at = None
+        response = None
+        try:
+            response, model = await self.request_completion(messages, route, stream=True)
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    chunks.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            if response is not None:
+                # Broken off mid-stream: the part of the reservation not streamed yet is returned
+                self.release_unused_tokens(self.context_budget.count("".join(chunks)), route)
+            self.record_call(started, cache_status, stream=True, first_token_at=first_token_at, error=e,
+                             model=route.model)
+            raise GenerationError(type(self).__name__, e) from e
+        
+        content = "".join(chunks)
+        self.release_unused_tokens(self.context_budget.count(content), route)
+        error = self.decode_content(content)[1]
+        self.record_call(started, cache_status, messages, content, stream=True, first_token_at=first_token_at,
+                         error=error, model=model)
+        if error is not None:
+            raise GenerationError(type(self).__name__, error)
+        if self.cache is not None:
+            self.cache.set(key, content, similar)
+
+class AsyncFilmConceptAgent(AsyncAgentMixin, FilmConceptAgent):
+    pass
+
+class AsyncScriptAgent(AsyncAgentMixin, ScriptAgent):
+    pass
+
+class AsyncCastingAgent(AsyncAgentMixin, CastingAgent):
+    pass
+
+class AsyncLocationAgent(AsyncAgentMixin, LocationAgent):
+    pass
+
+class AsyncProductPlacementAgent(AsyncAgentMixin, ProductPlacementAgent):
+    pass
+
+class AsyncMarketingAgent(AsyncAgentMixin, MarketingAgent):
+    pass
+
+class AsyncFilmAISystem(FilmAISystem):
+    # Inherits the FilmAISystem call surface; every method returns an awaitable
+    def __init__(self, api_key, client=None, cache=None, **agent_options):
+        # agent_options (context_budget, rate_limiter, retry_policy, single_flight, metrics, router) go to every agent
+        self.api_key = api_key
+        self.client = client if client is not None else openai.AsyncOpenAI(api_key=api_key, max_retries=0)
+        self.cache = cache
+        self.context_budget = agent_options.get("context_budget")
+        self.concept_agent = AsyncFilmConceptAgent(api_key, client=self.client, cache=cache, **agent_options)
+        self.script_agent = AsyncScriptAgent(api_key, client=self.client, cache=cache, **agent_options)
+        self.casting_agent = AsyncCastingAgent(api_key, client=self.client, cache=cache, **agent_options)
+        self.location_agent = AsyncLocationAgent(api_key, client=self.client, cache=cache, **agent_options)
+        self.placement_agent = AsyncProductPlacementAgent(api_key, client=self.client, cache=cache, **agent_options)
+        self.marketing_agent = AsyncMarketingAgent(api_key, client=self.client, cache=cache, **agent_options)
+    
+    async def iter_downstream_assets(self, project, user_inputs=None, max_workers=4, **options):
+        tasks = self.downstream_tasks(project, user_inputs)
+        semaphore = asyncio.Semaphore(max(1, max_workers))
+        
+        async def run(key, method, args):
+            async with semaphore:
+                try:
+                    return key, await method(*args, **options), None
+                except GenerationError as e:
+                    return key, None, e
+        
+        for next_result in asyncio.as_completed([run(key, method, args) for key, (method, args) in tasks.items()]):
+            yield await next_result
+    
+    async def generate_downstream_assets(self, project, user_inputs=None, on_result=None, on_error=None,
+                                         max_workers=4, **options):
+        results = {}
+        async for key, value, error in self.iter_downstream_assets(project, user_inputs, max_workers, **options):
+            if error is not None:
+                if on_error:
+                    on_error(key, error)
+                continue
+            results[key] = value
+            if on_result:
+                on_result(key, value)
+        return results
+    
+    async def iter_full_draft(self, script_outline, written_scenes=None, max_workers=4, context_scenes=3, **options):
+        scenes, pending = self.pending_scenes(script_outline, written_scenes)
+        semaphore = asyncio.Semaphore(max(1, max_workers))
+        
+        async def run(index):
+            async with semaphore:
+                scene = scenes[index]
+                try:
+                    text = await self.write_scene(scene["description"], scene["characters"],
+                                                  build_scene_context(scenes, index, context_scenes), **options)
+                except GenerationError as e:
+                    return scene["number"], None, e
+                return scene["number"], text, None
+        
+        for next_result in asyncio.as_completed([run(index) for index in pending]):
+            yield await next_result
+
+class SyncFilmAISystem(SyncFacade):
+    # Blocking facade over AsyncFilmAISystem for the Streamlit handlers; callbacks stay on the calling thread
+    generate_downstream_assets = FilmAISystem.generate_downstream_assets
@@ -1,10 +1,33 @@
 import streamlit as st
-import openai
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import os
 import json
 import time
+import uuid
 from typing import List, Dict, Any, Optional
-import re
+
+from agents import (
+    CONCEPT_CANDIDATES,
+    AsyncFilmAISystem,
+    FilmAISystem,
+    GenerationError,
+    SyncFilmAISystem,
+    build_film_summary,
+    outline_fingerprint,
+    parse_script_outline,
+)
+from llm_clients import ClientRegistry
+from metrics import DEFAULT_METRICS_PORT, default_metrics, start_metrics_server
+from model_routing import default_router
+from conversation_log import ConversationHistory, prune_history_logs
+from jobs import DEFAULT_PROGRESS_INTERVAL, JobWorkers, job_queue_from_env
+from pipeline import Pipeline
+from project_store import TEXT_FIELDS, project_store_from_env
+from response_cache import cache_from_env
+from shared_state import DEFAULT_STATE_BACKEND
+from single_flight import NoFlight, default_single_flight
+from speculation import DEFAULT_SPECULATION, Speculator
+from structured_outputs import CONCEPTS, render_concept
 
 # Configuration and Setup
 st.set_page_config(
@@ -14,6 +37,26 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Payload measurement: counts the bytes of every message a rerun sends to the browser
+def measure_payload():
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    if not hasattr(ctx, "payload_counter"):
+        enqueue = ctx._enqueue
+        
+        def counting_enqueue(msg):
+            ctx.payload_counter["bytes"] += msg.ByteSize()
+            ctx.payload_counter["messages"] += 1
+            enqueue(msg)
+        
+        ctx._enqueue = counting_enqueue
+    # Totals of the previous rerun, including ones cut short by st.experimental_rerun
+    st.session_state.last_payload = st.session_state.get("payload_counter")
+    ctx.payload_counter = st.session_state.payload_counter = {"bytes": 0, "messages": 0}
+
+measure_payload()
+
 # Styling
 st.markdown("""
 <style>
@@ -57,331 +100,254 @@ st.markdown("""
 # Initialize session state variables
 if 'api_key_configured' not in st.session_state:
     st.session_state.api_key_configured = False
-if 'projects' not in st.session_state:
-    st.session_state.projects = []
 if 'current_project' not in st.session_state:
     st.session_state.current_project = None
 if 'current_step' not in st.session_state:
     st.session_state.current_step = "concept"
 if 'conversation_history' not in st.session_state:
-    st.session_state.conversation_history = []
-
-# Agent System - Using OpenAI's GPT models
-class Agent:
-    def __init__(self, api_key, model="gpt-4o", temperature=0.7):
-        self.api_key = api_key
-        self.model = model
-        self.temperature = temperature
-        self.client = openai.OpenAI(api_key=api_key)
-    
-    def generate_response(self, prompt, system_message, conversation_history=None):
-        try:
-            messages = [{"role": "system", "content": system_message}]
-            
-            if conversation_history:
-                messages.extend(conversation_history)
-            
-            messages.append({"role": "user", "content": prompt})
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=self.temperature,
-                max_tokens=4000
-            )
-            
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"Error generating response: {str(e)}"
-
-class FilmConceptAgent(Agent):
-    def __init__(self, api_key, model="gpt-4o"):
-        super().__init__(api_key, model, temperature=0.8)
-        self.system_message = """
-        You are an expert film concept creator with decades of experience in the film industry.
-        Your task is to generate innovative and compelling film concepts based on user inputs.
-        Consider current trends, audience preferences, and provide a range of options that vary in tone, style, and approach.
-        Each concept should include a catchy title, a brief logline, and a short synopsis that outlines the main plot.
-        Your concepts should be marketable, unique, and have strong potential for both critical acclaim and commercial success.
-        """
-    
-    def generate_concepts(self, user_inputs, num_concepts=3):
-        prompt = f"""
-        Generate {num_concepts} distinct film concepts based on the following parameters:
-        
-        Genre: {user_inputs.get('genre', 'Not specified')}
-        Target Rating: {user_inputs.get('rating', 'Not specified')}
-        Key Themes: {user_inputs.get('themes', 'Not specified')}
-        Target Audience: {user_inputs.get('audience', 'Not specified')}
-        Additional Notes: {user_inputs.get('additional_notes', 'None')}
-        
-        For each concept, provide:
-        1. Title
-        2. Logline (one sentence)
-        3. Synopsis (2-3 paragraphs)
-        4. Key selling points (what makes this marketable)
-        5. Potential audience appeal
-        
-        Format each concept clearly and label them as CONCEPT 1, CONCEPT 2, etc.
-        """
-        return self.generate_response(prompt, self.system_message)
-
-class ScriptAgent(Agent):
-    def __init__(self, api_key, model="gpt-4o"):
-        super().__init__(api_key, model, temperature=0.7)
-        self.system_message = """
-        You are an experienced screenwriter with expertise in creating professional-quality film scripts.
-        Your writing adheres to industry-standard screenplay format. 
-        You create compelling dialogue, clear action descriptions, and properly formatted scene headings.
-        Your scripts maintain consistent tone, voice, and pacing appropriate to the genre and project requirements.
-        """
-    
-    def generate_treatment(self, concept, additional_details=None):
-        prompt = f"""
-        Create a detailed film treatment based on the following concept:
-        
-        {concept}
-        
-        Additional details to incorporate: {additional_details if additional_details else 'None provided'}
-        
-        The treatment should include:
-        1. An expanded synopsis (5-7 paragraphs)
-        2. A clear three-act structure
-        3. Major plot points and turning points
-        4. Character development arcs for the main characters
-        5. Thematic elements to be explored
-        
-        This treatment will serve as the foundation for the full script development.
-        """
-        return self.generate_response(prompt, self.system_message)
-    
-    def generate_script_outline(self, treatment, num_scenes=12):
-        prompt = f"""
-        Based on the following treatment, create a detailed script outline with approximately {num_scenes} key scenes:
-        
-        {treatment}
-        
-        For each scene, provide:
-        1. Scene heading (INT/EXT, LOCATION, TIME)
-        2. Brief description of the setting
-        3. Characters present
-        4. Summary of the action (what happens)
-        5. Purpose of the scene in advancing the plot or character development
-        
-        Order the scenes chronologically and ensure they follow a cohesive narrative arc.
-        """
-        return self.generate_response(prompt, self.system_message)
-    
-    def generate_scene(self, scene_description, characters, previous_scenes=None):
-        context = f"Previous scenes: {previous_scenes}\n\n" if previous_scenes else ""
-        
-        prompt = f"""
-        {context}
-        Write a professional screenplay scene based on the following description:
-        
-        Scene description: {scene_description}
-        Characters present: {characters}
-        
-        Use proper screenplay format including:
-        - Scene heading
-        - Action descriptions
-        - Character names
-        - Dialogue
-        - Parentheticals where appropriate
-        - Transitions where appropriate
-        
-        Keep the scene concise but effective, with natural dialogue and clear action descriptions.
-        """
-        return self.generate_response(prompt, self.system_message)
-
-class CastingAgent(Agent):
-    def __init__(self, api_key, model="gpt-4o"):
-        super().__init__(api_key, model, temperature=0.7)
-        self.system_message = """
-        You are an expert casting director with extensive knowledge of actors across Hollywood and international cinema.
-        Your specialty is matching character descriptions with ideal actors who would bring authenticity, star power, and the right qualities to a role.
-        You know actors' past performances, physical characteristics, acting styles, current popularity, and typical casting rates.
-        Make casting suggestions that balance artistic integrity with commercial viability, considering both established stars and promising new talent.
-        """
-    
-    def suggest_cast(self, characters_descriptions, budget_level="medium", exclude_actors=None):
-        exclude_str = ", ".join(exclude_actors) if exclude_actors else "None"
-        
-        prompt = f"""
-        Suggest ideal casting choices for the following characters in a {budget_level}-budget film:
-        
-        {characters_descriptions}
-        
-        Actors to exclude from consideration: {exclude_str}
-        
-        For each character, provide:
-        1. Three potential actors who would excel in the role (prioritize actors who are currently active)
-        2. Brief explanation of why each actor would be suitable
-        3. Notable similar roles they've played that demonstrate their fit
-        4. Any potential scheduling, budget, or casting challenges to consider
-        
-        Provide a mix of established stars and rising talent as appropriate for the budget level.
-        """
-        return self.generate_response(prompt, self.system_message)
-
-class LocationAgent(Agent):
-    def __init__(self, api_key, model="gpt-4o"):
-        super().__init__(api_key, model, temperature=0.6)
-        self.system_message = """
-        You are an experienced film location scout with global expertise in finding perfect filming locations.
-        You understand both the creative aspects (visual style, atmosphere, setting authenticity) and practical considerations (permits, costs, facilities, crew access, weather patterns).
-        You know which countries and regions offer film production incentives and tax benefits.
-        You provide specific, actionable location recommendations that balance creative vision with logistical reality.
-        """
-    
-    def suggest_locations(self, script_elements, budget_level="medium", special_requirements=None):
-        requirements = special_requirements if special_requirements else "None specified"
-        
-        prompt = f"""
-        Recommend optimal filming locations for a {budget_level}-budget film with the following elements:
-        
-        {script_elements}
-        
-        Special requirements: {requirements}
-        
-        For each major setting in the script, suggest:
-        1. Primary location recommendation (specific city/region/country)
-        2. Alternative location options that could work as substitutes
-        3. Key benefits of each location (visual style, authenticity, production incentives)
-        4. Practical considerations (weather seasons, permit requirements, logistical challenges)
-        5. Estimated cost impact (high/medium/low) relative to the budget level
-        
-        Focus on locations that offer the best combination of creative fit, production value, and financial incentives.
-        """
-        return self.generate_response(prompt, self.system_message)
-
-class ProductPlacementAgent(Agent):
-    def __init__(self, api_key, model="gpt-4o"):
-        super().__init__(api_key, model, temperature=0.7)
-        self.system_message = """
-        You are a product placement and brand integration specialist with expertise in seamlessly incorporating brands into film content.
-        You understand how to identify natural placement opportunities that don't feel forced but provide value to brands.
-        You know which brands align with different film genres, character types, and target audiences.
-        You can suggest both obvious and subtle placement opportunities, from featured products to background elements.
-        You understand the financial considerations of different placement types and their potential value.
-        """
-    
-    def suggest_placements(self, script_elements, target_audience, genre):
-        prompt = f"""
-        Identify natural product placement opportunities for a film with the following elements:
-        
-        Script elements: {script_elements}
-        Target audience: {target_audience}
-        Genre: {genre}
-        
-        For each placement opportunity, provide:
-        1. The scene or context where the placement would occur
-        2. Specific brands that would be ideal fits (suggest 2-3 options per opportunity)
-        3. How the product would be integrated (background, mentioned in dialogue, actively used by character, etc.)
-        4. Why this placement feels natural rather than forced
-        5. The potential value tier of the placement (high/medium/low)
-        
-        Suggest at least 5 different placement opportunities across various categories (e.g., technology, food/beverage, automotive, fashion, etc.).
-        Focus on placements that would feel authentic to the story and characters.
-        """
-        return self.generate_response(prompt, self.system_message)
-
-class MarketingAgent(Agent):
-    def __init__(self, api_key, model="gpt-4o"):
-        super().__init__(api_key, model, temperature=0.8)
-        self.system_message = """
-        You are an expert film marketing strategist who specializes in creating compelling promotional materials and strategies.
-        You know how to position films to appeal to their target audiences while highlighting their unique selling points.
-        You understand both traditional marketing channels and digital/social media strategies.
-        You can create taglines, poster concepts, and trailer strategies that capture the essence of a film.
-        Your goal is to maximize audience interest and box office potential through effective marketing.
-        """
-    
-    def generate_marketing_assets(self, film_details, target_audience):
-        prompt = f"""
-        Create key marketing assets for the following film:
-        
-        Film details: {film_details}
-        Target audience: {target_audience}
-        
-        Provide:
-        
-        1. Three potential taglines that capture the film's essence
-        2. A detailed poster concept description (visual elements, style, composition)
-        3. A trailer strategy (what scenes/moments to highlight, tone, music suggestions)
-        4. Three key selling points to emphasize in marketing materials
-        5. Social media strategy (platform focus, content types, hashtag suggestions)
-        
-        Ensure all elements align with the target audience preferences and highlight what makes this film unique and appealing.
-        """
-        return self.generate_response(prompt, self.system_message)
+    # Capped in memory; older outputs spill to a per-session log on disk
+    prune_history_logs()
+    ctx = get_script_run_ctx()
+    st.session_state.conversation_history = ConversationHistory(ctx.session_id if ctx else uuid.uuid4().hex)
 
-# Multi-Agent System Coordinator
-class FilmAISystem:
-    def __init__(self, api_key):
-        self.api_key = api_key
-        self.concept_agent = FilmConceptAgent(api_key)
-        self.script_agent = ScriptAgent(api_key)
-        self.casting_agent = CastingAgent(api_key)
-        self.location_agent = LocationAgent(api_key)
-        self.placement_agent = ProductPlacementAgent(api_key)
-        self.marketing_agent = MarketingAgent(api_key)
-    
-    def generate_film_concept(self, user_inputs):
-        return self.concept_agent.generate_concepts(user_inputs)
-    
-    def develop_treatment(self, concept, additional_details=None):
-        return self.script_agent.generate_treatment(concept, additional_details)
-    
-    def create_script_outline(self, treatment):
-        return self.script_agent.generate_script_outline(treatment)
-    
-    def write_scene(self, scene_description, characters, previous_scenes=None):
-        return self.script_agent.generate_scene(scene_description, characters, previous_scenes)
-    
-    def suggest_cast(self, character_descriptions, budget_level="medium"):
-        return self.casting_agent.suggest_cast(character_descriptions, budget_level)
-    
-    def suggest_locations(self, script_elements, budget_level="medium", special_requirements=None):
-        return self.location_agent.suggest_locations(script_elements, budget_level, special_requirements)
-    
-    def suggest_product_placements(self, script_elements, target_audience, genre):
-        return self.placement_agent.suggest_placements(script_elements, target_audience, genre)
-    
-    def create_marketing_assets(self, film_details, target_audience):
-        return self.marketing_agent.generate_marketing_assets(film_details, target_audience)
+# Shared OpenAI clients survive reruns and sessions; one pool per API key
+@st.cache_resource
+def get_client_registry():
+    return ClientRegistry()
+
+@st.cache_resource
+def get_response_cache():
+    return cache_from_env()
+
+@st.cache_resource
+def get_metrics_server():
+    # Serves /metrics for Prometheus once per process when VADIS_METRICS_PORT is set
+    if DEFAULT_METRICS_PORT:
+        return start_metrics_server(default_metrics)
+    return None
+
+def make_film_ai_system(api_key):
+    registry = get_client_registry()
+    if os.environ.get("VADIS_ASYNC_AGENTS") == "1":
+        # Generations run on the shared event loop instead of each holding an HTTP call on its own thread
+        system = AsyncFilmAISystem(api_key, client=registry.get_async(api_key), cache=get_response_cache())
+        return SyncFilmAISystem(system)
+    return FilmAISystem(api_key, client=registry.get(api_key), cache=get_response_cache())
+
+def get_film_ai_system():
+    return make_film_ai_system(st.session_state.api_key)
 
 # Project Management Functions
+@st.cache_resource
+def get_project_store():
+    # Shared by every replica (VADIS_STATE_BACKEND), with a read-through copy in this process
+    return project_store_from_env()
+
 def create_new_project(title, genre, concept):
-    project = {
-        "id": len(st.session_state.projects) + 1,
-        "title": title,
-        "genre": genre,
-        "concept": concept,
-        "treatment": None,
-        "script_outline": None,
-        "cast_suggestions": None,
-        "location_suggestions": None,
-        "product_placements": None,
-        "marketing_assets": None,
-        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-        "updated_at": time.strftime("%Y-%m-%d %H:%M:%S")
-    }
-    st.session_state.projects.append(project)
-    return project
+    return get_project_store().create(title, genre, concept)
 
 def update_project(project_id, key, value):
-    for project in st.session_state.projects:
-        if project["id"] == project_id:
-            project[key] = value
-            project["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
-            break
+    updated_at = get_project_store().update(project_id, key, value)
+    # Keep the open project in step with the store without re-reading every column
+    project = st.session_state.current_project
+    if project and project["id"] == project_id:
+        project[key] = value
+        project["updated_at"] = updated_at
 
 def get_project(project_id):
-    for project in st.session_state.projects:
-        if project["id"] == project_id:
-            return project
-    return None
+    return get_project_store().get(project_id)
+
+# Stage graph used to track which inputs each artifact was generated from
+PIPELINE = Pipeline()
+
+def track_artifacts(project):
+    # Artifacts saved before inputs were tracked are pinned to their current inputs, so the
+    # next upstream change marks them stale
+    artifact_inputs = dict(project.get("artifact_inputs") or {})
+    artifact_inputs.update(PIPELINE.untracked_inputs(project, artifact_inputs))
+    return artifact_inputs
+
+def save_artifact(project, node_name, outputs, **params):
+    # The input records are merged into the stored project, so records written meanwhile by a job on
+    # another replica are kept
+    record = None
+    if node_name is not None:
+        node = PIPELINE.nodes[node_name]
+        record = node.record(node.values(project, params))
+    
+    def merge_inputs(stored):
+        artifact_inputs = track_artifacts(stored)
+        if record is not None:
+            artifact_inputs[node_name] = record
+        return artifact_inputs
+    
+    get_project_store().save_artifact(project["id"], outputs, merge_inputs)
+    current = st.session_state.current_project
+    if current and current["id"] == project["id"]:
+        st.session_state.current_project = get_project(project["id"])
+
+# Derived Views
+# Cached per artifact version or per text, so reruns reuse them instead of recomputing from
+# every artifact; arguments starting with "_" are left out of the cache key
+def project_version(project):
+    # Changes whenever an artifact or an input record changes; str hashes are cached on the objects
+    artifact_inputs = project.get("artifact_inputs") or {}
+    return (
+        project["id"],
+        tuple(hash(project.get(field)) for field in TEXT_FIELDS),
+        tuple(sorted((name, record["fingerprint"]) for name, record in artifact_inputs.items())),
+    )
+
+@st.cache_data(max_entries=256)
+def excerpt(text, limit=500):
+    return text[:limit] + "..."
+
+@st.cache_data(max_entries=64)
+def render_concepts_markdown(concepts):
+    return CONCEPTS.render({"concepts": concepts})
+
+@st.cache_data(max_entries=64)
+def project_progress(version, _project):
+    # (completion percentage, (label, step) of the next page to visit or None)
+    completed_elements = sum(1 for key in ['concept', 'treatment', 'script_outline',
+                                         'cast_suggestions', 'location_suggestions',
+                                         'product_placements', 'marketing_assets']
+                          if _project[key])
+    next_steps = [
+        ("treatment", "Treatment", "treatment"),
+        ("script_outline", "Script Outline", "script_outline"),
+        ("cast_suggestions", "Casting", "casting"),
+        ("location_suggestions", "Locations", "locations"),
+        ("product_placements", "Product Placements", "product_placements"),
+        ("marketing_assets", "Marketing", "marketing"),
+    ]
+    next_step = next(((label, step) for key, label, step in next_steps if not _project[key]), None)
+    return (completed_elements / 7) * 100, next_step
+
+@st.cache_data(max_entries=64)
+def stale_artifacts(version, _project):
+    return [name for name in PIPELINE.stale_nodes(_project, _project.get("artifact_inputs"))
+            if all(_project.get(output) for output in PIPELINE.nodes[name].outputs)]
+
+def lazy_section(label, key):
+    # Unlike st.expander, whose content is sent to the browser even while collapsed, nothing
+    # is rendered until the toggle is switched on
+    return st.toggle(label, key=key)
+
+# Background Jobs
+@st.cache_resource
+def get_job_workers():
+    # One pool per process; jobs keep running when the session that submitted them goes away
+    return JobWorkers(job_queue_from_env(), get_project_store(), make_film_ai_system,
+                      default_api_key=os.environ.get("OPENAI_API_KEY"), speculator=get_speculator()).start()
+
+def submit_job(project, kind, agent_type=None, **params):
+    # The workers save results to the project store even if this session has gone away; this
+    # session adds them to its conversation history if it is still around when they finish
+    job_id = get_job_workers().submit(kind, project["id"], params, st.session_state.api_key)
+    st.session_state.setdefault("submitted_jobs", {})[job_id] = agent_type
+    return job_id
+
+def job_label(job):
+    return (job["params"].get("node") or job["kind"]).replace("_", " ").title()
+
+def active_job_nodes(project):
+    return {job["params"].get("node") or job["kind"] for job in get_job_workers().queue.active(project["id"])}
+
+def submit_artifact(project, node_name, agent_type, **params):
+    if not speculation_enabled():
+        return submit_job(project, "artifact", agent_type, node=node_name, params=params)
+    # A speculation of this session for exactly this request is left for the job to take; the others have lost
+    get_speculator().cancel(speculation_session(), keep={speculation_key(node_name, project, **params)})
+    return submit_job(project, "artifact", agent_type, node=node_name, params=params, session=speculation_session())
+
+# Speculative Pre-generation
+@st.cache_resource
+def get_speculator():
+    return Speculator()
+
+def speculation_enabled():
+    return st.session_state.get("speculation_enabled", DEFAULT_SPECULATION)
+
+def speculation_session():
+    return st.session_state.conversation_history.session_id
+
+def speculation_key(node_name, state, **params):
+    # The input fingerprint a job for node_name would record, so a matching speculation is found
+    node = PIPELINE.nodes[node_name]
+    return node.record(node.values(state, params))["fingerprint"]
+
+def speculate(node_name, state, **params):
+    # Starts the generation a job for node_name would make with these params, before it is asked for
+    node = PIPELINE.nodes[node_name]
+    values = node.values(state, params)
+    api_key = st.session_state.api_key
+    # NoFlight: cancelling a speculation closes its own HTTP stream instead of one shared with other callers
+    system = FilmAISystem(api_key, client=get_client_registry().get(api_key), cache=get_response_cache(),
+                          single_flight=NoFlight())
+    return get_speculator().speculate(speculation_session(), node.record(values)["fingerprint"],
+                                      lambda on_delta: node.run(system, values, on_delta=on_delta))
+
+def display_project_jobs(project):
+    # Returns a placeholder per job in flight, which follow_job_progress keeps feeding
+    workers = get_job_workers()
+    active = workers.queue.active(project["id"])
+    placeholders = {}
+    for job in active:
+        with st.status(f"{job_label(job)}: {job['status']}...", expanded=job["status"] == "running"):
+            placeholders[job["id"]] = st.empty()
+            if job["progress"]:
+                placeholders[job["id"]].markdown(job["progress"])
+    
+    submitted = st.session_state.get("submitted_jobs", {})
+    finished = False
+    for job_id, agent_type in list(submitted.items()):
+        job = workers.queue.get(job_id)
+        if job is None or job["status"] in ("queued", "running"):
+            continue
+        del submitted[job_id]
+        finished = True
+        # The job may have run on another replica, so this process's copy of the project is out of date
+        get_project_store().invalidate(project["id"])
+        if job["status"] == "failed":
+            st.error(f"{job_label(job)} failed: {job['error']}")
+            continue
+        if job["kind"] == "artifact":
+            contents = list(job["result"].values())
+        elif job["kind"] == "script_draft":
+            contents = [get_project(project["id"])["script_draft"]]
+        else:
+            contents = []
+        for content in contents:
+            st.session_state.conversation_history.append({
+                "role": "agent",
+                "content": content,
+                "agent_type": agent_type
+            }, project_id=project["id"])
+        if job["params"].get("node") == "treatment" and speculation_enabled():
+            # The outline is the likely next request; 12 scenes is the outline page's default
+            speculate("script_outline", get_project(project["id"]), num_scenes=12)
+    
+    if finished or active:
+        # Artifacts are written by the workers; re-read the project so the page shows them
+        st.session_state.current_project = get_project(project["id"])
+    return placeholders
+
+def follow_job_progress(placeholders, interval=DEFAULT_PROGRESS_INTERVAL, max_wait=30):
+    # Renders streamed text as the workers write it, until a job finishes (or max_wait passes, to
+    # pick up jobs queued meanwhile); the caller then reruns the page to show the saved artifacts
+    queue = get_job_workers().queue
+    shown = {}
+    deadline = time.monotonic() + max_wait
+    while time.monotonic() < deadline:
+        for job_id, placeholder in placeholders.items():
+            job = queue.get(job_id)
+            if job is None or job["status"] not in ("queued", "running"):
+                return
+            if job["progress"] and job["progress"] != shown.get(job_id):
+                placeholder.markdown(job["progress"])
+                shown[job_id] = job["progress"]
+        time.sleep(interval)
 
 # UI Components
 def display_header():
@@ -398,6 +364,7 @@ def display_api_key_input():
         api_key = st.text_input("Enter OpenAI API Key", type="password")
         if st.button("Save API Key"):
             if api_key.startswith("sk-") and len(api_key) > 20:
+                get_client_registry().rotate(st.session_state.get("api_key"), api_key)
                 st.session_state.api_key = api_key
                 st.session_state.api_key_configured = True
                 st.success("API Key configured successfully!")
@@ -407,13 +374,18 @@ def display_api_key_input():
 def display_project_selector():
     with st.sidebar:
         st.header("Projects")
-        if len(st.session_state.projects) > 0:
-            project_titles = [f"{p['id']}: {p['title']}" for p in st.session_state.projects]
+        projects = get_project_store().list_summaries()
+        if len(projects) > 0:
+            project_titles = [f"{p['id']}: {p['title']}" for p in projects]
             selected_project = st.selectbox("Select Project", ["Create New Project"] + project_titles)
             
             if selected_project != "Create New Project":
                 project_id = int(selected_project.split(":")[0])
-                st.session_state.current_project = get_project(project_id)
+                summary = next(p for p in projects if p["id"] == project_id)
+                current = st.session_state.current_project
+                # Full artifacts are read only when the selection changes or the project was updated elsewhere
+                if not current or current["id"] != project_id or current["updated_at"] != summary["updated_at"]:
+                    st.session_state.current_project = get_project(project_id)
                 if st.button("View Selected Project"):
                     st.session_state.current_step = "overview"
         
@@ -421,6 +393,35 @@ def display_project_selector():
             st.session_state.current_project = None
             st.session_state.current_step = "concept"
 
+def display_connection_metrics():
+    with st.sidebar:
+        stats = get_client_registry().stats(st.session_state.api_key)
+        st.metric("HTTP Connection Reuse", f"{stats['reuse_ratio'] * 100:.0f}%",
+                  help=f"{stats['reused_requests']} of {stats['requests']} API requests reused an open connection")
+        cache_stats = get_response_cache().stats()
+        st.metric("Response Cache Hit Rate", f"{cache_stats['hit_rate'] * 100:.0f}%",
+                  help=f"{cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                       f"{cache_stats['bypasses']} regenerations, {cache_stats['entries']} entries, "
+                       f"{cache_stats['evictions']} evictions, {cache_stats['semantic_hits']} near-duplicate hits")
+        flight_stats = default_single_flight.stats()
+        st.metric("Coalesced Requests", flight_stats["coalesced"],
+                  help=f"Identical generations that joined one of {flight_stats['leaders']} in-flight calls "
+                       "instead of starting their own")
+        history_stats = st.session_state.conversation_history.stats()
+        st.metric("Session History Memory", f"{history_stats['memory_bytes'] / 1024:.1f} KB",
+                  help=f"{history_stats['in_memory']} of {history_stats['entries']} agent outputs held in memory, "
+                       f"{history_stats['spilled']} spilled to disk ({history_stats['disk_bytes'] / 1024:.1f} KB)")
+        payload = st.session_state.get("last_payload")
+        if payload:
+            st.metric("Last Rerun Payload", f"{payload['bytes'] / 1024:.1f} KB",
+                      help=f"{payload['messages']} messages sent to the browser by the previous rerun")
+        if not st.toggle("Speculative Pre-generation", value=DEFAULT_SPECULATION, key="speculation_enabled",
+                         help="Start writing the treatment of each generated concept, and the outline once a "
+                              "treatment exists, before they are requested"):
+            get_speculator().cancel(speculation_session())
+        if st.button("Admin Panel"):
+            st.session_state.current_step = "admin"
+
 def display_project_concept_creator():
     st.header("Create New Film Project")
     
@@ -457,52 +458,53 @@ def display_project_concept_creator():
                 st.error("Please configure your OpenAI API key first.")
                 return
             
-            system = FilmAISystem(st.session_state.api_key)
-            concepts = system.generate_film_concept(user_inputs)
+            system = get_film_ai_system()
+            # Clicking again with unchanged inputs means "regenerate", so skip the cached answer
+            regenerate = st.session_state.get("generated_concepts_inputs") == user_inputs
+            try:
+                # Concepts come back as JSON records, so selecting one needs no text parsing. In candidate
+                # mode each concept is its own completion choice of a single request
+                if CONCEPT_CANDIDATES:
+                    concepts = {"concepts": system.generate_film_concept(user_inputs, structured=True, candidates=True,
+                                                                         bypass_cache=regenerate)}
+                else:
+                    concepts = system.generate_film_concept(user_inputs, structured=True, bypass_cache=regenerate)
+            except GenerationError as e:
+                st.error(f"Generation failed, nothing was saved: {e}")
+                return
             
-            st.session_state.generated_concepts = concepts
+            st.session_state.generated_concepts = concepts["concepts"]
+            st.session_state.generated_concepts_inputs = user_inputs
+            if speculation_enabled():
+                # Treatments of the previous concepts will not be asked for any more
+                get_speculator().cancel(speculation_session())
+                for concept in concepts["concepts"]:
+                    speculate("treatment", {"concept": render_concept(concept)}, treatment_notes="")
             st.session_state.conversation_history.append({
                 "role": "agent",
-                "content": concepts,
+                "content": CONCEPTS.render(concepts),
                 "agent_type": "concept_agent"
             })
     
-    if 'generated_concepts' in st.session_state:
+    if st.session_state.get('generated_concepts'):
+        concepts = st.session_state.generated_concepts
         st.subheader("Generated Concepts")
-        st.markdown(st.session_state.generated_concepts)
+        st.markdown(render_concepts_markdown(concepts))
         
-        # Extract concept titles using regex
-        concept_pattern = r"CONCEPT \d+:?\s*([^\n]+)"
-        concept_titles = re.findall(concept_pattern, st.session_state.generated_concepts)
+        selected_index = st.selectbox("Select a concept to develop", range(len(concepts)),
+                                      format_func=lambda index: concepts[index]["title"])
         
-        if concept_titles:
-            selected_concept = st.selectbox("Select a concept to develop", concept_titles)
-            
-            if st.button("Develop Selected Concept"):
-                # Find the full concept text
-                selected_index = concept_titles.index(selected_concept)
-                concept_start_pattern = f"CONCEPT {selected_index+1}"
-                
-                concept_starts = [m.start() for m in re.finditer(f"CONCEPT {selected_index+1}", st.session_state.generated_concepts)]
-                if concept_starts:
-                    start_pos = concept_starts[0]
-                    
-                    # Find the start of the next concept or use the end of string
-                    next_concept_pattern = f"CONCEPT {selected_index+2}"
-                    next_starts = [m.start() for m in re.finditer(next_concept_pattern, st.session_state.generated_concepts)]
-                    
-                    if next_starts:
-                        end_pos = next_starts[0]
-                    else:
-                        end_pos = len(st.session_state.generated_concepts)
-                    
-                    full_concept = st.session_state.generated_concepts[start_pos:end_pos].strip()
-                    
-                    # Create new project
-                    new_project = create_new_project(selected_concept, genre, full_concept)
-                    st.session_state.current_project = new_project
-                    st.session_state.current_step = "treatment"
-                    st.experimental_rerun()
+        if st.button("Develop Selected Concept"):
+            selected_concept = concepts[selected_index]
+            new_project = create_new_project(selected_concept["title"], genre, render_concept(selected_concept))
+            st.session_state.current_project = new_project
+            save_artifact(new_project, "concept", {}, concept_index=selected_index,
+                          **st.session_state.generated_concepts_inputs)
+            if speculation_enabled():
+                get_speculator().cancel(speculation_session(),
+                                        keep={speculation_key("treatment", new_project, treatment_notes="")})
+            st.session_state.current_step = "treatment"
+            st.experimental_rerun()
 
 def display_project_treatment_developer():
     project = st.session_state.current_project
@@ -527,28 +529,26 @@ def display_project_treatment_developer():
         st.markdown("- Character arcs")
         st.markdown("- Thematic elements")
     
-    if st.button("Generate Treatment"):
-        with st.spinner("Developing treatment..."):
-            if not hasattr(st.session_state, 'api_key'):
-                st.error("Please configure your OpenAI API key first.")
-                return
-            
-            system = FilmAISystem(st.session_state.api_key)
-            treatment = system.develop_treatment(project["concept"], additional_details)
-            
-            update_project(project["id"], "treatment", treatment)
-            st.session_state.conversation_history.append({
-                "role": "agent",
-                "content": treatment,
-                "agent_type": "script_agent"
-            })
-            
-            st.experimental_rerun()
+    if st.button("Generate Treatment", disabled="treatment" in active_job_nodes(project)):
+        if not hasattr(st.session_state, 'api_key'):
+            st.error("Please configure your OpenAI API key first.")
+            return
+        
+        submit_artifact(project, "treatment", "script_agent", treatment_notes=additional_details)
+        st.experimental_rerun()
     
     if project["treatment"]:
         st.subheader("Generated Treatment")
         st.markdown(project["treatment"])
         
+        if lazy_section("Edit Treatment", "edit_treatment"):
+            edited_treatment = st.text_area("Treatment", project["treatment"], height=300,
+                                            key=f"edit_treatment_{project['id']}")
+            if st.button("Save Treatment") and edited_treatment != project["treatment"]:
+                # The treatment keeps its input record, so only the artifacts built from it go stale
+                save_artifact(project, None, {"treatment": edited_treatment})
+                st.experimental_rerun()
+        
         if st.button("Proceed to Script Outline"):
             st.session_state.current_step = "script_outline"
             st.experimental_rerun()
@@ -567,8 +567,8 @@ def display_script_outline_developer():
     
     st.subheader("Treatment Summary")
     # Show just the first 500 characters of the treatment
-    st.markdown(project["treatment"][:500] + "...")
-    with st.expander("View Full Treatment"):
+    st.markdown(excerpt(project["treatment"]))
+    if lazy_section("View Full Treatment", "show_full_treatment"):
         st.markdown(project["treatment"])
     
     col1, col2 = st.columns(2)
@@ -584,23 +584,13 @@ def display_script_outline_developer():
         st.markdown("- Action summaries")
         st.markdown("- Narrative purpose of each scene")
     
-    if st.button("Generate Script Outline"):
-        with st.spinner("Developing script outline..."):
-            if not hasattr(st.session_state, 'api_key'):
-                st.error("Please configure your OpenAI API key first.")
-                return
-            
-            system = FilmAISystem(st.session_state.api_key)
-            script_outline = system.create_script_outline(project["treatment"], num_scenes)
-            
-            update_project(project["id"], "script_outline", script_outline)
-            st.session_state.conversation_history.append({
-                "role": "agent",
-                "content": script_outline,
-                "agent_type": "script_agent"
-            })
-            
-            st.experimental_rerun()
+    if st.button("Generate Script Outline", disabled="script_outline" in active_job_nodes(project)):
+        if not hasattr(st.session_state, 'api_key'):
+            st.error("Please configure your OpenAI API key first.")
+            return
+        
+        submit_artifact(project, "script_outline", "script_agent", num_scenes=num_scenes)
+        st.experimental_rerun()
     
     if project["script_outline"]:
         st.subheader("Generated Script Outline")
@@ -609,6 +599,74 @@ def display_script_outline_developer():
         if st.button("Proceed to Casting"):
             st.session_state.current_step = "casting"
             st.experimental_rerun()
+        
+        display_downstream_assets_generator(project)
+        display_script_draft_writer(project)
+
+def display_downstream_assets_generator(project):
+    st.subheader("Generate All Downstream Assets")
+    st.markdown("Develop casting, locations, product placements and marketing in one go from the script outline.")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        budget_options = ["Low", "Medium", "High", "Blockbuster"]
+        budget_level = st.selectbox("Budget Level", budget_options, key="downstream_budget_level")
+    
+    with col2:
+        target_audience = st.text_input("Target Audience", 
+                                     placeholder="e.g., 18-35 male, family, etc.",
+                                     key="downstream_target_audience")
+    
+    agent_types = {
+        "cast_suggestions": "casting_agent",
+        "location_suggestions": "location_agent",
+        "product_placements": "placement_agent",
+        "marketing_assets": "marketing_agent",
+    }
+    busy = bool(set(agent_types) & active_job_nodes(project))
+    if st.button("Generate All Downstream Assets", disabled=busy):
+        if not hasattr(st.session_state, 'api_key'):
+            st.error("Please configure your OpenAI API key first.")
+            return
+        
+        # One job per asset, so the workers develop them in parallel and each is saved as it finishes
+        for key, agent_type in agent_types.items():
+            submit_artifact(project, key, agent_type, budget_level=budget_level.lower(),
+                            target_audience=target_audience)
+        st.session_state.current_step = "overview"
+        st.experimental_rerun()
+
+def display_script_draft_writer(project):
+    st.subheader("Full Screenplay Draft")
+    
+    scenes = parse_script_outline(project["script_outline"])
+    if not scenes:
+        st.info("No individual scenes could be identified in the script outline.")
+        return
+    
+    # Scenes written for an older version of the outline are discarded
+    outline_hash = outline_fingerprint(project["script_outline"])
+    draft_state = project.get("script_scenes") or {}
+    written_scenes = dict(draft_state.get("scenes", {})) if draft_state.get("outline_hash") == outline_hash else {}
+    
+    st.markdown(f"{len(written_scenes)} of {len(scenes)} scenes written.")
+    max_parallel = st.slider("Scenes Written in Parallel", min_value=1, max_value=8, value=4)
+    
+    button_label = "Resume Full Draft" if written_scenes else "Write Full Draft"
+    if len(written_scenes) < len(scenes) and st.button(button_label,
+                                                       disabled="script_draft" in active_job_nodes(project)):
+        if not hasattr(st.session_state, 'api_key'):
+            st.error("Please configure your OpenAI API key first.")
+            return
+        
+        # Each finished scene is saved immediately; failed scenes stay unwritten so resuming retries just those
+        submit_job(project, "script_draft", "script_agent", max_workers=max_parallel)
+        st.experimental_rerun()
+    
+    if project.get("script_draft"):
+        if lazy_section("View Full Draft", "show_full_draft"):
+            st.markdown(project["script_draft"])
 
 def display_casting_developer():
     project = st.session_state.current_project
@@ -638,25 +696,15 @@ def display_casting_developer():
         excluded_actors = st.text_input("Actors to Exclude", 
                                       placeholder="List any actors to exclude, separated by commas")
     
-    if st.button("Generate Casting Suggestions"):
-        with st.spinner("Developing casting suggestions..."):
-            if not hasattr(st.session_state, 'api_key'):
-                st.error("Please configure your OpenAI API key first.")
-                return
-            
-            system = FilmAISystem(st.session_state.api_key)
-            
-            exclude_list = [actor.strip() for actor in excluded_actors.split(",")] if excluded_actors else None
-            casting = system.suggest_cast(character_descriptions, budget_level.lower(), exclude_list)
-            
-            update_project(project["id"], "cast_suggestions", casting)
-            st.session_state.conversation_history.append({
-                "role": "agent",
-                "content": casting,
-                "agent_type": "casting_agent"
-            })
-            
-            st.experimental_rerun()
+    if st.button("Generate Casting Suggestions", disabled="cast_suggestions" in active_job_nodes(project)):
+        if not hasattr(st.session_state, 'api_key'):
+            st.error("Please configure your OpenAI API key first.")
+            return
+        
+        exclude_list = [actor.strip() for actor in excluded_actors.split(",")] if excluded_actors else None
+        submit_artifact(project, "cast_suggestions", "casting_agent", character_descriptions=character_descriptions,
+                        budget_level=budget_level.lower(), exclude_actors=exclude_list)
+        st.experimental_rerun()
     
     if project["cast_suggestions"]:
         st.subheader("Generated Casting Suggestions")
@@ -694,23 +742,14 @@ def display_locations_developer():
         special_requirements = st.text_input("Special Requirements", 
                                           placeholder="Any specific needs, e.g., snow, desert, accessibility")
     
-    if st.button("Generate Location Suggestions"):
-        with st.spinner("Developing location suggestions..."):
-            if not hasattr(st.session_state, 'api_key'):
-                st.error("Please configure your OpenAI API key first.")
-                return
-            
-            system = FilmAISystem(st.session_state.api_key)
-            locations = system.suggest_locations(script_elements, budget_level.lower(), special_requirements)
-            
-            update_project(project["id"], "location_suggestions", locations)
-            st.session_state.conversation_history.append({
-                "role": "agent",
-                "content": locations,
-                "agent_type": "location_agent"
-            })
-            
-            st.experimental_rerun()
+    if st.button("Generate Location Suggestions", disabled="location_suggestions" in active_job_nodes(project)):
+        if not hasattr(st.session_state, 'api_key'):
+            st.error("Please configure your OpenAI API key first.")
+            return
+        
+        submit_artifact(project, "location_suggestions", "location_agent", script_elements=script_elements,
+                        budget_level=budget_level.lower(), special_requirements=special_requirements)
+        st.experimental_rerun()
     
     if project["location_suggestions"]:
         st.subheader("Generated Location Suggestions")
@@ -751,23 +790,14 @@ def display_product_placements_developer():
         ]
         genre = st.selectbox("Film Genre", genre_options)
     
-    if st.button("Generate Product Placement Opportunities"):
-        with st.spinner("Identifying product placement opportunities..."):
-            if not hasattr(st.session_state, 'api_key'):
-                st.error("Please configure your OpenAI API key first.")
-                return
-            
-            system = FilmAISystem(st.session_state.api_key)
-            placements = system.suggest_product_placements(script_elements, target_audience, genre)
-            
-            update_project(project["id"], "product_placements", placements)
-            st.session_state.conversation_history.append({
-                "role": "agent",
-                "content": placements,
-                "agent_type": "placement_agent"
-            })
-            
-            st.experimental_rerun()
+    if st.button("Generate Product Placement Opportunities", disabled="product_placements" in active_job_nodes(project)):
+        if not hasattr(st.session_state, 'api_key'):
+            st.error("Please configure your OpenAI API key first.")
+            return
+        
+        submit_artifact(project, "product_placements", "placement_agent", script_elements=script_elements,
+                        target_audience=target_audience, genre=genre)
+        st.experimental_rerun()
     
     if project["product_placements"]:
         st.subheader("Generated Product Placement Opportunities")
@@ -792,32 +822,20 @@ def display_marketing_developer():
     st.subheader("Marketing Strategy Development")
     
     # Compile film details from the project
-    film_summary = f"""Title: {project['title']}
-Genre: {project['genre']}
-Concept: {project['concept'][:500]}..."""
+    film_summary = build_film_summary(project)
 
     st.text_area("Film Summary", film_summary, height=150, disabled=True)
     
     target_audience = st.text_input("Target Audience", 
                                  placeholder="e.g., 18-35 male, family, etc.")
     
-    if st.button("Generate Marketing Assets"):
-        with st.spinner("Developing marketing assets..."):
-            if not hasattr(st.session_state, 'api_key'):
-                st.error("Please configure your OpenAI API key first.")
-                return
-            
-            system = FilmAISystem(st.session_state.api_key)
-            marketing = system.create_marketing_assets(film_summary, target_audience)
-            
-            update_project(project["id"], "marketing_assets", marketing)
-            st.session_state.conversation_history.append({
-                "role": "agent",
-                "content": marketing,
-                "agent_type": "marketing_agent"
-            })
-            
-            st.experimental_rerun()
+    if st.button("Generate Marketing Assets", disabled="marketing_assets" in active_job_nodes(project)):
+        if not hasattr(st.session_state, 'api_key'):
+            st.error("Please configure your OpenAI API key first.")
+            return
+        
+        submit_artifact(project, "marketing_assets", "marketing_agent", target_audience=target_audience)
+        st.experimental_rerun()
     
     if project["marketing_assets"]:
         st.subheader("Generated Marketing Assets")
@@ -827,14 +845,50 @@ Concept: {project['concept'][:500]}..."""
             st.session_state.current_step = "overview"
             st.experimental_rerun()
 
+def display_stale_artifacts(project):
+    # Generated artifacts whose inputs changed since they were made (e.g. after editing the treatment)
+    stale = stale_artifacts(project_version(project), project)
+    if not stale:
+        return
+    
+    st.subheader("Out of Date")
+    st.markdown("\n".join(f"- {name.replace('_', ' ').title()}" for name in stale))
+    
+    if st.button("Update Stale Only", disabled="update_stale" in active_job_nodes(project)):
+        if not hasattr(st.session_state, 'api_key'):
+            st.error("Please configure your OpenAI API key first.")
+            return
+        
+        # Fresh artifacts are skipped, so unchanged stages make no API call
+        submit_job(project, "update_stale", targets=stale)
+        st.experimental_rerun()
+
+# Overview sections: (label, artifact key, placeholder when missing, button label, page to open)
+OVERVIEW_SECTIONS = [
+    ("Treatment", "treatment", "Treatment not yet generated", "Generate Treatment", "treatment"),
+    ("Script Outline", "script_outline", "Script outline not yet generated", "Generate Script Outline",
+     "script_outline"),
+    ("Script Draft", "script_draft", "Script draft not yet written", "Write Script Draft", "script_outline"),
+    ("Cast Suggestions", "cast_suggestions", "Cast suggestions not yet generated", "Generate Cast Suggestions",
+     "casting"),
+    ("Location Suggestions", "location_suggestions", "Location suggestions not yet generated",
+     "Generate Location Suggestions", "locations"),
+    ("Product Placement Opportunities", "product_placements", "Product placement opportunities not yet generated",
+     "Generate Product Placement Opportunities", "product_placements"),
+    ("Marketing Assets", "marketing_assets", "Marketing assets not yet generated", "Generate Marketing Assets",
+     "marketing"),
+]
+
 def display_project_overview():
     project = st.session_state.current_project
     
     st.header(f"Project Overview: {project['title']}")
     
-    tabs = st.tabs(["Summary", "Treatment", "Script Outline", "Cast", "Locations", "Product Placements", "Marketing"])
+    # Only the selected section is rendered; st.tabs would send every artifact on every rerun
+    labels = ["Summary"] + [section[0] for section in OVERVIEW_SECTIONS]
+    selected = st.radio("Section", labels, horizontal=True, key="overview_section", label_visibility="collapsed")
     
-    with tabs[0]:
+    if selected == "Summary":
         st.subheader("Project Summary")
         
         col1, col2 = st.columns(2)
@@ -845,31 +899,12 @@ def display_project_overview():
             st.markdown(f"**Last Updated:** {project['updated_at']}")
         
         with col2:
-            # Calculate completion status
-            completed_elements = sum(1 for key in ['concept', 'treatment', 'script_outline', 
-                                                 'cast_suggestions', 'location_suggestions', 
-                                                 'product_placements', 'marketing_assets'] 
-                                  if project[key])
-            completion_percentage = (completed_elements / 7) * 100
+            completion_percentage, next_step = project_progress(project_version(project), project)
             
             st.metric("Completion Status", f"{int(completion_percentage)}%")
             
             # Next steps
             st.subheader("Next Steps")
-            next_step = None
-            if not project["treatment"]:
-                next_step = ("Treatment", "treatment")
-            elif not project["script_outline"]:
-                next_step = ("Script Outline", "script_outline")
-            elif not project["cast_suggestions"]:
-                next_step = ("Casting", "casting")
-            elif not project["location_suggestions"]:
-                next_step = ("Locations", "locations")
-            elif not project["product_placements"]:
-                next_step = ("Product Placements", "product_placements")
-            elif not project["marketing_assets"]:
-                next_step = ("Marketing", "marketing")
-            
             if next_step:
                 st.markdown(f"Continue to: **{next_step[0]}**")
                 if st.button(f"Go to {next_step[0]}"):
@@ -877,90 +912,153 @@ def display_project_overview():
                     st.experimental_rerun()
             else:
                 st.success("Project development complete!")
+            
+            display_stale_artifacts(project)
                 
         st.subheader("Concept")
         st.markdown(project["concept"])
+        return
     
-    with tabs[1]:
-        st.subheader("Treatment")
-        if project["treatment"]:
-            st.markdown(project["treatment"])
-        else:
-            st.info("Treatment not yet generated")
-            if st.button("Generate Treatment"):
-                st.session_state.current_step = "treatment"
-                st.experimental_rerun()
-    
-    with tabs[2]:
-        st.subheader("Script Outline")
-        if project["script_outline"]:
-            st.markdown(project["script_outline"])
-        else:
-            st.info("Script outline not yet generated")
-            if st.button("Generate Script Outline"):
-                st.session_state.current_step = "script_outline"
-                st.experimental_rerun()
-    
-    with tabs[3]:
-        st.subheader("Cast Suggestions")
-        if project["cast_suggestions"]:
-            st.markdown(project["cast_suggestions"])
-        else:
-            st.info("Cast suggestions not yet generated")
-            if st.button("Generate Cast Suggestions"):
-                st.session_state.current_step = "casting"
-                st.experimental_rerun()
-    
-    with tabs[4]:
-        st.subheader("Location Suggestions")
-        if project["location_suggestions"]:
-            st.markdown(project["location_suggestions"])
-        else:
-            st.info("Location suggestions not yet generated")
-            if st.button("Generate Location Suggestions"):
-                st.session_state.current_step = "locations"
-                st.experimental_rerun()
-    
-    with tabs[5]:
-        st.subheader("Product Placement Opportunities")
-        if project["product_placements"]:
-            st.markdown(project["product_placements"])
-        else:
-            st.info("Product placement opportunities not yet generated")
-            if st.button("Generate Product Placement Opportunities"):
-                st.session_state.current_step = "product_placements"
-                st.experimental_rerun()
+    label, key, placeholder, button_label, step = next(section for section in OVERVIEW_SECTIONS
+                                                       if section[0] == selected)
+    st.subheader(label)
+    if project.get(key):
+        st.markdown(project[key])
+    else:
+        st.info(placeholder)
+        if st.button(button_label):
+            st.session_state.current_step = step
+            st.experimental_rerun()
+
+def display_admin_panel():
+    st.header("Admin: Agent Calls")
+    summary = default_metrics.summary()
+    if not summary:
+        st.info("No agent calls recorded yet")
+        return
     
-    with tabs[6]:
-        st.subheader("Marketing Assets")
-        if project["marketing_assets"]:
-            st.markdown(project["marketing_assets"])
-        else:
-            st.info("Marketing assets not yet generated")
-            if st.button("Generate Marketing Assets"):
-                st.session_state.current_step = "marketing"
-                st.experimental_rerun()
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Calls", sum(row["calls"] for row in summary))
+    col2.metric("Cache Hits", sum(row["cache_hits"] for row in summary))
+    col3.metric("Errors", sum(row["errors"] for row in summary))
+    col4.metric("Tokens", sum(row["prompt_tokens"] + row["completion_tokens"] for row in summary))
+    col5.metric("Estimated Cost", f"${sum(row['cost_usd'] for row in summary):.4f}")
+    
+    st.subheader("By Agent")
+    st.caption("Latency percentiles cover the most recent upstream calls; cache hits are excluded. "
+               "Cached prompt tokens were served from the provider's prompt cache.")
+    st.dataframe([
+        {
+            "Agent": row["agent"],
+            "Calls": row["calls"],
+            "Cache Hits": row["cache_hits"],
+            "Errors": row["errors"],
+            "Prompt Tokens": row["prompt_tokens"],
+            "Completion Tokens": row["completion_tokens"],
+            "Cached Prompt Tokens": row["cached_prompt_tokens"],
+            "Cost (USD)": round(row["cost_usd"], 4),
+            "p50 Latency (s)": round(row["p50_latency"], 2) if row["p50_latency"] is not None else None,
+            "p95 Latency (s)": round(row["p95_latency"], 2) if row["p95_latency"] is not None else None,
+            "p50 TTFT (s)": round(row["p50_ttft"], 2) if row["p50_ttft"] is not None else None,
+        }
+        for row in summary
+    ], use_container_width=True)
+    
+    st.subheader("Model Routes")
+    st.caption("Timeouts and rate limits on a route's model fall back to the next model listed.")
+    st.dataframe([
+        {
+            "Route": row["route"],
+            "Model": row["model"],
+            "Fallbacks": row["fallbacks"],
+            "Max Tokens": row["max_tokens"],
+            "Fallback Calls": row["fallback_calls"],
+        }
+        for row in default_router.stats()
+    ], use_container_width=True)
+    
+    st.subheader("Speculative Pre-generation")
+    speculation = get_speculator().stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Started", speculation["started"])
+    col2.metric("Used", speculation["hits"])
+    col3.metric("Hit Rate", f"{speculation['hit_rate'] * 100:.0f}%")
+    col4.metric("Cancelled or Unused", speculation["cancelled"] + speculation["wasted"])
+    st.caption(f"{speculation['pending']} in progress, {speculation['failed']} failed, "
+               f"{speculation['over_budget']} skipped once a session's budget was spent.")
+    
+    semantic = get_response_cache().semantic
+    if semantic is not None:
+        st.subheader("Near-duplicate Cache")
+        stats = semantic.stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Lookups", stats["lookups"])
+        col2.metric("Matches", stats["matches"])
+        col3.metric("Entries", stats["entries"], help=f"{stats['admissions']} admitted, {stats['evictions']} evicted, "
+                                                      f"{stats['rejections']} prompts without words skipped")
+        col4.metric("Threshold", f"{stats['threshold']:.2f}")
+        mean = stats["mean_best_similarity"]
+        st.caption((f"Mean best similarity {mean:.3f}. " if mean is not None else "") +
+                   f"{stats['stale']} matches pointed at responses that had already expired. "
+                   "Match rates are what recent lookups would have reached at each threshold.")
+        st.dataframe([
+            {"Threshold": threshold, "Match Rate": f"{rate * 100:.0f}%"}
+            for threshold, rate in stats["match_rate_at"].items()
+        ], use_container_width=True)
+    
+    st.subheader("Shared State")
+    local = get_project_store().stats()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Backend", DEFAULT_STATE_BACKEND)
+    col2.metric("Local Project Reads", f"{local['hit_rate'] * 100:.0f}%",
+                help=f"{local['hits']} of {local['hits'] + local['misses']} project reads served from this process")
+    col3.metric("Local Copies", local["entries"])
+    st.caption(f"Project records and a shared response cache are read through an in-process copy kept for "
+               f"{local['ttl']:g} seconds; job status is always read from the backend.")
+    
+    st.subheader("Recent Calls")
+    st.dataframe(list(reversed(default_metrics.recent_calls())), use_container_width=True)
+    
+    st.download_button("Download Prometheus Metrics", default_metrics.render_prometheus(),
+                       file_name="vadis_metrics.prom", mime="text/plain")
+
+AGENT_NAMES = {
+    "concept_agent": "Film Concept Agent",
+    "script_agent": "Script Development Agent",
+    "casting_agent": "Casting Agent",
+    "location_agent": "Location Scout Agent",
+    "placement_agent": "Product Placement Agent",
+    "marketing_agent": "Marketing Agent",
+    "system": "System"
+}
+
+def display_history_entry(message):
+    agent_type = message.get("agent_type") or "system"
+    agent_name = AGENT_NAMES.get(agent_type, agent_type)
+    if lazy_section(f"{agent_name} Output", f"history_output_{message['seq']}"):
+        st.markdown(message["content"])
 
 def display_conversation_history():
-    if st.session_state.conversation_history:
+    history = st.session_state.conversation_history
+    if history:
         st.header("AI Agent Activity")
         
-        for message in st.session_state.conversation_history[-3:]:  # Show only the last 3 entries
-            agent_type = message.get("agent_type", "system")
-            agent_name_map = {
-                "concept_agent": "Film Concept Agent",
-                "script_agent": "Script Development Agent",
-                "casting_agent": "Casting Agent",
-                "location_agent": "Location Scout Agent",
-                "placement_agent": "Product Placement Agent",
-                "marketing_agent": "Marketing Agent",
-                "system": "System"
-            }
-            
-            agent_name = agent_name_map.get(agent_type, agent_type)
-            
-            with st.expander(f"{agent_name} Output"):
-                st.markdown(message["content"])
+        recent = history.recent(3)  # Show only the last 3 entries
+        for message in recent:
+            display_history_entry(message)
+        
+        # Older outputs of the open project are paged back in from memory or the on-disk log on request
+        project = st.session_state.current_project
+        project_id = project["id"] if project else None
+        older = history.count(project_id, before_seq=recent[0]["seq"])
+        if older:
+            pages = -(-older // 3)
+            st.caption(f"{older} older outputs for this project")
+            page = st.number_input("Older Outputs Page", min_value=0, max_value=pages, value=0,
+                                   help="0 hides them; page 1 is the most recent")
+            if page:
+                for message in history.page(project_id, page - 1, 3, before_seq=recent[0]["seq"]):
+                    display_history_entry(message)
 
 # Main Application
 def main():
@@ -974,6 +1072,12 @@ def main():
     
     # Project Selector in Sidebar
     display_project_selector()
+    display_connection_metrics()
+    get_metrics_server()
+    
+    # Jobs in flight for the open project, including ones started by an earlier session
+    project = st.session_state.current_project
+    job_placeholders = display_project_jobs(project) if project else {}
     
     # Main Content Area
     if st.session_state.current_step == "concept" and not st.session_state.current_project:
@@ -992,6 +1096,8 @@ def main():
         display_marketing_developer()
     elif st.session_state.current_step == "overview" and st.session_state.current_project:
         display_project_overview()
+    elif st.session_state.current_step == "admin":
+        display_admin_panel()
     
     # Conversation History at the Bottom
     display_conversation_history()
@@ -999,6 +1105,10 @@ def main():
     # Footer
     st.markdown("---")
     st.markdown("**Vadis Media AI Film Platform** - MVP Demo - Festival de Cannes 2025")
+    
+    if job_placeholders:
+        follow_job_progress(job_placeholders)
+        st.experimental_rerun()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
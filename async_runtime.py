@@ -0,0 +1,78 @@
+import asyncio
+import inspect
+import threading
+
+
+class BackgroundLoop:
+    """An event loop running on a daemon thread, shared by every sync caller in the process."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="vadis-async-loop", daemon=True)
+        self.thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._ready.set)
+        self.loop.run_forever()
+
+    def run(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def iterate(self, agen):
+        # Drives an async generator from a plain thread, one item per round-trip to the loop
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            asyncio.run_coroutine_threadsafe(agen.aclose(), self.loop)
+
+
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop():
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            _background_loop = BackgroundLoop()
+        return _background_loop
+
+
+class SyncFacade:
+    """Exposes an async object's methods as blocking calls so synchronous callers can use it unchanged.
+
+    Coroutines are run to completion on the shared background loop and async generators
+    are turned into plain generators.
+    """
+
+    def __init__(self, target, background_loop=None):
+        self._target = target
+        self._background_loop = background_loop or get_background_loop()
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            return self._resolve(attribute(*args, **kwargs))
+
+        return call
+
+    def _resolve(self, result):
+        if inspect.isawaitable(result):
+            return self._background_loop.run(_await(result))
+        if inspect.isasyncgen(result):
+            return self._background_loop.iterate(result)
+        return result
+
+
+async def _await(awaitable):
+    return await awaitable
@@ -0,0 +1,289 @@
+"""Headless batch concept generation for parameter sweeps.
+
+    python batch_concepts.py run sweep.csv --output concepts.jsonl --concurrency 8
+    python batch_concepts.py prepare sweep.csv --batch-file batch_input.jsonl
+    python batch_concepts.py execute batch_input.jsonl --batch-output batch_output.jsonl --base-url http://127.0.0.1:8089/v1
+    python batch_concepts.py collect batch_output.jsonl --output concepts.jsonl
+
+Input rows are user_inputs (genre, rating, themes, audience, additional_notes, and optionally
+id and num_concepts) from CSV or JSONL. Results are appended to the output JSONL as they
+finish; rerunning the same command skips rows that already succeeded.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from agents import FilmConceptAgent, GenerationError
+from context_budget import count_message_tokens
+from llm_clients import ClientRegistry
+from model_routing import ModelRouter
+from rate_limit import default_rate_limiter, default_retry_policy
+from structured_outputs import CONCEPTS, StructuredOutputError
+
+INPUT_FIELDS = ("genre", "rating", "themes", "audience", "additional_notes")
+
+
+def load_inputs(path):
+    # Returns (row id, user_inputs, num_concepts); ids default to the 1-based row number so a resume lines up
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    inputs = []
+    for number, row in enumerate(rows, start=1):
+        row_id = str(row.get("id") or f"row-{number}")
+        user_inputs = {field: row[field] for field in INPUT_FIELDS if row.get(field)}
+        inputs.append((row_id, user_inputs, int(row.get("num_concepts") or 3)))
+    return inputs
+
+
+def _repair_tail(path):
+    # A crash can leave a half-written last line; drop it so appended records start on a fresh line
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def read_records(path, key="id"):
+    # Last record per key wins, so a retried row supersedes its earlier failure
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record[key]] = record
+    return records
+
+
+class ResultWriter:
+    """Appends one JSON line per finished row, flushed to disk so the file doubles as the checkpoint."""
+
+    def __init__(self, path):
+        _repair_tail(path)
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def run_bounded(func, items, max_concurrency):
+    # Keeps at most max_concurrency rows in flight and yields (item, result, error) as each finishes
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        pending = {}
+        for item in items:
+            pending[executor.submit(func, item)] = item
+            if len(pending) >= max_concurrency:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    yield item, None, e
+                next_item = next(items, None)
+                if next_item is not None:
+                    pending[executor.submit(func, next_item)] = next_item
+
+
+def run_batch(agent, inputs, output_path, max_concurrency=8, structured=True, on_record=None):
+    """Generates concepts for every pending row through the agent (cache, rate limit and retries apply).
+
+    Returns counts of rows completed, failed and skipped as already done.
+    """
+    done = {row_id for row_id, record in read_records(output_path).items() if record.get("error") is None}
+    pending = [row for row in inputs if row[0] not in done]
+    writer = ResultWriter(output_path)
+    counts = {"completed": 0, "failed": 0, "skipped": len(inputs) - len(pending)}
+
+    def generate(row):
+        row_id, user_inputs, num_concepts = row
+        return agent.generate_concepts(user_inputs, num_concepts, structured=structured)
+
+    try:
+        for (row_id, user_inputs, num_concepts), result, error in run_bounded(generate, pending, max_concurrency):
+            record = {"id": row_id, "user_inputs": user_inputs, "completed_at": time.time(), "error": None}
+            if error is not None:
+                record["error"] = str(error)
+                counts["failed"] += 1
+            else:
+                record["concepts" if structured else "text"] = result["concepts"] if structured else result
+                counts["completed"] += 1
+            writer.write(record)
+            if on_record:
+                on_record(record)
+    finally:
+        writer.close()
+    return counts
+
+
+def batch_request(agent, row_id, user_inputs, num_concepts=3, structured=True):
+    # One line of an OpenAI Batch API input file, built with the same prompt and params as a live call
+    prompt = agent.concepts_prompt(user_inputs, num_concepts)
+    messages = agent.build_messages(prompt, agent.concepts_system_message(structured))
+    return {
+        "custom_id": row_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": agent.completion_params(messages, schema=CONCEPTS if structured else None,
+                                        route=agent.route("generate_concepts")),
+    }
+
+
+def write_batch_file(agent, inputs, batch_path, structured=True):
+    with open(batch_path, "w", encoding="utf-8") as f:
+        for row_id, user_inputs, num_concepts in inputs:
+            f.write(json.dumps(batch_request(agent, row_id, user_inputs, num_concepts, structured)) + "\n")
+    return len(inputs)
+
+
+def execute_batch_file(client, batch_path, output_path, max_concurrency=8):
+    """Runs a Batch input file against any chat.completions endpoint (e.g. the benchmarks stand-in).
+
+    Output lines use the Batch API output format, so collect_batch_output reads either source.
+    """
+    with open(batch_path, encoding="utf-8") as f:
+        requests = [json.loads(line) for line in f if line.strip()]
+    done = {custom_id for custom_id, record in read_records(output_path, "custom_id").items()
+            if record.get("error") is None}
+    pending = [request for request in requests if request["custom_id"] not in done]
+    writer = ResultWriter(output_path)
+    counts = {"completed": 0, "failed": 0, "skipped": len(requests) - len(pending)}
+
+    def send(request):
+        body = request["body"]
+        estimated = count_message_tokens(body["messages"], body["model"]) + body.get("max_tokens", 0)
+
+        def attempt():
+            default_rate_limiter.acquire(estimated)
+            try:
+                return client.chat.completions.create(**body)
+            except Exception:
+                default_rate_limiter.refund(estimated)
+                raise
+
+        return default_retry_policy.call(attempt)
+
+    try:
+        for request, response, error in run_bounded(send, pending, max_concurrency):
+            record = {"id": f"batch_req_{request['custom_id']}", "custom_id": request["custom_id"],
+                      "response": None, "error": None}
+            if error is not None:
+                record["error"] = {"code": type(error).__name__, "message": str(error)}
+                counts["failed"] += 1
+            else:
+                record["response"] = {"status_code": 200, "request_id": response.id, "body": response.model_dump()}
+                counts["completed"] += 1
+            writer.write(record)
+    finally:
+        writer.close()
+    return counts
+
+
+def collect_batch_output(batch_output_path, output_path, inputs=None, structured=True):
+    # Converts Batch output lines into the same records run_batch writes
+    user_inputs = {row_id: values for row_id, values, _ in inputs or []}
+    counts = {"completed": 0, "failed": 0}
+    writer = ResultWriter(output_path)
+    try:
+        for custom_id, line in read_records(batch_output_path, "custom_id").items():
+            record = {"id": custom_id, "user_inputs": user_inputs.get(custom_id), "completed_at": time.time(),
+                      "error": None}
+            try:
+                if line.get("error"):
+                    raise GenerationError(FilmConceptAgent.__name__, line["error"].get("message"))
+                content = line["response"]["body"]["choices"][0]["message"]["content"]
+                record["concepts" if structured else "text"] = (CONCEPTS.parse(content)["concepts"] if structured
+                                                                else content)
+                counts["completed"] += 1
+            except (GenerationError, StructuredOutputError, KeyError, IndexError, TypeError) as e:
+                record["error"] = str(e)
+                counts["failed"] += 1
+            writer.write(record)
+    finally:
+        writer.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch film concept generation")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY", ""))
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint, e.g. the benchmarks stand-in")
+    parser.add_argument("--model", help="overrides the model route for generate_concepts")
+    parser.add_argument("--text", action="store_true", help="free-text concepts instead of JSON records")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="generate concepts directly with bounded concurrency")
+    run.add_argument("inputs")
+    run.add_argument("--output", required=True)
+    run.add_argument("--concurrency", type=int, default=8)
+
+    prepare = commands.add_parser("prepare", help="write an OpenAI Batch API input file")
+    prepare.add_argument("inputs")
+    prepare.add_argument("--batch-file", required=True)
+
+    execute = commands.add_parser("execute", help="run a Batch input file against --base-url")
+    execute.add_argument("batch_file")
+    execute.add_argument("--batch-output", required=True)
+    execute.add_argument("--concurrency", type=int, default=8)
+
+    collect = commands.add_parser("collect", help="turn a Batch output file into concept records")
+    collect.add_argument("batch_output")
+    collect.add_argument("--output", required=True)
+    collect.add_argument("--inputs", help="original inputs, to copy user_inputs into the records")
+
+    args = parser.parse_args(argv)
+    structured = not args.text
+    registry = ClientRegistry(base_url=args.base_url)
+    try:
+        if args.command == "execute":
+            counts = execute_batch_file(registry.get(args.api_key), args.batch_file, args.batch_output,
+                                        args.concurrency)
+        elif args.command == "collect":
+            inputs = load_inputs(args.inputs) if args.inputs else None
+            counts = collect_batch_output(args.batch_output, args.output, inputs, structured)
+        else:
+            # An explicit --model bypasses the route table
+            if args.model:
+                agent = FilmConceptAgent(args.api_key, args.model, client=registry.get(args.api_key),
+                                         router=ModelRouter({}))
+            else:
+                agent = FilmConceptAgent(args.api_key, client=registry.get(args.api_key))
+            inputs = load_inputs(args.inputs)
+            if args.command == "prepare":
+                counts = {"requests": write_batch_file(agent, inputs, args.batch_file, structured)}
+            else:
+                counts = run_batch(agent, inputs, args.output, args.concurrency, structured,
+                                   on_record=lambda record: print(
+                                       f"{record['id']}: {'failed: ' + record['error'] if record['error'] else 'ok'}",
+                                       file=sys.stderr))
+    finally:
+        registry.close()
+    print(json.dumps(counts))
+    return 1 if counts.get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
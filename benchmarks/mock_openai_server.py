@@ -0,0 +1,333 @@
+"""Local stand-in for the OpenAI chat.completions endpoint.
+
+Serves POST /v1/chat/completions (plain and streaming) with configurable first-token
+latency, token rate and error injection, so FilmAISystem can be exercised without
+network access. Repeated prompt prefixes are reported as cached tokens, as the API does. Run standalone with:
+
+    python -m benchmarks.mock_openai_server --port 8089 --latency-ms 300 --tokens-per-second 80
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _words(count, seed):
+    vocabulary = ("the", "camera", "lingers", "on", "a", "rain-soaked", "street", "as", "she",
+                  "turns", "toward", "light", "and", "memory", "of", "home", "returns", "quietly")
+    rng = random.Random(seed)
+    return [rng.choice(vocabulary) for _ in range(count)]
+
+
+def synthetic_completion(prompt, tokens, seed=0):
+    # Shapes the text like the real model does, so downstream parsing paths are exercised too
+    if "film concepts" in prompt:
+        count = int((re.search(r"Number of concepts: (\d+)", prompt) or [None, 3])[1])
+        per_concept = max(tokens // max(count, 1) - 8, 10)
+        blocks = [
+            f"CONCEPT {i}: The Working Title {i}\nLogline: {' '.join(_words(per_concept, seed + i))}."
+            for i in range(1, count + 1)
+        ]
+        return "\n\n".join(blocks)
+    if "script outline" in prompt:
+        count = int((re.search(r"Number of scenes: (\d+)", prompt) or [None, 12])[1])
+        per_scene = max(tokens // max(count, 1) - 16, 8)
+        blocks = [
+            f"Scene {i}: INT. LOCATION {i} - NIGHT\nCharacters present: Anna, Ben\n"
+            f"Summary of the action: {' '.join(_words(per_scene, seed + i))}."
+            for i in range(1, count + 1)
+        ]
+        return "\n\n".join(blocks)
+    return " ".join(_words(tokens, seed)).capitalize() + "."
+
+
+def synthetic_json(schema, words, seed=0, index=1):
+    # Minimal instance of a strict JSON schema: three items per array, short strings
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: synthetic_json(sub, words, seed + position, index)
+                for position, (name, sub) in enumerate(schema["properties"].items())}
+    if kind == "array":
+        return [synthetic_json(schema["items"], words, seed + item * 31, item) for item in range(1, 4)]
+    if kind == "integer":
+        return index
+    if "enum" in schema:
+        return schema["enum"][seed % len(schema["enum"])]
+    return " ".join(_words(words, seed)).capitalize()
+
+
+def approximate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class PromptPrefixCache:
+    """Mimics provider prompt caching: prefixes of 1024 tokens and up, in 128-token steps, are
+    remembered, and the longest one seen before is reported as cached."""
+
+    MIN_TOKENS = 1024
+    STEP_TOKENS = 128
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prefixes = set()
+
+    def lookup(self, messages):
+        text = "".join(f"{message.get('role')}:{message.get('content') or ''}\n" for message in messages)
+        # approximate_tokens counts 4 characters per token
+        boundaries = range(self.MIN_TOKENS * 4, len(text) + 1, self.STEP_TOKENS * 4)
+        digests = [zlib.crc32(text[:end].encode("utf-8")) for end in boundaries]
+        cached = 0
+        with self._lock:
+            for end, digest in zip(boundaries, digests):
+                if digest not in self.prefixes:
+                    break
+                cached = end // 4
+            self.prefixes.update(digests)
+        return cached
+
+
+class MockConfig:
+    def __init__(self, latency_ms=200.0, tokens_per_second=0.0, completion_tokens=400, error_rate=0.0,
+                 error_status=429, retry_after=0.05, seed=None):
+        self.latency_ms = latency_ms
+        # 0 means the whole completion is available as soon as the first-token latency has passed
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+
+class MockStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.streamed = 0
+        self.errors = 0
+        self.abandoned = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "streamed": self.streamed,
+                "errors": self.errors,
+                "abandoned": self.abandoned,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "completion_tokens": self.completion_tokens,
+            }
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Stream chunks are tiny; Nagle would batch them and distort time-to-first-token
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    @property
+    def stats(self):
+        return self.server.stats
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.stats.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+
+        self.stats.record(requests=1)
+        config = self.config
+        if config.error_rate and config.random.random() < config.error_rate:
+            self.stats.record(errors=1)
+            headers = {"retry-after": str(config.retry_after)} if config.error_status == 429 else {}
+            self._send_json(config.error_status, {
+                "error": {"message": "Injected failure", "type": "mock_error", "code": str(config.error_status)}
+            }, headers)
+            return
+
+        time.sleep(config.latency_ms / 1000.0)
+        prompt = body["messages"][-1]["content"] if body.get("messages") else ""
+        tokens = min(config.completion_tokens, body.get("max_tokens") or config.completion_tokens)
+        choices = max(int(body.get("n") or 1), 1)
+        # Seeded from the prompt: distinct prompts get distinct text, identical prompts identical text
+        seed = zlib.crc32(prompt.encode("utf-8"))
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"]["schema"]
+            texts = [json.dumps(synthetic_json(schema, max(tokens // 40, 3), seed + index * 1000))
+                     for index in range(choices)]
+        else:
+            # The task instructions sit in the system message, so the whole conversation shapes the text
+            conversation = "\n".join(message.get("content") or "" for message in body.get("messages", []))
+            texts = [synthetic_completion(conversation, tokens, seed=seed + index * 1000) for index in range(choices)]
+        prompt_tokens = sum(approximate_tokens(message.get("content") or "") for message in body.get("messages", []))
+        completion_tokens = sum(approximate_tokens(text) for text in texts)
+        cached_tokens = min(self.server.prompt_cache.lookup(body.get("messages", [])), prompt_tokens)
+        self.stats.record(prompt_tokens=prompt_tokens, cached_tokens=cached_tokens, completion_tokens=completion_tokens)
+
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get("model", "mock")
+
+        if body.get("stream"):
+            self.stats.record(streamed=1)
+            self._stream(completion_id, created, model, texts)
+            return
+
+        if config.tokens_per_second:
+            time.sleep(completion_tokens / choices / config.tokens_per_second)
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [
+                {"index": index, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                for index, text in enumerate(texts)
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        })
+
+    def _stream(self, completion_id, created, model, texts):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        delay = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second else 0.0
+
+        def event(index, delta, finish_reason=None):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": index, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+        try:
+            for index, text in enumerate(texts):
+                event(index, {"role": "assistant", "content": ""})
+                for position, word in enumerate(text.split(" ")):
+                    event(index, {"content": word if position == 0 else " " + word})
+                    if delay:
+                        time.sleep(delay)
+                event(index, {}, "stop")
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early, as a cancelled generation does
+            self.stats.record(abandoned=1)
+            self.close_connection = True
+
+
+class MockOpenAIServer:
+    """Runs the stand-in on a background thread; usable as a context manager."""
+
+    def __init__(self, host="127.0.0.1", port=0, config=None):
+        self.httpd = ThreadingHTTPServer((host, port), MockOpenAIHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.config = config or MockConfig()
+        self.httpd.stats = MockStats()
+        self.httpd.prompt_cache = PromptPrefixCache()
+        self.thread = None
+
+    @property
+    def config(self):
+        return self.httpd.config
+
+    @property
+    def stats(self):
+        return self.httpd.stats
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-openai", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI chat.completions stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="0 disables token pacing")
+    parser.add_argument("--completion-tokens", type=int, default=400)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=429)
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency_ms, args.tokens_per_second, args.completion_tokens,
+                        args.error_rate, args.error_status)
+    server = MockOpenAIServer(args.host, args.port, config)
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""Offline load benchmark for the FilmAISystem workflow.
+
+Each simulated user runs concept -> treatment (streamed) -> outline -> the
+cast/locations/placements/marketing fan-out against benchmarks.mock_openai_server, and the
+run reports p50/p95/p99 per step, throughput and memory held per session. Example:
+
+    python -m benchmarks.run_benchmarks --users 20 --latency-ms 300 --tokens-per-second 200
+    python -m benchmarks.run_benchmarks --json results.json --baseline baseline.json --tolerance 0.2
+
+With --baseline the run exits non-zero when a p95 or the throughput regresses by more
+than the tolerance, so it can gate CI without network access.
+"""
+import argparse
+import asyncio
+import json
+import math
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agents import AsyncFilmAISystem, FilmAISystem, GenerationError
+from async_runtime import get_background_loop
+from benchmarks.mock_openai_server import MockConfig, MockOpenAIServer
+from llm_clients import ClientRegistry
+from metrics import CallMetrics
+from rate_limit import RateLimiter, RetryPolicy
+from response_cache import MemoryCacheBackend, ResponseCache
+from single_flight import SingleFlight
+from structured_outputs import CONCEPTS, SCRIPT_OUTLINE
+
+STEPS = ("concept", "treatment_ttft", "treatment", "outline", "downstream", "end_to_end")
+BENCHMARK_API_KEY = "sk-benchmark"
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile; stable for the small sample sizes a CI run produces
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def deep_sizeof(value, seen=None):
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in value)
+    return size
+
+
+def user_inputs(index):
+    # Distinct inputs per user, so neither the cache nor single-flight hides upstream work
+    return {
+        "genre": "Drama",
+        "rating": "PG-13",
+        "themes": f"memory, family, benchmark user {index}",
+        "audience": "Adults 25-45",
+        "additional_notes": f"Simulated session {index}",
+    }
+
+
+class SessionRecorder:
+    """Step timings and the state one simulated session would keep in st.session_state."""
+
+    def __init__(self, index, inputs):
+        self.index = index
+        self.timings = {}
+        self.errors = []
+        project = {"title": f"Benchmark Film {index}", "genre": inputs["genre"]}
+        self.session_state = {"current_project": project, "conversation_history": []}
+        self._started = {}
+
+    def start(self, step):
+        self._started[step] = time.perf_counter()
+
+    def stop(self, step):
+        self.timings[step] = time.perf_counter() - self._started.pop(step)
+
+    def save(self, field, value):
+        self.session_state["current_project"][field] = value
+
+    def fail(self, step, error):
+        self.errors.append({"step": step, "error": type(error.cause).__name__})
+
+
+def run_sync_session(system, index, max_workers):
+    inputs = user_inputs(index)
+    recorder = SessionRecorder(index, inputs)
+    recorder.start("end_to_end")
+    try:
+        recorder.start("concept")
+        concepts = CONCEPTS.render(system.generate_film_concept(inputs, structured=True))
+        recorder.stop("concept")
+        recorder.save("concept", concepts)
+
+        recorder.start("treatment")
+        recorder.start("treatment_ttft")
+        chunks = []
+        for chunk in system.develop_treatment(concepts, stream=True):
+            if not chunks:
+                recorder.stop("treatment_ttft")
+            chunks.append(chunk)
+        recorder.stop("treatment")
+        recorder.save("treatment", "".join(chunks))
+
+        recorder.start("outline")
+        outline = SCRIPT_OUTLINE.render(system.create_script_outline(
+            recorder.session_state["current_project"]["treatment"], structured=True))
+        recorder.stop("outline")
+        recorder.save("script_outline", outline)
+
+        recorder.start("downstream")
+        system.generate_downstream_assets(
+            recorder.session_state["current_project"], {"genre": inputs["genre"]},
+            on_result=recorder.save,
+            on_error=lambda key, error: recorder.fail(key, error),
+            max_workers=max_workers,
+        )
+        recorder.stop("downstream")
+        recorder.stop("end_to_end")
+    except GenerationError as e:
+        recorder.fail("workflow", e)
+    return recorder
+
+
+async def run_async_session(system, index, max_workers):
+    inputs = user_inputs(index)
+    recorder = SessionRecorder(index, inputs)
+    recorder.start("end_to_end")
+    try:
+        recorder.start("concept")
+        concepts = CONCEPTS.render(await system.generate_film_concept(inputs, structured=True))
+        recorder.stop("concept")
+        recorder.save("concept", concepts)
+
+        recorder.start("treatment")
+        recorder.start("treatment_ttft")
+        chunks = []
+        async for chunk in system.develop_treatment(concepts, stream=True):
+            if not chunks:
+                recorder.stop("treatment_ttft")
+            chunks.append(chunk)
+        recorder.stop("treatment")
+        recorder.save("treatment", "".join(chunks))
+
+        recorder.start("outline")
+        outline = SCRIPT_OUTLINE.render(await system.create_script_outline(
+            recorder.session_state["current_project"]["treatment"], structured=True))
+        recorder.stop("outline")
+        recorder.save("script_outline", outline)
+
+        recorder.start("downstream")
+        await system.generate_downstream_assets(
+            recorder.session_state["current_project"], {"genre": inputs["genre"]},
+            on_result=recorder.save,
+            on_error=lambda key, error: recorder.fail(key, error),
+            max_workers=max_workers,
+        )
+        recorder.stop("downstream")
+        recorder.stop("end_to_end")
+    except GenerationError as e:
+        recorder.fail("workflow", e)
+    return recorder
+
+
+def run_workload(base_url, users, mode="sync", max_workers=4, use_cache=False):
+    registry = ClientRegistry(max_connections=max(100, users * max_workers), base_url=base_url)
+    # Budgets are effectively unlimited and backoff is short, so the numbers measure the
+    # application rather than the client-side throttle
+    agent_options = {
+        "rate_limiter": RateLimiter(requests_per_minute=1e9, tokens_per_minute=1e12),
+        "retry_policy": RetryPolicy(max_retries=5, base_delay=0.05, max_delay=1.0),
+        "single_flight": SingleFlight(),
+        "metrics": CallMetrics(log_path=""),
+    }
+    cache = ResponseCache(MemoryCacheBackend()) if use_cache else None
+
+    started = time.perf_counter()
+    if mode == "async":
+        async def run_all():
+            system = AsyncFilmAISystem(BENCHMARK_API_KEY, client=registry.get_async(BENCHMARK_API_KEY), cache=cache,
+                                       **agent_options)
+            return await asyncio.gather(*(run_async_session(system, index, max_workers) for index in range(users)))
+        recorders = get_background_loop().run(run_all())
+    else:
+        # One FilmAISystem per session, as each Streamlit rerun builds its own over the shared client
+        def run_one(index):
+            system = FilmAISystem(BENCHMARK_API_KEY, client=registry.get(BENCHMARK_API_KEY), cache=cache,
+                                  **agent_options)
+            return run_sync_session(system, index, max_workers)
+        with ThreadPoolExecutor(max_workers=users, thread_name_prefix="benchmark-user") as executor:
+            recorders = list(executor.map(run_one, range(users)))
+    elapsed = time.perf_counter() - started
+
+    connection_stats = registry.stats()
+    registry.close()
+    return recorders, elapsed, {
+        "connection_reuse_ratio": connection_stats["reuse_ratio"],
+        "retries": agent_options["retry_policy"].retries,
+        "agents": agent_options["metrics"].summary(),
+    }
+
+
+def summarize(recorders, elapsed, extra=None):
+    report = {"users": len(recorders), "elapsed_seconds": elapsed, "steps": {}}
+    for step in STEPS:
+        values = [recorder.timings[step] for recorder in recorders if step in recorder.timings]
+        report["steps"][step] = {
+            "count": len(values),
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+        }
+    completed = sum(1 for recorder in recorders if "end_to_end" in recorder.timings)
+    report["completed_sessions"] = completed
+    report["throughput_sessions_per_second"] = completed / elapsed if elapsed else 0.0
+    report["errors"] = {}
+    for recorder in recorders:
+        for error in recorder.errors:
+            report["errors"][error["error"]] = report["errors"].get(error["error"], 0) + 1
+    session_sizes = [deep_sizeof(recorder.session_state) for recorder in recorders]
+    report["memory"] = {
+        "session_state_bytes_mean": sum(session_sizes) / len(session_sizes) if session_sizes else 0,
+        "session_state_bytes_max": max(session_sizes, default=0),
+        # ru_maxrss is kilobytes on Linux
+        "process_peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    report.update(extra or {})
+    return report
+
+
+def format_report(report):
+    lines = [
+        f"{report['users']} users, {report['completed_sessions']} completed in {report['elapsed_seconds']:.2f}s "
+        f"({report['throughput_sessions_per_second']:.2f} sessions/s)",
+        "",
+        f"{'step':<16}{'n':>5}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}",
+    ]
+    for step, numbers in report["steps"].items():
+        cells = "".join(f"{numbers[name]:>10.3f}" if numbers[name] is not None else f"{'-':>10}"
+                        for name in ("p50", "p95", "p99"))
+        lines.append(f"{step:<16}{numbers['count']:>5}{cells}")
+    memory = report["memory"]
+    lines += [
+        "",
+        f"session state: {memory['session_state_bytes_mean'] / 1024:.1f} KiB mean, "
+        f"{memory['session_state_bytes_max'] / 1024:.1f} KiB max; process peak RSS {memory['process_peak_rss_kb'] / 1024:.1f} MiB",
+        f"errors: {report['errors'] or 'none'}; retries: {report.get('retries', 0)}; "
+        f"connection reuse: {report.get('connection_reuse_ratio', 0.0):.0%}",
+    ]
+    agents = report.get("agents", [])
+    prompt_tokens = sum(row["prompt_tokens"] for row in agents)
+    if prompt_tokens:
+        cached = sum(row["cached_prompt_tokens"] for row in agents)
+        lines.append(f"cached prompt tokens: {cached} of {prompt_tokens} ({cached / prompt_tokens:.0%})")
+    return "\n".join(lines)
+
+
+def find_regressions(report, baseline, tolerance):
+    regressions = []
+    for step, numbers in baseline.get("steps", {}).items():
+        current = report["steps"].get(step, {}).get("p95")
+        previous = numbers.get("p95")
+        if current is not None and previous and current > previous * (1 + tolerance):
+            regressions.append(f"{step} p95 {current:.3f}s > baseline {previous:.3f}s")
+    previous = baseline.get("throughput_sessions_per_second")
+    current = report["throughput_sessions_per_second"]
+    if previous and current < previous * (1 - tolerance):
+        regressions.append(f"throughput {current:.2f}/s < baseline {previous:.2f}/s")
+    if report["completed_sessions"] < report["users"] and baseline.get("completed_sessions") == baseline.get("users"):
+        regressions.append(f"only {report['completed_sessions']} of {report['users']} sessions completed")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark FilmAISystem workflows against a local mock server")
+    parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--max-workers", type=int, default=4, help="fan-out width per session")
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=400)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--cache", action="store_true", help="enable the in-memory response cache")
+    parser.add_argument("--base-url", help="use an already running server instead of starting one")
+    parser.add_argument("--json", help="write the report to this path")
+    parser.add_argument("--baseline", help="earlier --json report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression as a fraction")
+    args = parser.parse_args(argv)
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        config = MockConfig(args.latency_ms, args.tokens_per_second, args.completion_tokens,
+                            args.error_rate, args.error_status, seed=0)
+        server = MockOpenAIServer(config=config).start()
+        base_url = server.base_url
+    try:
+        recorders, elapsed, extra = run_workload(base_url, args.users, args.mode, args.max_workers, args.cache)
+        extra["mode"] = args.mode
+        if server is not None:
+            extra["server"] = server.stats.snapshot()
+    finally:
+        if server is not None:
+            server.stop()
+
+    report = summarize(recorders, elapsed, extra)
+    print(format_report(report))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+try:
+    import tiktoken
+except ImportError:  # token counts fall back to a conservative byte estimate
+    tiktoken = None
+
+
+DEFAULT_CONTEXT_BUDGET = int(os.environ.get("VADIS_CONTEXT_BUDGET", "6000"))
+DEFAULT_SUMMARY_TOKENS = int(os.environ.get("VADIS_CONTEXT_SUMMARY_TOKENS", "120"))
+DEFAULT_SUMMARY_CACHE_ENTRIES = int(os.environ.get("VADIS_SUMMARY_CACHE_MAX_ENTRIES", "2048"))
+
+# Per-message overhead the chat format adds on top of the content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def _encoding_for(model):
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("o200k_base")
+        return _encodings[model]
+
+
+def count_tokens(text, model="gpt-4o"):
+    if not text:
+        return 0
+    if tiktoken is not None:
+        return len(_encoding_for(model).encode(text, disallowed_special=()))
+    # Rounds up on purpose: English prose averages about 4 bytes a token, but code and non-Latin
+    # scripts come closer to 2-3, and an under-count would let the budget overflow the context window
+    return (len(text.encode("utf-8")) + 2) // 3
+
+
+def count_message_tokens(messages, model="gpt-4o"):
+    return sum(count_tokens(message.get("content") or "", model) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def extractive_summary(text, max_tokens=DEFAULT_SUMMARY_TOKENS, model="gpt-4o"):
+    # Leading sentences up to the token cap; cheap, deterministic and needs no API call
+    sentences = re.split(r"(?<=[.!?])\s+", " ".join(text.split()))
+    summary = []
+    used = 0
+    for sentence in sentences:
+        tokens = count_tokens(sentence, model)
+        if summary and used + tokens > max_tokens:
+            break
+        summary.append(sentence)
+        used += tokens
+    result = " ".join(summary)
+    if count_tokens(result, model) > max_tokens:
+        result = result[:max_tokens * 3].rsplit(" ", 1)[0] + "..."
+    return result
+
+
+class SummaryCache:
+    """Memoizes summaries by content hash so each scene or message is summarized once.
+
+    Shared by every session, so it is capped: the least recently used summary is dropped first.
+    """
+
+    def __init__(self, max_entries=DEFAULT_SUMMARY_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._summaries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, text, summarize):
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+                self.hits += 1
+                return summary
+            self.misses += 1
+        summary = summarize(text)
+        with self._lock:
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.max_entries:
+                self._summaries.popitem(last=False)
+                self.evictions += 1
+        return summary
+
+    def __len__(self):
+        with self._lock:
+            return len(self._summaries)
+
+
+# Shared across agents and sessions; the module outlives Streamlit reruns
+summary_cache = SummaryCache()
+
+
+class ContextBudget:
+    """Keeps recent material verbatim and compresses older material into memoized summaries."""
+
+    def __init__(self, max_tokens=DEFAULT_CONTEXT_BUDGET, model="gpt-4o", summarizer=None,
+                 summary_tokens=DEFAULT_SUMMARY_TOKENS, recent_share=0.75, cache=None):
+        self.max_tokens = max_tokens
+        self.model = model
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer or (lambda text: extractive_summary(text, summary_tokens, model))
+        self.recent_share = recent_share
+        self.cache = cache if cache is not None else summary_cache
+
+    def count(self, text):
+        return count_tokens(text, self.model)
+
+    def summarize(self, text):
+        return self.cache.get_or_create(text, self.summarizer)
+
+    def _split_recent(self, items, sizes, budget):
+        # Newest items are kept verbatim while they fit in the recent share of the budget
+        recent_budget = int(budget * self.recent_share)
+        used = 0
+        split = len(items)
+        for index in range(len(items) - 1, -1, -1):
+            if used + sizes[index] > recent_budget:
+                break
+            used += sizes[index]
+            split = index
+        return split, budget - used
+
+    def _summaries_within(self, texts, budget):
+        # Walks back from the newest so the oldest material is dropped first and never summarized
+        kept = []
+        used = 0
+        for text in reversed(texts):
+            summary = self.summarize(text)
+            tokens = self.count(summary) + 1
+            if used + tokens > budget:
+                break
+            kept.append(summary)
+            used += tokens
+        return list(reversed(kept))
+
+    def fit_history(self, history, reserved_tokens=0):
+        if not history:
+            return history
+        budget = max(self.max_tokens - reserved_tokens, 0)
+        if count_message_tokens(history, self.model) <= budget:
+            return history
+        sizes = [count_tokens(message.get("content") or "", self.model) + MESSAGE_OVERHEAD_TOKENS for message in history]
+        split, remaining = self._split_recent(history, sizes, budget)
+        summaries = self._summaries_within([message.get("content") or "" for message in history[:split]],
+                                           remaining - MESSAGE_OVERHEAD_TOKENS)
+        fitted = list(history[split:])
+        if summaries:
+            fitted.insert(0, {"role": "system", "content": "Summary of earlier conversation:\n" + "\n".join(summaries)})
+        return fitted
+
+    def fit_scenes(self, previous_scenes, reserved_tokens=0):
+        # Accepts a list of scene texts or one block of text (split on blank lines)
+        if not previous_scenes:
+            return previous_scenes
+        if isinstance(previous_scenes, str):
+            if self.count(previous_scenes) <= max(self.max_tokens - reserved_tokens, 0):
+                return previous_scenes
+            scenes = [part for part in re.split(r"\n\s*\n", previous_scenes) if part.strip()]
+        else:
+            scenes = list(previous_scenes)
+        budget = max(self.max_tokens - reserved_tokens, 0)
+        sizes = [self.count(scene) + 1 for scene in scenes]
+        if sum(sizes) <= budget:
+            return "\n\n".join(scenes)
+        split, remaining = self._split_recent(scenes, sizes, budget)
+        summaries = self._summaries_within(scenes[:split], remaining)
+        parts = []
+        if summaries:
+            parts.append("Summary of earlier scenes:\n" + "\n".join(f"- {summary}" for summary in summaries))
+        parts.extend(scenes[split:])
+        return "\n\n".join(parts)
@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+
+
+DEFAULT_HISTORY_DIR = os.environ.get("VADIS_HISTORY_DIR", "vadis_history")
+DEFAULT_HISTORY_CAPACITY = int(os.environ.get("VADIS_HISTORY_CAPACITY", "10"))
+# Spill logs of sessions idle for longer than this are removed by prune_history_logs
+DEFAULT_HISTORY_MAX_AGE = float(os.environ.get("VADIS_HISTORY_MAX_AGE", str(7 * 24 * 3600)))
+
+
+def entry_size(entry):
+    # Approximate resident size of one entry: the dict plus its keys and values
+    return sys.getsizeof(entry) + sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in entry.items())
+
+
+class ConversationHistory:
+    """Per-session agent output log: the newest entries stay in a capped ring buffer and older ones
+    are appended to JSONL files on disk, one per project, from which they can be paged back in.
+
+    Entries are dicts with role, content, agent_type, plus seq and project_id added on append.
+    """
+
+    def __init__(self, session_id, log_dir=DEFAULT_HISTORY_DIR, capacity=DEFAULT_HISTORY_CAPACITY):
+        self.session_id = session_id
+        self.log_dir = os.path.join(log_dir, session_id)
+        self.capacity = max(1, capacity)
+        self._lock = threading.Lock()
+        self._recent = deque()
+        self._next_seq = 0
+        # project key -> byte offsets of the spilled lines, so a page is read without scanning the file
+        self._offsets = {}
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+
+    def __len__(self):
+        return self._next_seq
+
+    def __bool__(self):
+        return self._next_seq > 0
+
+    def _path(self, project_key):
+        return os.path.join(self.log_dir, f"{project_key}.jsonl")
+
+    def _spill(self, entry):
+        project_key = entry["project_id"] if entry["project_id"] is not None else "none"
+        os.makedirs(self.log_dir, exist_ok=True)
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        with open(self._path(project_key), "ab") as f:
+            offset = f.tell()
+            f.write(line)
+        self._offsets.setdefault(project_key, []).append(offset)
+        self.disk_bytes += len(line)
+
+    def append(self, entry, project_id=None):
+        with self._lock:
+            entry = dict(entry, seq=self._next_seq, project_id=project_id)
+            self._next_seq += 1
+            self._recent.append(entry)
+            self.memory_bytes += entry_size(entry)
+            while len(self._recent) > self.capacity:
+                oldest = self._recent.popleft()
+                self.memory_bytes -= entry_size(oldest)
+                self._spill(oldest)
+
+    def recent(self, limit=3):
+        with self._lock:
+            return list(self._recent)[-limit:]
+
+    def _project_entries(self, project_id, before_seq):
+        return [entry for entry in reversed(self._recent)
+                if entry["project_id"] == project_id and (before_seq is None or entry["seq"] < before_seq)]
+
+    def count(self, project_id=None, before_seq=None):
+        # Entries of one project older than before_seq, in memory and on disk
+        project_key = project_id if project_id is not None else "none"
+        with self._lock:
+            return len(self._project_entries(project_id, before_seq)) + len(self._offsets.get(project_key, ()))
+
+    def page(self, project_id=None, page=0, page_size=3, before_seq=None):
+        """Entries of one project older than before_seq, newest first; page 0 is the newest page.
+
+        The ring buffer is read first, then the spilled log, seeking straight to the lines needed.
+        """
+        project_key = project_id if project_id is not None else "none"
+        start, stop = page * page_size, (page + 1) * page_size
+        with self._lock:
+            in_memory = self._project_entries(project_id, before_seq)
+            entries = in_memory[start:stop]
+            offsets = self._offsets.get(project_key, [])
+            # Spilled lines are oldest first, so the newest of them sit at the end of offsets
+            skip = max(0, start - len(in_memory))
+            wanted = stop - max(start, len(in_memory))
+            end = max(0, len(offsets) - skip)
+            selected = offsets[max(0, end - wanted):end] if wanted > 0 else []
+            if selected:
+                with open(self._path(project_key), "rb") as f:
+                    for offset in reversed(selected):
+                        f.seek(offset)
+                        entries.append(json.loads(f.readline()))
+        return entries
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": self._next_seq,
+                "in_memory": len(self._recent),
+                "spilled": sum(len(offsets) for offsets in self._offsets.values()),
+                "memory_bytes": self.memory_bytes,
+                "disk_bytes": self.disk_bytes,
+            }
+
+
+def prune_history_logs(log_dir=DEFAULT_HISTORY_DIR, max_age=DEFAULT_HISTORY_MAX_AGE):
+    # Sessions end without notice, so their spill logs are removed once they have been idle for max_age
+    if not os.path.isdir(log_dir):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(log_dir):
+        path = os.path.join(log_dir, name)
+        if not os.path.isdir(path):
+            continue
+        # Appends do not touch the directory's mtime, so the newest log file decides
+        last_write = max([os.path.getmtime(os.path.join(path, f)) for f in os.listdir(path)] + [os.path.getmtime(path)])
+        if last_write < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
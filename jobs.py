@@ -0,0 +1,463 @@
+"""Background generation jobs that outlive the Streamlit session that started them.
+
+Jobs are rows in a SQLite table (WAL mode). A worker pool claims them, runs the agents and writes
+the artifacts to the project store, so a rerun, a closed tab or a dropped connection no longer
+loses a paid-for generation. Sessions keep the job id and poll the row for status and progress.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from agents import assemble_script_draft, outline_fingerprint, parse_script_outline
+from pipeline import Pipeline
+from project_store import DEFAULT_PROJECT_DB
+from shared_state import DEFAULT_KEY_PREFIX, DEFAULT_STATE_BACKEND, redis_client
+
+DEFAULT_JOB_DB = os.environ.get("VADIS_JOB_DB", DEFAULT_PROJECT_DB)
+DEFAULT_JOB_WORKERS = int(os.environ.get("VADIS_JOB_WORKERS", "4"))
+# A running job whose lease is not renewed for this long (its process died) is picked up again
+DEFAULT_JOB_LEASE = float(os.environ.get("VADIS_JOB_LEASE", "60"))
+# Streamed text is written to the job row at most this often; pages poll it at the same rate
+DEFAULT_PROGRESS_INTERVAL = float(os.environ.get("VADIS_JOB_PROGRESS_INTERVAL", "0.1"))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobQueue:
+    """SQLite-backed job table shared by every session and process."""
+
+    def __init__(self, path=DEFAULT_JOB_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, project_id INTEGER, params TEXT NOT NULL, "
+            "status TEXT NOT NULL, progress TEXT, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "lease_until REAL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_project ON jobs (project_id, created_at)")
+        self._conn.commit()
+
+    def _decode(self, row):
+        job = dict(row)
+        for field in ("params", "result"):
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        return job
+
+    def enqueue(self, kind, project_id=None, params=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, project_id, params, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, project_id, json.dumps(params or {}), now, now),
+            )
+            self._conn.commit()
+        return job_id
+
+    def claim(self, job_ids=None, lease=DEFAULT_JOB_LEASE):
+        # Oldest queued job (or one whose worker lost its lease), limited to job_ids when given. The
+        # conditional UPDATE makes the claim atomic across processes sharing the database.
+        if job_ids is not None and not job_ids:
+            return None
+        query = "SELECT id FROM jobs WHERE (status = 'queued' OR (status = 'running' AND lease_until < ?))"
+        if job_ids is not None:
+            query += f" AND id IN ({', '.join('?' * len(job_ids))})"
+        query += " ORDER BY created_at LIMIT 5"
+        with self._lock:
+            now = time.time()
+            for row in self._conn.execute(query, (now, *(job_ids or ()))).fetchall():
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ? "
+                    "WHERE id = ? AND (status = 'queued' OR (status = 'running' AND lease_until < ?))",
+                    (now + lease, now, row["id"], now),
+                )
+                self._conn.commit()
+                if cursor.rowcount == 1:
+                    return self._decode(self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+        return None
+
+    def renew(self, job_ids, lease=DEFAULT_JOB_LEASE):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'",
+                [(now + lease, job_id) for job_id in job_ids],
+            )
+            self._conn.commit()
+
+    def report(self, job_id, progress):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+                               (progress, time.time(), job_id))
+            self._conn.commit()
+
+    def finish(self, job_id, result=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def fail(self, job_id, error):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+                (str(error), time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def active(self, project_id=None):
+        query = f"SELECT * FROM jobs WHERE status IN ({', '.join('?' * len(ACTIVE_STATUSES))})"
+        args = list(ACTIVE_STATUSES)
+        if project_id is not None:
+            query += " AND project_id = ?"
+            args.append(project_id)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY created_at", args).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def prune(self, older_than):
+        # Drops finished jobs last updated more than older_than seconds ago
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                               (time.time() - older_than,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisJobQueue:
+    """Job table on a Redis server, for workers on several nodes; same interface as JobQueue.
+
+    Each job is a hash. Queued and running jobs sit in a sorted set by creation time. A running job's
+    lease is a key that expires: a worker claims a job by creating that key, which fails while another
+    live worker holds it, so once a worker dies its jobs can be claimed again.
+    """
+
+    def __init__(self, client=None, prefix=DEFAULT_KEY_PREFIX):
+        self.client = client if client is not None else redis_client()
+        self.prefix = prefix
+        self._active = f"{prefix}:jobs:active"
+        self._finished = f"{prefix}:jobs:finished"
+
+    def _key(self, job_id):
+        return f"{self.prefix}:job:{job_id}"
+
+    def _lease_key(self, job_id):
+        return f"{self.prefix}:job:{job_id}:lease"
+
+    def _decode(self, data):
+        job = {field: None for field in ("project_id", "progress", "result", "error", "lease_until")}
+        job.update(data)
+        job["attempts"] = int(job.get("attempts", 0))
+        for field in ("created_at", "updated_at", "lease_until"):
+            if job[field] is not None:
+                job[field] = float(job[field])
+        if job["project_id"] is not None:
+            job["project_id"] = int(job["project_id"])
+        for field in ("params", "result"):
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        return job
+
+    def enqueue(self, kind, project_id=None, params=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        record = {"id": job_id, "kind": kind, "params": json.dumps(params or {}), "status": "queued",
+                  "attempts": 0, "created_at": now, "updated_at": now}
+        if project_id is not None:
+            record["project_id"] = project_id
+        pipe = self.client.pipeline()
+        pipe.hset(self._key(job_id), mapping=record)
+        pipe.zadd(self._active, {job_id: now})
+        pipe.execute()
+        return job_id
+
+    def claim(self, job_ids=None, lease=DEFAULT_JOB_LEASE):
+        if job_ids is not None and not job_ids:
+            return None
+        candidates = self.client.zrange(self._active, 0, -1)
+        if job_ids is not None:
+            wanted = set(job_ids)
+            candidates = [job_id for job_id in candidates if job_id in wanted]
+        for job_id in candidates[:5]:
+            # Set only if absent: fails while a live worker holds the job, succeeds once its lease expired
+            if not self.client.set(self._lease_key(job_id), "1", nx=True, px=int(lease * 1000)):
+                continue
+            if self.client.hget(self._key(job_id), "status") not in ACTIVE_STATUSES:
+                # Finished between the listing and the claim
+                self.client.delete(self._lease_key(job_id))
+                continue
+            now = time.time()
+            pipe = self.client.pipeline()
+            pipe.hset(self._key(job_id), mapping={"status": "running", "lease_until": now + lease, "updated_at": now})
+            pipe.hincrby(self._key(job_id), "attempts", 1)
+            pipe.execute()
+            return self.get(job_id)
+        return None
+
+    def renew(self, job_ids, lease=DEFAULT_JOB_LEASE):
+        now = time.time()
+        pipe = self.client.pipeline()
+        for job_id in job_ids:
+            pipe.pexpire(self._lease_key(job_id), int(lease * 1000))
+            pipe.hset(self._key(job_id), "lease_until", now + lease)
+        pipe.execute()
+
+    def report(self, job_id, progress):
+        self.client.hset(self._key(job_id), mapping={"progress": progress, "updated_at": time.time()})
+
+    def _end(self, job_id, fields):
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.hset(self._key(job_id), mapping=dict(fields, updated_at=now))
+        pipe.hdel(self._key(job_id), "lease_until")
+        pipe.zrem(self._active, job_id)
+        pipe.zadd(self._finished, {job_id: now})
+        pipe.delete(self._lease_key(job_id))
+        pipe.execute()
+
+    def finish(self, job_id, result=None):
+        self._end(job_id, {"status": "done", "result": json.dumps(result)})
+
+    def fail(self, job_id, error):
+        self._end(job_id, {"status": "failed", "error": str(error)})
+
+    def get(self, job_id):
+        data = self.client.hgetall(self._key(job_id))
+        return self._decode(data) if data else None
+
+    def active(self, project_id=None):
+        pipe = self.client.pipeline()
+        for job_id in self.client.zrange(self._active, 0, -1):
+            pipe.hgetall(self._key(job_id))
+        jobs = [self._decode(data) for data in pipe.execute() if data]
+        return [job for job in jobs if project_id is None or job["project_id"] == project_id]
+
+    def prune(self, older_than):
+        job_ids = self.client.zrangebyscore(self._finished, "-inf", time.time() - older_than)
+        if job_ids:
+            pipe = self.client.pipeline()
+            pipe.delete(*(self._key(job_id) for job_id in job_ids))
+            pipe.zrem(self._finished, *job_ids)
+            pipe.execute()
+
+    def close(self):
+        pass
+
+
+def job_queue_from_env():
+    return RedisJobQueue() if DEFAULT_STATE_BACKEND == "redis" else JobQueue()
+
+
+class JobWorkers:
+    """Worker threads that run queued jobs and save their results to the project store.
+
+    API keys are held in memory only. A job left behind by a dead process can be resumed by
+    a process configured with default_api_key; otherwise it waits until its lease is taken over.
+    """
+
+    def __init__(self, queue, store, system_factory, max_workers=DEFAULT_JOB_WORKERS, default_api_key=None,
+                 lease=DEFAULT_JOB_LEASE, poll_interval=1.0, speculator=None):
+        self.queue = queue
+        self.store = store
+        # system_factory(api_key) returns a FilmAISystem (or SyncFilmAISystem) for that key
+        self.system_factory = system_factory
+        self.max_workers = max_workers
+        self.default_api_key = default_api_key
+        self.lease = lease
+        self.poll_interval = poll_interval
+        # speculation.Speculator whose matching results are used instead of a new call
+        self.speculator = speculator
+        self.pipeline = Pipeline()
+        self._lock = threading.Lock()
+        self._api_keys = {}
+        self._running = set()
+        self._wake = threading.Condition(self._lock)
+        self._stopped = threading.Event()
+        self._threads = []
+        self.handlers = {
+            "artifact": self.run_artifact,
+            "update_stale": self.run_update_stale,
+            "script_draft": self.run_script_draft,
+        }
+
+    def start(self):
+        for index in range(max(1, self.max_workers)):
+            thread = threading.Thread(target=self._work, name=f"vadis-job-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._renew_leases, name="vadis-job-leases", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        with self._wake:
+            self._wake.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, kind, project_id, params, api_key):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = self.queue.enqueue(kind, project_id, params)
+        with self._wake:
+            self._api_keys[job_id] = api_key
+            self._wake.notify()
+        return job_id
+
+    def _claim(self):
+        with self._lock:
+            job_ids = None if self.default_api_key else list(self._api_keys)
+        job = self.queue.claim(job_ids, self.lease)
+        if job is not None:
+            with self._lock:
+                self._running.add(job["id"])
+        return job
+
+    def _work(self):
+        while not self._stopped.is_set():
+            job = self._claim()
+            if job is None:
+                with self._wake:
+                    self._wake.wait(self.poll_interval)
+                continue
+            try:
+                self.run_job(job)
+            finally:
+                with self._lock:
+                    self._running.discard(job["id"])
+
+    def _renew_leases(self):
+        while not self._stopped.wait(self.lease / 3):
+            with self._lock:
+                running = list(self._running)
+            if running:
+                self.queue.renew(running, self.lease)
+
+    def run_job(self, job):
+        with self._lock:
+            api_key = self._api_keys.pop(job["id"], None) or self.default_api_key
+        try:
+            result = self.handlers[job["kind"]](job, self.system_factory(api_key))
+        except Exception as e:
+            # Any failure ends up on the job row; the worker thread carries on with the next job
+            self.queue.fail(job["id"], e)
+        else:
+            self.queue.finish(job["id"], result)
+
+    def _project(self, job):
+        project = self.store.get(job["project_id"])
+        if project is None:
+            raise ValueError(f"No project with id {job['project_id']}")
+        return project
+
+    def save(self, project_id, node_name, outputs, record):
+        # Same bookkeeping as the pages: pin untracked artifacts and add the input record, merged into
+        # the stored project atomically, so jobs on other replicas keep their records too
+        def merge_inputs(project):
+            artifact_inputs = project.get("artifact_inputs") or {}
+            artifact_inputs.update(self.pipeline.untracked_inputs(project, artifact_inputs))
+            artifact_inputs[node_name] = record
+            return artifact_inputs
+
+        self.store.save_artifact(project_id, outputs, merge_inputs)
+
+    def progress_reporter(self, job_id, interval=DEFAULT_PROGRESS_INTERVAL):
+        # Accumulates streamed deltas and writes the text so far at most every interval seconds
+        chunks = []
+        last_report = [0.0]
+
+        def on_delta(delta):
+            if not delta:
+                return
+            chunks.append(delta)
+            now = time.monotonic()
+            if now - last_report[0] >= interval:
+                self.queue.report(job_id, "".join(chunks))
+                last_report[0] = now
+
+        return on_delta
+
+    def run_artifact(self, job, system):
+        # params: {"node": pipeline node name, "params": the settings chosen on the page, "session": the
+        # submitting session, whose speculation for the same request is used if there is one}
+        project = self._project(job)
+        node = self.pipeline.nodes[job["params"]["node"]]
+        missing = [name for name in node.requires if not project.get(name)]
+        if missing:
+            raise ValueError(f"{node.name} needs {', '.join(missing)} first")
+        values = node.values(project, job["params"].get("params"))
+        record = node.record(values)
+        on_delta = self.progress_reporter(job["id"])
+        regenerate = all(project.get(output) for output in node.outputs)
+        outputs = None
+        if self.speculator is not None and not regenerate and job["params"].get("session"):
+            outputs = self.speculator.take(job["params"]["session"], record["fingerprint"], on_delta)
+        if outputs is None:
+            outputs = node.run(system, values, on_delta=on_delta, bypass_cache=regenerate)
+        self.save(project["id"], node.name, outputs, record)
+        return outputs
+
+    def run_update_stale(self, job, system):
+        # params: {"targets": node names}; fresh upstream stages are skipped without an API call
+        project = self._project(job)
+        state = {key: value for key, value in project.items() if value is not None}
+        artifact_inputs = project.get("artifact_inputs") or {}
+        updated = []
+
+        def on_result(name, outputs, record):
+            self.save(project["id"], name, outputs, record)
+            updated.append(name)
+            self.queue.report(job["id"], f"Updated: {', '.join(updated)}")
+
+        result = Pipeline(system).run(state, artifact_inputs, job["params"].get("targets"), on_result=on_result)
+        if not result.ok:
+            failures = [f"{name}: {error}" for name, error in result.errors.items()]
+            failures += [f"{name}: blocked" for name, status in result.statuses.items() if status == "blocked"]
+            raise RuntimeError("; ".join(failures))
+        return result.statuses
+
+    def run_script_draft(self, job, system):
+        # params: {"max_workers": scenes written in parallel}; each scene is saved as it lands, so a
+        # failed or interrupted draft resumes where it stopped
+        project = self._project(job)
+        outline = project["script_outline"]
+        scenes = parse_script_outline(outline)
+        outline_hash = outline_fingerprint(outline)
+        draft_state = project.get("script_scenes") or {}
+        written_scenes = dict(draft_state.get("scenes", {})) if draft_state.get("outline_hash") == outline_hash else {}
+        failed_scenes = []
+        for number, text, error in system.iter_full_draft(outline, written_scenes,
+                                                          max_workers=job["params"].get("max_workers", 4)):
+            if error is not None:
+                failed_scenes.append(number)
+                continue
+            written_scenes[str(number)] = text
+            self.store.update(project["id"], "script_scenes", {"outline_hash": outline_hash, "scenes": written_scenes})
+            self.store.update(project["id"], "script_draft", assemble_script_draft(scenes, written_scenes))
+            self.queue.report(job["id"], f"{len(written_scenes)} of {len(scenes)} scenes written")
+        if failed_scenes:
+            raise RuntimeError(f"Scenes {', '.join(str(n) for n in sorted(failed_scenes))} could not be written")
+        return {"scenes": len(written_scenes)}
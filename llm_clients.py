@@ -0,0 +1,183 @@
+import hashlib
+import os
+import threading
+
+import httpx
+import openai
+
+from async_runtime import get_background_loop
+
+
+# HTTP pool limits, overridable per deployment
+DEFAULT_MAX_CONNECTIONS = int(os.environ.get("VADIS_HTTP_MAX_CONNECTIONS", "20"))
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("VADIS_HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+DEFAULT_KEEPALIVE_EXPIRY = float(os.environ.get("VADIS_HTTP_KEEPALIVE_EXPIRY", "60"))
+
+
+def key_fingerprint(api_key):
+    # Registry entries are keyed by a digest so raw keys never end up in metrics or logs
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+class ConnectionStats:
+    """Counts requests against freshly opened TCP connections for one pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+
+    def _trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections_opened += 1
+
+    async def _atrace(self, event_name, info):
+        self._trace(event_name, info)
+
+    def on_request(self, request):
+        with self._lock:
+            self.requests += 1
+        previous = request.extensions.get("trace")
+        if previous is None:
+            request.extensions["trace"] = self._trace
+        else:
+            def chained(event_name, info):
+                self._trace(event_name, info)
+                previous(event_name, info)
+            request.extensions["trace"] = chained
+
+    async def on_request_async(self, request):
+        with self._lock:
+            self.requests += 1
+        previous = request.extensions.get("trace")
+        if previous is None:
+            request.extensions["trace"] = self._atrace
+        else:
+            async def chained(event_name, info):
+                self._trace(event_name, info)
+                await previous(event_name, info)
+            request.extensions["trace"] = chained
+
+    @property
+    def reused_requests(self):
+        return max(self.requests - self.connections_opened, 0)
+
+    @property
+    def reuse_ratio(self):
+        if not self.requests:
+            return 0.0
+        return self.reused_requests / self.requests
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "reused_requests": self.reused_requests,
+                "reuse_ratio": self.reuse_ratio,
+            }
+
+
+class ClientRegistry:
+    """One pooled OpenAI client per API key, shared by every agent in the process.
+
+    SDK-level retries are disabled; agents retry through rate_limit.RetryPolicy.
+    """
+
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY, base_url=None):
+        # base_url points every client at an OpenAI-compatible stand-in (see benchmarks/)
+        self.base_url = base_url
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._async_clients = {}
+        self._stats = {}
+
+    def get(self, api_key):
+        fingerprint = key_fingerprint(api_key)
+        with self._lock:
+            client = self._clients.get(fingerprint)
+            if client is None:
+                stats = self._stats.setdefault(fingerprint, ConnectionStats())
+                http_client = httpx.Client(
+                    limits=self.limits,
+                    event_hooks={"request": [stats.on_request]},
+                )
+                client = openai.OpenAI(api_key=api_key, base_url=self.base_url, http_client=http_client,
+                                       max_retries=0)
+                self._clients[fingerprint] = client
+            return client
+
+    def get_async(self, api_key):
+        # Async pools are bound to the event loop that first uses them; in the app that is
+        # always the shared background loop from async_runtime
+        fingerprint = key_fingerprint(api_key)
+        with self._lock:
+            client = self._async_clients.get(fingerprint)
+            if client is None:
+                stats = self._stats.setdefault(fingerprint, ConnectionStats())
+                http_client = httpx.AsyncClient(
+                    limits=self.limits,
+                    event_hooks={"request": [stats.on_request_async]},
+                )
+                client = openai.AsyncOpenAI(api_key=api_key, base_url=self.base_url, http_client=http_client,
+                                            max_retries=0)
+                self._async_clients[fingerprint] = client
+            return client
+
+    def evict(self, api_key):
+        fingerprint = key_fingerprint(api_key)
+        with self._lock:
+            client = self._clients.pop(fingerprint, None)
+            async_client = self._async_clients.pop(fingerprint, None)
+            self._stats.pop(fingerprint, None)
+        if client is not None:
+            client.close()
+        if async_client is not None:
+            _close_async_client(async_client)
+
+    def rotate(self, old_api_key, new_api_key):
+        if old_api_key and old_api_key != new_api_key:
+            self.evict(old_api_key)
+        return self.get(new_api_key)
+
+    def stats(self, api_key=None):
+        with self._lock:
+            if api_key is not None:
+                stats = self._stats.get(key_fingerprint(api_key))
+                return stats.snapshot() if stats else ConnectionStats().snapshot()
+            totals = {"requests": 0, "connections_opened": 0, "reused_requests": 0}
+            for stats in self._stats.values():
+                snapshot = stats.snapshot()
+                for key in totals:
+                    totals[key] += snapshot[key]
+        totals["reuse_ratio"] = totals["reused_requests"] / totals["requests"] if totals["requests"] else 0.0
+        totals["clients"] = len(self._clients) + len(self._async_clients)
+        return totals
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            async_clients = list(self._async_clients.values())
+            self._clients.clear()
+            self._async_clients.clear()
+            self._stats.clear()
+        for client in clients:
+            client.close()
+        for client in async_clients:
+            _close_async_client(client)
+
+
+def _close_async_client(client):
+    # Close on the shared loop that owns the pool; a pool that never ran there is simply collected
+    try:
+        get_background_loop().run(client.close(), timeout=5)
+    except Exception:
+        pass
@@ -0,0 +1,268 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_METRICS_LOG = os.environ.get("VADIS_METRICS_LOG", "")
+DEFAULT_METRICS_PORT = int(os.environ.get("VADIS_METRICS_PORT", "0"))
+
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+TTFT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+# USD per million (prompt, completion) tokens; dated snapshots match by prefix
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+# Prompt tokens served from the provider's prompt cache are billed at a discount
+CACHED_PROMPT_DISCOUNT = 0.5
+
+
+def model_price(model):
+    for prefix in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model.startswith(prefix):
+            return MODEL_PRICES[prefix]
+    return (0.0, 0.0)
+
+
+def call_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    prompt_price, completion_price = model_price(model)
+    billed_prompt = prompt_tokens - cached_tokens * CACHED_PROMPT_DISCOUNT
+    return (billed_prompt * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def cached_prompt_tokens(usage):
+    # usage.prompt_tokens_details.cached_tokens; older SDKs keep the field as a plain dict
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", None) or 0
+
+
+def error_name(error):
+    if error is None:
+        return None
+    return error if isinstance(error, str) else type(error).__name__
+
+
+class CallRecord:
+    """One agent call: a cache hit, or an upstream completion with its usage and timings."""
+
+    def __init__(self, agent, model, cache, latency, prompt_tokens=0, completion_tokens=0, ttft=None,
+                 stream=False, error=None, usage_estimated=False, cached_tokens=0):
+        self.timestamp = time.time()
+        self.agent = agent
+        self.model = model
+        # "hit", "miss", "bypass" (regenerate) or "off" (no cache configured)
+        self.cache = cache
+        self.latency = latency
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        # Part of prompt_tokens the provider read from its prompt cache
+        self.cached_tokens = cached_tokens
+        self.ttft = ttft
+        self.stream = stream
+        self.error = error
+        # Streamed completions carry no usage block; their counts come from the local tokenizer
+        self.usage_estimated = usage_estimated
+        self.cost = call_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+
+    def to_dict(self):
+        return {
+            "timestamp": self.timestamp,
+            "agent": self.agent,
+            "model": self.model,
+            "cache": self.cache,
+            "stream": self.stream,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "usage_estimated": self.usage_estimated,
+            "ttft_seconds": self.ttft,
+            "latency_seconds": self.latency,
+            "cost_usd": self.cost,
+            "error": self.error,
+        }
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self):
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            yield bound, running
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class CallMetrics:
+    """Process-wide call counters and histograms, exported as Prometheus text and an optional JSONL log.
+
+    Cache hits are counted but kept out of the latency histograms, which describe upstream calls.
+    """
+
+    def __init__(self, log_path=DEFAULT_METRICS_LOG, recent=1000):
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.tokens = {}
+        self.cached_tokens = {}
+        self.cost = {}
+        self.latency = {}
+        self.ttft = {}
+        self.recent = deque(maxlen=recent)
+
+    def record(self, call):
+        series = (call.agent, call.model)
+        with self._lock:
+            outcome = (call.agent, call.model, call.cache, call.error or "")
+            self.calls[outcome] = self.calls.get(outcome, 0) + 1
+            prompt, completion = self.tokens.get(series, (0, 0))
+            self.tokens[series] = (prompt + call.prompt_tokens, completion + call.completion_tokens)
+            self.cached_tokens[series] = self.cached_tokens.get(series, 0) + call.cached_tokens
+            self.cost[series] = self.cost.get(series, 0.0) + call.cost
+            if call.cache != "hit":
+                self.latency.setdefault(series, Histogram(LATENCY_BUCKETS)).observe(call.latency)
+            if call.ttft is not None:
+                self.ttft.setdefault(series, Histogram(TTFT_BUCKETS)).observe(call.ttft)
+            self.recent.append(call)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(call.to_dict()) + "\n")
+
+    def render_prometheus(self):
+        with self._lock:
+            lines = [
+                "# HELP vadis_llm_calls_total Agent calls by cache status and error type.",
+                "# TYPE vadis_llm_calls_total counter",
+            ]
+            for (agent, model, cache, error), count in sorted(self.calls.items()):
+                lines.append(f"vadis_llm_calls_total{_labels(agent=agent, model=model, cache=cache, error=error)} {count}")
+            lines += [
+                "# HELP vadis_llm_tokens_total Prompt and completion tokens.",
+                "# TYPE vadis_llm_tokens_total counter",
+            ]
+            for (agent, model), (prompt, completion) in sorted(self.tokens.items()):
+                lines.append(f"vadis_llm_tokens_total{_labels(agent=agent, model=model, kind='prompt')} {prompt}")
+                lines.append(f"vadis_llm_tokens_total{_labels(agent=agent, model=model, kind='completion')} {completion}")
+                cached = self.cached_tokens.get((agent, model), 0)
+                lines.append(f"vadis_llm_tokens_total{_labels(agent=agent, model=model, kind='cached_prompt')} {cached}")
+            lines += [
+                "# HELP vadis_llm_cost_usd_total Estimated spend from MODEL_PRICES.",
+                "# TYPE vadis_llm_cost_usd_total counter",
+            ]
+            for (agent, model), cost in sorted(self.cost.items()):
+                lines.append(f"vadis_llm_cost_usd_total{_labels(agent=agent, model=model)} {cost:.6f}")
+            for name, help_text, histograms in (
+                ("vadis_llm_latency_seconds", "Upstream call latency.", self.latency),
+                ("vadis_llm_ttft_seconds", "Time to first streamed token.", self.ttft),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (agent, model), histogram in sorted(histograms.items()):
+                    for bound, count in histogram.cumulative():
+                        lines.append(f"{name}_bucket{_labels(agent=agent, model=model, le=bound)} {count}")
+                    lines.append(f"{name}_bucket{_labels(agent=agent, model=model, le='+Inf')} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(agent=agent, model=model)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{_labels(agent=agent, model=model)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        # Per-agent rollup for the admin panel; percentiles come from the recent-call window
+        with self._lock:
+            recent = list(self.recent)
+            calls = dict(self.calls)
+            tokens = dict(self.tokens)
+            cached_tokens = dict(self.cached_tokens)
+            cost = dict(self.cost)
+        rows = {}
+        for (agent, model, cache, error), count in calls.items():
+            row = rows.setdefault(agent, {
+                "agent": agent, "calls": 0, "cache_hits": 0, "errors": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "cached_prompt_tokens": 0, "cost_usd": 0.0,
+            })
+            row["calls"] += count
+            row["cache_hits"] += count if cache == "hit" else 0
+            row["errors"] += count if error else 0
+        for (agent, model), (prompt, completion) in tokens.items():
+            rows[agent]["prompt_tokens"] += prompt
+            rows[agent]["completion_tokens"] += completion
+            rows[agent]["cached_prompt_tokens"] += cached_tokens.get((agent, model), 0)
+            rows[agent]["cost_usd"] += cost.get((agent, model), 0.0)
+        for agent, row in rows.items():
+            latencies = [call.latency for call in recent if call.agent == agent and call.cache != "hit"]
+            ttfts = [call.ttft for call in recent if call.agent == agent and call.ttft is not None]
+            row["p50_latency"] = _percentile(latencies, 0.50)
+            row["p95_latency"] = _percentile(latencies, 0.95)
+            row["p50_ttft"] = _percentile(ttfts, 0.50)
+        return sorted(rows.values(), key=lambda row: row["agent"])
+
+    def recent_calls(self, limit=50):
+        with self._lock:
+            return [call.to_dict() for call in list(self.recent)[-limit:]]
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.tokens.clear()
+            self.cached_tokens.clear()
+            self.cost.clear()
+            self.latency.clear()
+            self.ttft.clear()
+            self.recent.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = self.server.metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_metrics_server(metrics, port=DEFAULT_METRICS_PORT, host="0.0.0.0"):
+    # Streamlit cannot add routes, so /metrics is served from its own thread for Prometheus to scrape
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, name="vadis-metrics", daemon=True).start()
+    return server
+
+
+# Process-wide, so every agent and session reports into the same series
+default_metrics = CallMetrics()
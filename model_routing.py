@@ -0,0 +1,113 @@
+import functools
+import json
+import os
+import threading
+
+import openai
+
+
+# Errors that move a call on to the route's next model instead of backing off on the same one
+FALLBACK_ERRORS = (openai.RateLimitError, openai.APITimeoutError)
+
+# "Agent.method" routes take precedence over agent-wide "Agent" routes; unset fields keep the
+# agent's own model and max_tokens. max_tokens is sized to the longest output each task asks for.
+DEFAULT_ROUTES = {
+    "FilmConceptAgent.generate_concepts": {"model": "gpt-4o-mini", "fallbacks": ["gpt-4o"], "max_tokens": 3000},
+    "ScriptAgent.generate_treatment": {"model": "gpt-4o", "fallbacks": ["gpt-4o-mini"], "max_tokens": 3000},
+    "ScriptAgent.generate_script_outline": {"model": "gpt-4o", "fallbacks": ["gpt-4o-mini"], "max_tokens": 3500},
+    "ScriptAgent.generate_scene": {"model": "gpt-4o", "fallbacks": ["gpt-4o-mini"], "max_tokens": 2000},
+    "CastingAgent.suggest_cast": {"model": "gpt-4o-mini", "fallbacks": ["gpt-4o"], "max_tokens": 3000},
+    "LocationAgent.suggest_locations": {"model": "gpt-4o-mini", "fallbacks": ["gpt-4o"], "max_tokens": 2500},
+    "ProductPlacementAgent.suggest_placements": {"model": "gpt-4o-mini", "fallbacks": ["gpt-4o"],
+                                                 "max_tokens": 2000},
+    "MarketingAgent.generate_marketing_assets": {"model": "gpt-4o-mini", "fallbacks": ["gpt-4o"],
+                                                 "max_tokens": 1500},
+}
+
+
+def load_routes(value=None):
+    """DEFAULT_ROUTES overlaid with VADIS_MODEL_ROUTES: inline JSON or the path of a JSON file.
+
+    A route set to null removes the default; VADIS_MODEL_ROUTING=0 disables routing altogether.
+    """
+    if os.environ.get("VADIS_MODEL_ROUTING", "1") == "0":
+        return {}
+    value = os.environ.get("VADIS_MODEL_ROUTES", "") if value is None else value
+    routes = dict(DEFAULT_ROUTES)
+    if value.strip():
+        if not value.lstrip().startswith("{"):
+            with open(value, encoding="utf-8") as f:
+                value = f.read()
+        for name, config in json.loads(value).items():
+            if config is None:
+                routes.pop(name, None)
+            else:
+                routes[name] = config
+    return routes
+
+
+def routed(method):
+    # Tags an agent method's calls with its task name, so the router can pick a model for it
+    @functools.wraps(method)
+    def wrapper(self, *args, **options):
+        options.setdefault("task", method.__name__)
+        return method(self, *args, **options)
+    return wrapper
+
+
+class Route:
+    def __init__(self, name, model, max_tokens, fallbacks=(), supports_n=True):
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+        self.fallbacks = tuple(fallback for fallback in fallbacks if fallback != model)
+        # False for endpoints without the n parameter; candidates are then requested in parallel
+        self.supports_n = supports_n
+
+    @property
+    def models(self):
+        return (self.model,) + self.fallbacks
+
+
+class ModelRouter:
+    """Picks the model, fallback models and max_tokens for each agent task from a route table."""
+
+    def __init__(self, routes=None):
+        self.routes = load_routes() if routes is None else dict(routes)
+        self._lock = threading.Lock()
+        # (route name, model that failed, error type) -> count
+        self.fallbacks = {}
+
+    def resolve(self, agent, task=None):
+        # Matched by class name along the MRO, so AsyncScriptAgent uses the ScriptAgent routes
+        names = [cls.__name__ for cls in type(agent).__mro__]
+        keys = ([f"{name}.{task}" for name in names] if task else []) + names
+        for key in keys:
+            config = self.routes.get(key)
+            if config is not None:
+                return Route(key, config.get("model", agent.model), config.get("max_tokens", agent.max_tokens),
+                             config.get("fallbacks", ()), config.get("supports_n", True))
+        return Route(None, agent.model, agent.max_tokens)
+
+    def record_fallback(self, route, model, error):
+        key = (route.name or "default", model, type(error).__name__)
+        with self._lock:
+            self.fallbacks[key] = self.fallbacks.get(key, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            fallbacks = dict(self.fallbacks)
+        rows = []
+        for name, config in sorted(self.routes.items()):
+            rows.append({
+                "route": name,
+                "model": config.get("model"),
+                "fallbacks": ", ".join(config.get("fallbacks", ())),
+                "max_tokens": config.get("max_tokens"),
+                "fallback_calls": sum(count for (route, _, _), count in fallbacks.items() if route == name),
+            })
+        return rows
+
+
+# Process-wide, configured once from the environment
+default_router = ModelRouter()
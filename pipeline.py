@@ -0,0 +1,378 @@
+"""Headless generation pipeline: each stage is a DAG node over FilmAISystem, with no Streamlit dependency.
+
+    python pipeline.py --project-id 3 --targets marketing_assets cast_suggestions
+    python pipeline.py --genre Drama --themes "memory, family" --output project.json
+
+Nodes declare the artifacts they require and the parameters they read. Independent nodes run
+concurrently, and a node is skipped when its outputs exist and its inputs hash the same as
+when they were produced (the per-artifact records a project keeps in artifact_inputs).
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from agents import CONCEPT_CANDIDATES, FilmAISystem, GenerationError, build_film_summary
+from structured_outputs import SCRIPT_OUTLINE, render_concept
+
+
+def fingerprint(values):
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class Node:
+    """One stage: run(system, values, on_delta=None, **options) returns a dict with a value for every output.
+
+    on_delta, when given, receives streamed text as it arrives. Structured stages do not stream, so
+    they call it once with "" just before their request: a caller can still stop them by raising there.
+    """
+
+    def __init__(self, name, outputs, requires, params, run):
+        self.name = name
+        self.outputs = tuple(outputs)
+        # Artifacts that must be present; they are also what links this node to upstream nodes
+        self.requires = tuple(requires)
+        # Optional settings (user inputs); they change the fingerprint but never block the node
+        self.params = tuple(params)
+        self.run = run
+
+    def values(self, state, *param_sources):
+        # Later sources win: typically the params recorded with the artifact, then explicit overrides
+        values = {name: state.get(name) for name in self.requires + self.params}
+        for source in param_sources:
+            values.update({name: value for name, value in (source or {}).items() if name in self.params})
+        return values
+
+    def record(self, values):
+        # What a project stores per artifact: the input hash and the params needed to regenerate it
+        return {
+            "fingerprint": fingerprint({"node": self.name, "inputs": values}),
+            "params": {name: values[name] for name in self.params if values.get(name) is not None},
+        }
+
+
+CONCEPT_INPUTS = ("genre", "rating", "themes", "audience", "additional_notes")
+
+
+def _text(method, *args, on_delta=None, **options):
+    # With on_delta (e.g. a background job reporting progress) the text is streamed; the result is the same
+    if on_delta is None:
+        return method(*args, **options)
+    chunks = []
+    for delta in method(*args, stream=True, **options):
+        chunks.append(delta)
+        on_delta(delta)
+    return "".join(chunks)
+
+
+def _checkpoint(on_delta):
+    if on_delta is not None:
+        on_delta("")
+
+
+def _concept(system, values, on_delta=None, **options):
+    # Headless runs take the concept at concept_index (default the first) instead of asking a person
+    _checkpoint(on_delta)
+    user_inputs = {name: values[name] for name in CONCEPT_INPUTS if values.get(name)}
+    num_concepts = values.get("num_concepts") or 3
+    if CONCEPT_CANDIDATES:
+        concepts = system.generate_film_concept(user_inputs, num_concepts=num_concepts, structured=True,
+                                                candidates=True, **options)
+    else:
+        concepts = system.generate_film_concept(user_inputs, num_concepts=num_concepts, structured=True,
+                                                **options)["concepts"]
+    concept = concepts[min(values.get("concept_index") or 0, len(concepts) - 1)]
+    return {"title": concept["title"], "concept": render_concept(concept)}
+
+
+def _treatment(system, values, **options):
+    return {"treatment": _text(system.develop_treatment, values["concept"], values.get("treatment_notes"), **options)}
+
+
+def _script_outline(system, values, on_delta=None, **options):
+    _checkpoint(on_delta)
+    outline = system.create_script_outline(values["treatment"], values.get("num_scenes") or 12, structured=True,
+                                           **options)
+    return {"script_outline": SCRIPT_OUTLINE.render(outline)}
+
+
+def _cast(system, values, **options):
+    return {"cast_suggestions": _text(
+        system.suggest_cast,
+        values.get("character_descriptions") or values["script_outline"],
+        values.get("budget_level") or "medium",
+        values.get("exclude_actors"),
+        **options,
+    )}
+
+
+def _locations(system, values, **options):
+    return {"location_suggestions": _text(
+        system.suggest_locations,
+        values.get("script_elements") or values["script_outline"],
+        values.get("budget_level") or "medium",
+        values.get("special_requirements"),
+        **options,
+    )}
+
+
+def _placements(system, values, **options):
+    return {"product_placements": _text(
+        system.suggest_product_placements,
+        values.get("script_elements") or values["script_outline"],
+        values.get("target_audience") or "General audience",
+        values.get("genre") or "Not specified",
+        **options,
+    )}
+
+
+def _marketing(system, values, **options):
+    return {"marketing_assets": _text(
+        system.create_marketing_assets,
+        build_film_summary(dict(values, genre=values.get("genre") or "Not specified")),
+        values.get("target_audience") or "General audience",
+        **options,
+    )}
+
+
+# The same stages and argument mapping as the Streamlit pages and FilmAISystem.downstream_tasks
+DEFAULT_NODES = (
+    Node("concept", ("title", "concept"), (), CONCEPT_INPUTS + ("num_concepts", "concept_index"), _concept),
+    Node("treatment", ("treatment",), ("concept",), ("treatment_notes",), _treatment),
+    Node("script_outline", ("script_outline",), ("treatment",), ("num_scenes",), _script_outline),
+    Node("cast_suggestions", ("cast_suggestions",), ("script_outline",),
+         ("character_descriptions", "budget_level", "exclude_actors"), _cast),
+    Node("location_suggestions", ("location_suggestions",), ("script_outline",),
+         ("script_elements", "budget_level", "special_requirements"), _locations),
+    Node("product_placements", ("product_placements",), ("script_outline",),
+         ("script_elements", "target_audience", "genre"), _placements),
+    Node("marketing_assets", ("marketing_assets",), ("title", "concept"), ("genre", "target_audience"), _marketing),
+)
+
+
+class PipelineResult:
+    def __init__(self, state, artifact_inputs):
+        self.state = state
+        self.artifact_inputs = artifact_inputs
+        # node name -> "ran", "skipped", "failed" or "blocked" (a required artifact is missing)
+        self.statuses = {}
+        self.errors = {}
+
+    @property
+    def ok(self):
+        return not self.errors and "blocked" not in self.statuses.values()
+
+
+class Pipeline:
+    """Runs DEFAULT_NODES (or any Node graph) over a state dict of artifacts and parameters.
+
+    artifact_inputs maps node name -> Node.record(...) for the inputs its outputs were generated from.
+    """
+
+    def __init__(self, system=None, nodes=DEFAULT_NODES, max_workers=4):
+        # system may be None when the pipeline is only used for staleness checks
+        self.system = system
+        self.nodes = {node.name: node for node in nodes}
+        self.max_workers = max_workers
+        producers = {output: node.name for node in nodes for output in node.outputs}
+        self.upstream = {
+            node.name: {producers[name] for name in node.requires if name in producers and producers[name] != node.name}
+            for node in nodes
+        }
+
+    def select(self, targets=None):
+        # The targets plus every node they transitively depend on
+        if targets is None:
+            return set(self.nodes)
+        unknown = set(targets) - set(self.nodes)
+        if unknown:
+            raise ValueError(f"Unknown pipeline nodes: {', '.join(sorted(unknown))}")
+        selected, stack = set(), list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in selected:
+                selected.add(name)
+                stack.extend(self.upstream[name])
+        return selected
+
+    def order(self, names):
+        ordered, placed = [], set()
+        while len(ordered) < len(names):
+            for name in self.nodes:
+                if name in names and name not in placed and (self.upstream[name] & names) <= placed:
+                    ordered.append(name)
+                    placed.add(name)
+        return ordered
+
+    def resolve(self, node, state, artifact_inputs, params=None):
+        recorded = (artifact_inputs.get(node.name) or {}).get("params")
+        return node.values(state, recorded, params)
+
+    def is_fresh(self, node, state, artifact_inputs, params=None):
+        # Artifacts with no record (made before inputs were tracked) count as fresh
+        if any(not state.get(output) for output in node.outputs):
+            return False
+        recorded = artifact_inputs.get(node.name)
+        if recorded is None:
+            return True
+        return recorded["fingerprint"] == node.record(self.resolve(node, state, artifact_inputs, params))["fingerprint"]
+
+    def stale_nodes(self, state, artifact_inputs=None, targets=None, params=None):
+        """Nodes a run would regenerate, in dependency order; downstream of a stale node is stale too."""
+        artifact_inputs = artifact_inputs or {}
+        stale = []
+        for name in self.order(self.select(targets)):
+            node = self.nodes[name]
+            if self.upstream[name] & set(stale) or not self.is_fresh(node, state, artifact_inputs, params):
+                stale.append(name)
+        return stale
+
+    def untracked_inputs(self, state, artifact_inputs=None):
+        # Records for existing artifacts that have none yet, pinned to the inputs they have now; taken
+        # before an upstream change, they let that change mark these artifacts stale
+        artifact_inputs = artifact_inputs or {}
+        return {
+            name: node.record(node.values(state))
+            for name, node in self.nodes.items()
+            if name not in artifact_inputs and all(state.get(output) for output in node.outputs)
+        }
+
+    def run(self, state, artifact_inputs=None, targets=None, force=(), params=None, on_result=None, on_error=None,
+            **options):
+        """Runs the selected nodes over state (project artifacts plus parameters).
+
+        Node params come from params, else the params recorded with the artifact, else state. state is
+        not modified; the result carries the updated copy and artifact_inputs. on_result(node, outputs,
+        record) and on_error(node, error) run in the calling thread, so they can persist results.
+        Nodes that regenerate an existing artifact (forced or stale) run with bypass_cache, so no cached
+        response to the old request is served as the new one; other options reach every agent call.
+        """
+        result = PipelineResult(dict(state), dict(artifact_inputs or {}))
+        pending = set(self.select(targets))
+        force = set(force)
+        running = {}
+
+        def submit(executor, node):
+            values = self.resolve(node, result.state, result.artifact_inputs, params)
+            regenerate = node.name in force or all(result.state.get(output) for output in node.outputs)
+            node_options = dict(options, bypass_cache=True) if regenerate else options
+            running[executor.submit(node.run, self.system, values, **node_options)] = (node, node.record(values))
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            while pending or running:
+                for name in self.order(pending):
+                    if self.upstream[name] & (pending | {node.name for node, _ in running.values()}):
+                        continue
+                    node = self.nodes[name]
+                    pending.discard(name)
+                    if any(result.statuses.get(upstream) in ("failed", "blocked") for upstream in self.upstream[name]) \
+                            or any(not result.state.get(required) for required in node.requires):
+                        result.statuses[name] = "blocked"
+                    elif name not in force and self.is_fresh(node, result.state, result.artifact_inputs, params):
+                        result.artifact_inputs.setdefault(name, node.record(node.values(result.state)))
+                        result.statuses[name] = "skipped"
+                    else:
+                        submit(executor, node)
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node, record = running.pop(future)
+                    try:
+                        outputs = future.result()
+                    except GenerationError as e:
+                        result.statuses[node.name] = "failed"
+                        result.errors[node.name] = e
+                        if on_error:
+                            on_error(node.name, e)
+                        continue
+                    result.state.update(outputs)
+                    result.artifact_inputs[node.name] = record
+                    result.statuses[node.name] = "ran"
+                    if on_result:
+                        on_result(node.name, outputs, record)
+        return result
+
+
+def run_project_pipeline(store, project_id, system, params=None, targets=None, force=(), max_workers=4, **options):
+    # Loads a stored project, regenerates what is stale and writes each artifact and its input
+    # record back as it lands
+    project = store.get(project_id)
+    if project is None:
+        raise ValueError(f"No project with id {project_id}")
+    state = {key: value for key, value in project.items() if value is not None}
+    pipeline = Pipeline(system, max_workers=max_workers)
+    artifact_inputs = project.get("artifact_inputs") or {}
+    artifact_inputs.update(pipeline.untracked_inputs(state, artifact_inputs))
+
+    def save(node, outputs, record):
+        def merge_inputs(stored):
+            merged = dict(artifact_inputs, **(stored.get("artifact_inputs") or {}))
+            merged[node] = record
+            return merged
+
+        store.save_artifact(project_id, outputs, merge_inputs)
+
+    return pipeline.run(state, artifact_inputs, targets, force, params, on_result=save, **options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the film generation pipeline without the UI")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY", ""))
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint, e.g. the benchmarks stand-in")
+    parser.add_argument("--project-id", type=int, help="run over a stored project and save results to it")
+    parser.add_argument("--project-db", help="project database (defaults to the shared store, VADIS_STATE_BACKEND)")
+    parser.add_argument("--targets", nargs="*", help="nodes to bring up to date (default: all)")
+    parser.add_argument("--force", nargs="*", default=(), help="nodes to regenerate even if fresh")
+    parser.add_argument("--params", help="JSON object of parameters, e.g. budget_level or target_audience")
+    parser.add_argument("--genre")
+    parser.add_argument("--rating")
+    parser.add_argument("--themes")
+    parser.add_argument("--audience")
+    parser.add_argument("--output", help="write the final state as JSON (runs without --project-id)")
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--stale", action="store_true", help="list the stale nodes of --project-id and exit")
+    args = parser.parse_args(argv)
+
+    # Imported here so the pipeline module itself stays free of storage and client setup
+    from llm_clients import ClientRegistry
+    from project_store import ProjectStore, project_store_from_env
+
+    params = json.loads(args.params) if args.params else {}
+    params.update({name: getattr(args, name) for name in ("genre", "rating", "themes", "audience")
+                   if getattr(args, name)})
+    if args.stale:
+        store = ProjectStore(args.project_db) if args.project_db else project_store_from_env()
+        project = store.get(args.project_id)
+        store.close()
+        if project is None:
+            parser.error(f"no project with id {args.project_id}")
+        for name in Pipeline().stale_nodes(project, project.get("artifact_inputs"), args.targets, params):
+            print(name)
+        return 0
+    registry = ClientRegistry(base_url=args.base_url)
+    system = FilmAISystem(args.api_key, client=registry.get(args.api_key))
+    try:
+        if args.project_id is not None:
+            store = ProjectStore(args.project_db) if args.project_db else project_store_from_env()
+            result = run_project_pipeline(store, args.project_id, system, params, args.targets, args.force,
+                                          max_workers=args.max_workers)
+            store.close()
+        else:
+            result = Pipeline(system, max_workers=args.max_workers).run(params, targets=args.targets,
+                                                                         force=args.force)
+            if args.output:
+                with open(args.output, "w", encoding="utf-8") as f:
+                    json.dump({"state": result.state, "artifact_inputs": result.artifact_inputs}, f, indent=2)
+    finally:
+        registry.close()
+    for name, status in result.statuses.items():
+        error = result.errors.get(name)
+        print(f"{name}: {status}" + (f" ({error})" if error else ""), file=sys.stderr)
+    return 0 if result.ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from shared_state import DEFAULT_KEY_PREFIX, DEFAULT_LOCAL_TTL, DEFAULT_STATE_BACKEND, ReadThroughCache, redis_client
+
+
+DEFAULT_PROJECT_DB = os.environ.get("VADIS_PROJECT_DB", "vadis_projects.sqlite3")
+
+# Artifact columns that update_project may write; each is updated on its own
+TEXT_FIELDS = (
+    "title",
+    "genre",
+    "concept",
+    "treatment",
+    "script_outline",
+    "cast_suggestions",
+    "location_suggestions",
+    "product_placements",
+    "marketing_assets",
+    "script_draft",
+)
+JSON_FIELDS = ("script_scenes", "artifact_inputs")
+PROJECT_FIELDS = TEXT_FIELDS + JSON_FIELDS
+
+
+def timestamp():
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def check_fields(fields):
+    for field in fields:
+        if field not in PROJECT_FIELDS:
+            raise ValueError(f"Unknown project field: {field}")
+
+
+class ProjectStore:
+    """SQLite-backed project repository (WAL mode) shared by every session and process."""
+
+    def __init__(self, path=DEFAULT_PROJECT_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f"{field} TEXT" for field in PROJECT_FIELDS if field != "title")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS projects ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, "
+            f"{columns}, created_at TEXT NOT NULL, updated_at TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS projects_updated ON projects (updated_at)")
+        self._add_missing_columns()
+        self._conn.commit()
+
+    def _add_missing_columns(self):
+        # Databases created by an older version gain new artifact columns in place
+        existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(projects)")}
+        for field in PROJECT_FIELDS:
+            if field not in existing:
+                self._conn.execute(f"ALTER TABLE projects ADD COLUMN {field} TEXT")
+
+    def _decode(self, row):
+        project = dict(row)
+        for field in JSON_FIELDS:
+            if project.get(field) is not None:
+                project[field] = json.loads(project[field])
+        return project
+
+    def create(self, title, genre, concept):
+        now = timestamp()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO projects (title, genre, concept, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (title, genre, concept, now, now),
+            )
+            self._conn.commit()
+            project_id = cursor.lastrowid
+        return self.get(project_id)
+
+    def get(self, project_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM projects WHERE id = ?", (project_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def update(self, project_id, field, value):
+        check_fields((field,))
+        if field in JSON_FIELDS and value is not None:
+            value = json.dumps(value)
+        now = timestamp()
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE projects SET {field} = ?, updated_at = ? WHERE id = ?",
+                (value, now, project_id),
+            )
+            self._conn.commit()
+        return now
+
+    def save_artifact(self, project_id, outputs, merge_inputs):
+        """Writes outputs and the artifact_inputs returned by merge_inputs(project) in one transaction.
+
+        merge_inputs gets the project as stored at that moment. BEGIN IMMEDIATE keeps writers in other
+        processes out until the commit, so jobs finishing together never drop each other's input records.
+        Returns the update timestamp, or None when there is no such project.
+        """
+        check_fields(outputs)
+        now = timestamp()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT * FROM projects WHERE id = ?", (project_id,)).fetchone()
+                if row is None:
+                    self._conn.rollback()
+                    return None
+                values = dict(outputs, artifact_inputs=merge_inputs(self._decode(row)))
+                encoded = [json.dumps(value) if field in JSON_FIELDS and value is not None else value
+                           for field, value in values.items()]
+                self._conn.execute(
+                    f"UPDATE projects SET {', '.join(f'{field} = ?' for field in values)}, updated_at = ? WHERE id = ?",
+                    (*encoded, now, project_id),
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return now
+
+    def list_summaries(self):
+        # Only ids and titles; artifact blobs stay on disk until a project is opened
+        with self._lock:
+            rows = self._conn.execute("SELECT id, title, updated_at FROM projects ORDER BY id").fetchall()
+        return [dict(row) for row in rows]
+
+    def delete(self, project_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisProjectStore:
+    """Project repository on a Redis server, for replicas on several nodes; same interface as ProjectStore.
+
+    Each project is a hash; a sorted set of ids keeps list_summaries in creation order.
+    """
+
+    def __init__(self, client=None, prefix=DEFAULT_KEY_PREFIX):
+        self.client = client if client is not None else redis_client()
+        self.prefix = prefix
+
+    def _key(self, project_id):
+        return f"{self.prefix}:project:{project_id}"
+
+    def _decode(self, data):
+        project = {field: None for field in PROJECT_FIELDS}
+        project.update(data)
+        project["id"] = int(project["id"])
+        for field in JSON_FIELDS:
+            if project[field] is not None:
+                project[field] = json.loads(project[field])
+        return project
+
+    def create(self, title, genre, concept):
+        now = timestamp()
+        project_id = self.client.incr(f"{self.prefix}:project_id")
+        record = {"id": project_id, "title": title, "created_at": now, "updated_at": now}
+        record.update({field: value for field, value in (("genre", genre), ("concept", concept)) if value is not None})
+        pipe = self.client.pipeline()
+        pipe.hset(self._key(project_id), mapping=record)
+        pipe.zadd(f"{self.prefix}:projects", {project_id: project_id})
+        pipe.execute()
+        return self.get(project_id)
+
+    def get(self, project_id):
+        data = self.client.hgetall(self._key(project_id))
+        return self._decode(data) if data else None
+
+    def update(self, project_id, field, value):
+        check_fields((field,))
+        now = timestamp()
+        key = self._key(project_id)
+        # Like the SQL UPDATE, a missing project is left alone instead of being recreated
+        if not self.client.exists(key):
+            return now
+        pipe = self.client.pipeline()
+        if value is None:
+            pipe.hdel(key, field)
+        else:
+            pipe.hset(key, field, json.dumps(value) if field in JSON_FIELDS else value)
+        pipe.hset(key, "updated_at", now)
+        pipe.execute()
+        return now
+
+    def save_artifact(self, project_id, outputs, merge_inputs):
+        # Optimistic transaction: WATCH the project, merge, and start over if another replica wrote it
+        # before EXEC, so merge_inputs may run more than once
+        check_fields(outputs)
+        now = timestamp()
+        key = self._key(project_id)
+
+        def merge(pipe):
+            data = pipe.hgetall(key)
+            if not data:
+                return None
+            values = dict(outputs, artifact_inputs=merge_inputs(self._decode(data)))
+            pipe.multi()
+            for field, value in values.items():
+                if value is None:
+                    pipe.hdel(key, field)
+                else:
+                    pipe.hset(key, field, json.dumps(value) if field in JSON_FIELDS else value)
+            pipe.hset(key, "updated_at", now)
+            return now
+
+        return self.client.transaction(merge, key, value_from_callable=True)
+
+    def list_summaries(self):
+        project_ids = self.client.zrange(f"{self.prefix}:projects", 0, -1)
+        pipe = self.client.pipeline()
+        for project_id in project_ids:
+            pipe.hmget(self._key(project_id), "title", "updated_at")
+        return [{"id": int(project_id), "title": title, "updated_at": updated_at}
+                for project_id, (title, updated_at) in zip(project_ids, pipe.execute()) if title is not None]
+
+    def delete(self, project_id):
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(project_id))
+        pipe.zrem(f"{self.prefix}:projects", project_id)
+        pipe.execute()
+
+    def close(self):
+        pass
+
+
+class CachedProjectStore:
+    """Read-through in-process cache in front of a shared project store.
+
+    Reads are answered from memory for up to ttl seconds; writes go straight to the store and drop
+    the cached copies. Callers get their own copies, so editing one never changes the cache.
+    """
+
+    def __init__(self, store, ttl=DEFAULT_LOCAL_TTL):
+        self.store = store
+        self.local = ReadThroughCache(ttl)
+
+    def create(self, title, genre, concept):
+        project = self.store.create(title, genre, concept)
+        self.local.invalidate("summaries")
+        return project
+
+    def get(self, project_id):
+        return copy.deepcopy(self.local.get(("project", project_id), lambda: self.store.get(project_id)))
+
+    def update(self, project_id, field, value):
+        try:
+            return self.store.update(project_id, field, value)
+        finally:
+            self.local.invalidate(("project", project_id), "summaries")
+
+    def save_artifact(self, project_id, outputs, merge_inputs):
+        # Merged in the store itself, never from the local copy, which may be ttl seconds old
+        try:
+            return self.store.save_artifact(project_id, outputs, merge_inputs)
+        finally:
+            self.local.invalidate(("project", project_id), "summaries")
+
+    def list_summaries(self):
+        return copy.deepcopy(self.local.get("summaries", self.store.list_summaries))
+
+    def delete(self, project_id):
+        self.store.delete(project_id)
+        self.local.invalidate(("project", project_id), "summaries")
+
+    def invalidate(self, project_id):
+        # For writes made elsewhere that this process knows about, such as a job finished by another replica
+        self.local.invalidate(("project", project_id), "summaries")
+
+    def stats(self):
+        return self.local.stats()
+
+    def close(self):
+        self.store.close()
+
+
+def project_store_from_env():
+    # With VADIS_STATE_LOCAL_TTL=0 every read goes to the shared store
+    return CachedProjectStore(RedisProjectStore() if DEFAULT_STATE_BACKEND == "redis" else ProjectStore())
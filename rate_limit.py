@@ -0,0 +1,200 @@
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+
+import openai
+
+
+DEFAULT_REQUESTS_PER_MINUTE = float(os.environ.get("VADIS_REQUESTS_PER_MINUTE", "500"))
+DEFAULT_TOKENS_PER_MINUTE = float(os.environ.get("VADIS_TOKENS_PER_MINUTE", "300000"))
+DEFAULT_MAX_RETRIES = int(os.environ.get("VADIS_MAX_RETRIES", "5"))
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+)
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.available = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount, now):
+        # Seconds until `amount` is available; requests larger than the bucket wait for a full bucket
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.refill_per_second
+
+    def take(self, amount):
+        self.available -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        self.available = min(self.capacity, self.available + amount)
+
+
+class RateLimiter:
+    """Client-side requests/min and tokens/min budget shared by every agent in the process."""
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self._lock = threading.Lock()
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+
+    def _reserve(self, tokens):
+        # Takes capacity and returns 0 when both buckets allow, otherwise how long to wait
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+            if wait <= 0:
+                self.requests.take(1)
+                self.tokens.take(tokens)
+            return wait
+
+    def _record_throttle(self, waited):
+        with self._lock:
+            self.throttled += 1
+            self.throttled_seconds += waited
+
+    def acquire(self, tokens, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        started = time.monotonic()
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                break
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(f"Rate limit budget not available within {timeout}s")
+            time.sleep(wait)
+        if time.monotonic() - started > 0.001:
+            self._record_throttle(time.monotonic() - started)
+
+    async def acquire_async(self, tokens, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        started = time.monotonic()
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                break
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(f"Rate limit budget not available within {timeout}s")
+            await asyncio.sleep(wait)
+        if time.monotonic() - started > 0.001:
+            self._record_throttle(time.monotonic() - started)
+
+    def refund(self, tokens):
+        # Reservations assume max_tokens; the unused part of the completion is returned
+        if tokens > 0:
+            with self._lock:
+                self.tokens.give_back(tokens)
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            return {
+                "requests_available": self.requests.available,
+                "tokens_available": self.tokens.available,
+                "throttled": self.throttled,
+                "throttled_seconds": self.throttled_seconds,
+            }
+
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # Malformed HTTP-date (TypeError before Python 3.10); the computed backoff applies instead
+        return None
+    return max(parsed.timestamp() - time.time(), 0.0) if parsed else None
+
+
+class RetryPolicy:
+    """Jittered exponential backoff for transient API failures, honoring Retry-After."""
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, base_delay=1.0, max_delay=60.0,
+                 retryable=RETRYABLE_ERRORS):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable = retryable
+        self._lock = threading.Lock()
+        self.retries = 0
+
+    def delay(self, attempt, error):
+        hinted = retry_after_seconds(error)
+        if hinted is not None:
+            return min(hinted, self.max_delay)
+        # Full jitter keeps sessions that failed together from retrying together
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _should_retry(self, attempt, error, give_up_on=()):
+        # give_up_on errors are raised at once, e.g. so the caller can fall back to another model
+        if attempt >= self.max_retries or not isinstance(error, self.retryable) or isinstance(error, give_up_on):
+            return False
+        with self._lock:
+            self.retries += 1
+        return True
+
+    def call(self, func, give_up_on=()):
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except Exception as e:
+                if not self._should_retry(attempt, e, give_up_on):
+                    raise
+                time.sleep(self.delay(attempt, e))
+                attempt += 1
+
+    async def call_async(self, func, give_up_on=()):
+        attempt = 0
+        while True:
+            try:
+                return await func()
+            except Exception as e:
+                if not self._should_retry(attempt, e, give_up_on):
+                    raise
+                await asyncio.sleep(self.delay(attempt, e))
+                attempt += 1
+
+
+# One limiter and retry policy per process so every agent and session draws on the same budget
+default_rate_limiter = RateLimiter()
+default_retry_policy = RetryPolicy()
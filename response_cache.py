@@ -0,0 +1,302 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from semantic_cache import DEFAULT_SEMANTIC_CACHE, SemanticIndex
+from shared_state import DEFAULT_KEY_PREFIX, DEFAULT_LOCAL_TTL, DEFAULT_STATE_BACKEND, ReadThroughCache, redis_client
+
+
+DEFAULT_TTL = float(os.environ.get("VADIS_CACHE_TTL", str(24 * 60 * 60)))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("VADIS_CACHE_MAX_ENTRIES", "512"))
+
+
+def cache_key(model, temperature, system_message, messages, **params):
+    # Content-addressed: identical model settings and conversation hash to the same key
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "system_message": system_message,
+        "messages": messages,
+        "params": params,
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """In-process LRU with a size cap and per-entry expiry."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """On-disk store shared by every process pointing at the same file."""
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def set(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            self._conn.execute("DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            overflow = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class RedisCacheBackend:
+    """Store on a Redis server shared by replicas on several nodes.
+
+    Entries expire through Redis itself; a sorted set of access times enforces max_entries.
+    """
+
+    def __init__(self, client=None, prefix=DEFAULT_KEY_PREFIX, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.client = client if client is not None else redis_client()
+        self.prefix = f"{prefix}:response:"
+        self._index = f"{prefix}:responses"
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.client.zrem(self._index, key)
+            return None
+        self.client.zadd(self._index, {key: time.time()})
+        return value
+
+    def set(self, key, value):
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, value, ex=int(self.ttl) if self.ttl else None)
+        pipe.zadd(self._index, {key: time.time()})
+        pipe.zcard(self._index)
+        overflow = pipe.execute()[-1] - self.max_entries
+        if overflow > 0:
+            evicted = [key for key, _ in self.client.zpopmin(self._index, overflow)]
+            if evicted:
+                self.client.delete(*(self.prefix + key for key in evicted))
+                self.evictions += len(evicted)
+
+    def delete(self, key):
+        pipe = self.client.pipeline()
+        pipe.delete(self.prefix + key)
+        pipe.zrem(self._index, key)
+        pipe.execute()
+
+    def clear(self):
+        keys = self.client.zrange(self._index, 0, -1)
+        pipe = self.client.pipeline()
+        if keys:
+            pipe.delete(*(self.prefix + key for key in keys))
+        pipe.delete(self._index)
+        pipe.execute()
+
+    def __len__(self):
+        # Expired entries count until a lookup or an eviction removes them from the index
+        return self.client.zcard(self._index)
+
+
+class ReadThroughBackend:
+    """Read-through in-process tier in front of a shared backend; writes go to both."""
+
+    def __init__(self, shared, ttl=DEFAULT_LOCAL_TTL):
+        self.shared = shared
+        self.local = ReadThroughCache(ttl)
+
+    @property
+    def evictions(self):
+        return self.shared.evictions
+
+    def get(self, key):
+        return self.local.get(key, lambda: self.shared.get(key))
+
+    def set(self, key, value):
+        self.shared.set(key, value)
+        self.local.invalidate(key)
+
+    def delete(self, key):
+        self.shared.delete(key)
+        self.local.invalidate(key)
+
+    def clear(self):
+        self.shared.clear()
+        self.local.clear()
+
+    def __len__(self):
+        return len(self.shared)
+
+
+class ResponseCache:
+    """Agent-facing cache: wraps a backend and counts hits and misses.
+
+    With a semantic index, a lookup that misses by key falls back to the response of the most similar
+    earlier prompt. similar is (scope, prompt text): the scope must match exactly, the text only closely.
+    """
+
+    def __init__(self, backend=None, semantic=None):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.semantic = semantic
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.semantic_hits = 0
+
+    def get(self, key, similar=None):
+        value = self.backend.get(key)
+        semantic_hit = False
+        if value is None and similar is not None and self.semantic is not None:
+            match = self.semantic.search(*similar)
+            if match is not None:
+                value = self.backend.get(match)
+                if value is None:
+                    self.semantic.discard(match)
+                semantic_hit = value is not None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.semantic_hits += semantic_hit
+        return value
+
+    def set(self, key, value, similar=None):
+        self.backend.set(key, value)
+        if similar is not None and self.semantic is not None:
+            self.semantic.add(key, *similar)
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypasses += 1
+
+    def clear(self):
+        self.backend.clear()
+        if self.semantic is not None:
+            self.semantic.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.backend),
+                "evictions": self.backend.evictions,
+                "semantic_hits": self.semantic_hits,
+            }
+
+
+def cache_from_env():
+    # Follows the shared state backend, so replicas share cached responses unless told otherwise
+    default_backend = "redis" if DEFAULT_STATE_BACKEND == "redis" else "sqlite"
+    backend_name = os.environ.get("VADIS_CACHE_BACKEND", default_backend).lower()
+    # The semantic index is per process even when the responses it points to are shared
+    semantic = SemanticIndex() if DEFAULT_SEMANTIC_CACHE else None
+    if backend_name == "redis":
+        backend = RedisCacheBackend()
+    elif backend_name == "sqlite":
+        path = os.environ.get("VADIS_CACHE_PATH", "vadis_cache.sqlite3")
+        backend = SQLiteCacheBackend(path)
+    else:
+        return ResponseCache(MemoryCacheBackend(), semantic)
+    return ResponseCache(ReadThroughBackend(backend) if DEFAULT_LOCAL_TTL > 0 else backend, semantic)
@@ -0,0 +1,200 @@
+"""Near-duplicate tier of the response cache.
+
+A prompt that misses the exact cache can still reuse the response of a prompt that differs only
+trivially ("redemption, family" vs "family, redemption", one extra word in the notes). Prompts are
+embedded locally as hashed word and character-trigram vectors, kept in one NumPy matrix, and searched
+with a single matrix-vector product. Only prompts of the same request scope are compared: same model,
+settings, system message and earlier turns, and the same numbers in the prompt itself.
+
+Agents opt in per task (near_duplicates=True); only concept generation does, since prompts built
+around a long artifact stay near-identical after that artifact is edited.
+"""
+import functools
+import hashlib
+import os
+import re
+import threading
+from collections import deque
+
+import numpy as np
+
+
+DEFAULT_SEMANTIC_CACHE = os.environ.get("VADIS_SEMANTIC_CACHE", "0") == "1"
+# Cosine similarity a cached prompt must reach to be reused
+DEFAULT_SIMILARITY_THRESHOLD = float(os.environ.get("VADIS_SEMANTIC_THRESHOLD", "0.95"))
+DEFAULT_SEMANTIC_MAX_ENTRIES = int(os.environ.get("VADIS_SEMANTIC_MAX_ENTRIES", "512"))
+DEFAULT_EMBEDDING_DIM = int(os.environ.get("VADIS_SEMANTIC_DIM", "1024"))
+
+# Best-match similarities kept for threshold tuning, and the thresholds they are reported against
+SCORE_WINDOW = 1000
+TUNING_THRESHOLDS = (0.8, 0.85, 0.9, 0.95, 0.98)
+
+WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+FIELD = re.compile(r"^\s*([A-Za-z][A-Za-z ]{0,40}):(.*)$")
+
+
+@functools.lru_cache(maxsize=65536)
+def _feature_slot(feature, dim):
+    # Stable across processes, unlike hash(); the sign bit keeps colliding features from piling up
+    value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return value % dim, 1.0 if value >> 63 else -1.0
+
+
+def features(text):
+    # Words and the character trigrams of each word: order-free, and tolerant of small spelling changes
+    words = WORD.findall(text.lower())
+    grams = [padded[i:i + 3] for padded in (f" {word} " for word in words) for i in range(len(padded) - 2)]
+    return ["w:" + word for word in words] + ["c:" + gram for gram in grams]
+
+
+def fields(text):
+    # "Label: value" lines are compared field by field; all other lines form one free-text field
+    grouped = {}
+    for line in text.splitlines():
+        match = FIELD.match(line)
+        label, value = (match.group(1).strip().lower(), match.group(2)) if match else ("", line)
+        grouped[label] = f"{grouped.get(label, '')} {value}"
+    return grouped
+
+
+def embed(text, dim=DEFAULT_EMBEDDING_DIM):
+    """Unit-length hashed n-gram vector of text; all zeros when it has no words.
+
+    Each field is normalised on its own before they are summed, so the similarity of two prompts is
+    about the mean similarity of their fields: a changed one-word genre weighs as much as long notes.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for label, value in fields(text).items():
+        slots = [_feature_slot(f"{label}|{feature}", dim) for feature in features(value)]
+        if not slots:
+            continue
+        field = np.zeros(dim, dtype=np.float32)
+        indices, signs = zip(*slots)
+        np.add.at(field, np.array(indices), np.array(signs, dtype=np.float32))
+        vector += field / np.linalg.norm(field)
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+def partition(scope, text):
+    # Prompts asking for different counts ("Number of scenes: 12" vs 8) never match, however similar
+    numbers = ",".join(NUMBER.findall(text))
+    digest = hashlib.blake2b(f"{scope}|{numbers}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+class SemanticIndex:
+    """Prompt embeddings mapped to the exact-cache keys of their responses, with LRU eviction."""
+
+    def __init__(self, threshold=DEFAULT_SIMILARITY_THRESHOLD, max_entries=DEFAULT_SEMANTIC_MAX_ENTRIES,
+                 dim=DEFAULT_EMBEDDING_DIM):
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._partitions = np.zeros(self.max_entries, dtype=np.int64)
+        self._last_used = np.zeros(self.max_entries, dtype=np.int64)
+        self._keys = []
+        self._rows = {}
+        self._clock = 0
+        self.lookups = 0
+        self.matches = 0
+        self.admissions = 0
+        self.rejections = 0
+        self.evictions = 0
+        self.stale = 0
+        self.scores = deque(maxlen=SCORE_WINDOW)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._keys)
+
+    def _touch(self, row):
+        self._clock += 1
+        self._last_used[row] = self._clock
+
+    def _remove(self, row):
+        # The last row moves into the freed one, so rows [0, len) stay dense for the search
+        last = len(self._keys) - 1
+        del self._rows[self._keys[row]]
+        if row != last:
+            moved = self._keys[last]
+            self._keys[row] = moved
+            self._rows[moved] = row
+            self._vectors[row] = self._vectors[last]
+            self._partitions[row] = self._partitions[last]
+            self._last_used[row] = self._last_used[last]
+        self._keys.pop()
+
+    def search(self, scope, text):
+        """The cache key of the most similar prompt in scope, or None below the threshold."""
+        vector = embed(text, self.dim)
+        part = partition(scope, text)
+        with self._lock:
+            self.lookups += 1
+            size = len(self._keys)
+            scores = self._vectors[:size] @ vector
+            scores[self._partitions[:size] != part] = 0.0
+            row = int(np.argmax(scores)) if size else None
+            score = max(float(scores[row]), 0.0) if size else 0.0
+            self.scores.append(score)
+            if row is None or score < self.threshold or not vector.any():
+                return None
+            self.matches += 1
+            self._touch(row)
+            return self._keys[row]
+
+    def add(self, key, scope, text):
+        vector = embed(text, self.dim)
+        with self._lock:
+            if not vector.any():
+                self.rejections += 1
+                return False
+            row = self._rows.get(key)
+            if row is None:
+                if len(self._keys) >= self.max_entries:
+                    self._remove(int(np.argmin(self._last_used[:len(self._keys)])))
+                    self.evictions += 1
+                row = len(self._keys)
+                self._keys.append(key)
+                self._rows[key] = row
+                self.admissions += 1
+            self._vectors[row] = vector
+            self._partitions[row] = partition(scope, text)
+            self._touch(row)
+            return True
+
+    def discard(self, key):
+        # The exact cache no longer holds the response (expired or evicted), so the match was useless
+        with self._lock:
+            row = self._rows.get(key)
+            if row is not None:
+                self._remove(row)
+                self.stale += 1
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+            self._rows.clear()
+
+    def stats(self):
+        with self._lock:
+            scores = np.array(self.scores, dtype=np.float32)
+            return {
+                "entries": len(self._keys),
+                "lookups": self.lookups,
+                "matches": self.matches,
+                "threshold": self.threshold,
+                "admissions": self.admissions,
+                "rejections": self.rejections,
+                "evictions": self.evictions,
+                "stale": self.stale,
+                "mean_best_similarity": float(scores.mean()) if scores.size else None,
+                # Share of recent lookups that would have matched at each candidate threshold
+                "match_rate_at": {threshold: float((scores >= threshold).mean()) if scores.size else 0.0
+                                  for threshold in TUNING_THRESHOLDS},
+            }
@@ -0,0 +1,99 @@
+"""Where the state shared by every app replica lives: project records, job status and the response cache.
+
+With the default "sqlite" backend they are SQLite files (WAL mode), which every process on one machine
+can share. The "redis" backend keeps them on a Redis server, so replicas on several nodes can serve one
+deployment without sticky sessions. Either way, recently read records are served from a read-through
+in-process cache for a short time; writes made through this process drop its copy at once.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # only needed for VADIS_STATE_BACKEND=redis
+    redis = None
+
+
+DEFAULT_STATE_BACKEND = os.environ.get("VADIS_STATE_BACKEND", "sqlite").lower()
+DEFAULT_REDIS_URL = os.environ.get("VADIS_REDIS_URL", "redis://127.0.0.1:6379/0")
+# Prefix of every Redis key, so several deployments can share one server
+DEFAULT_KEY_PREFIX = os.environ.get("VADIS_STATE_PREFIX", "vadis")
+# Seconds a record read from the shared backend is served from memory; 0 reads through every time
+DEFAULT_LOCAL_TTL = float(os.environ.get("VADIS_STATE_LOCAL_TTL", "2"))
+DEFAULT_LOCAL_ENTRIES = int(os.environ.get("VADIS_STATE_LOCAL_ENTRIES", "256"))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def redis_client(url=DEFAULT_REDIS_URL):
+    # One client (and connection pool) per URL and process, shared by the project store, job queue and cache
+    if redis is None:
+        raise RuntimeError("VADIS_STATE_BACKEND=redis needs the redis package: pip install redis")
+    with _clients_lock:
+        if url not in _clients:
+            _clients[url] = redis.Redis.from_url(url, decode_responses=True)
+        return _clients[url]
+
+
+class ReadThroughCache:
+    """Recently read shared records held in process for ttl seconds, with a size cap.
+
+    Records written by other replicas show up here after at most ttl seconds.
+    """
+
+    def __init__(self, ttl=DEFAULT_LOCAL_TTL, max_entries=DEFAULT_LOCAL_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Bumped by every local write, so a load that overlapped one is not cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        """The cached value for key, or load() when there is none; a None from load is not cached."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+        value = load()
+        if value is not None and self.ttl > 0:
+            with self._lock:
+                if generation != self._generation:
+                    return value
+                self._entries[key] = (value, now + self.ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "ttl": self.ttl,
+            }
@@ -0,0 +1,218 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _StreamCall:
+    # Buffers every chunk so callers that join late still replay the stream from the start
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def feed(self, iterator):
+        try:
+            for chunk in iterator:
+                with self.condition:
+                    self.chunks.append(chunk)
+                    self.condition.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+
+    def read(self):
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.finished:
+                    self.condition.wait()
+                pending = self.chunks[index:]
+                index += len(pending)
+                finished = self.finished and index >= len(self.chunks)
+            yield from pending
+            if finished:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class _AsyncStreamCall:
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.condition = asyncio.Condition()
+        self.task = None
+
+    async def feed(self, agen):
+        try:
+            async for chunk in agen:
+                async with self.condition:
+                    self.chunks.append(chunk)
+                    self.condition.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            async with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+
+    async def read(self):
+        index = 0
+        while True:
+            async with self.condition:
+                while index >= len(self.chunks) and not self.finished:
+                    await self.condition.wait()
+                pending = self.chunks[index:]
+                index += len(pending)
+                finished = self.finished and index >= len(self.chunks)
+            for chunk in pending:
+                yield chunk
+            if finished:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """Coalesces concurrent identical requests: one upstream call, every caller gets its result.
+
+    Keys are prompt hashes, so callers from different Streamlit sessions in the same
+    process share one in-flight generation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+        self._async_calls = {}
+        self._async_streams = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, table, key, factory):
+        with self._lock:
+            call = table.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = factory()
+            table[key] = call
+            self.leaders += 1
+            return call, True
+
+    def _release(self, table, key, call):
+        with self._lock:
+            if table.get(key) is call:
+                del table[key]
+
+    def do(self, key, func):
+        call, leader = self._join(self._calls, key, _Call)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._release(self._calls, key, call)
+            call.done.set()
+
+    def stream(self, key, func):
+        # The upstream stream is drained on its own thread, so it completes (and gets cached)
+        # even if the caller that started it goes away
+        call, leader = self._join(self._streams, key, _StreamCall)
+        if leader:
+            def run():
+                try:
+                    call.feed(func())
+                finally:
+                    self._release(self._streams, key, call)
+            threading.Thread(target=run, name="vadis-single-flight", daemon=True).start()
+        return call.read()
+
+    async def do_async(self, key, func):
+        # Async callers are keyed per event loop; futures cannot be awaited across loops
+        loop = asyncio.get_running_loop()
+        call, leader = self._join(self._async_calls, (id(loop), key), loop.create_future)
+        if not leader:
+            return await asyncio.shield(call)
+        try:
+            result = await func()
+            call.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+        except BaseException as e:
+            call.set_exception(e)
+            # Mark retrieved so a failure nobody else awaited is not logged as unhandled
+            call.exception()
+            raise
+        finally:
+            self._release(self._async_calls, (id(loop), key), call)
+
+    async def stream_async(self, key, func):
+        loop = asyncio.get_running_loop()
+        call, leader = self._join(self._async_streams, (id(loop), key), _AsyncStreamCall)
+        if leader:
+            async def run():
+                try:
+                    await call.feed(func())
+                finally:
+                    self._release(self._async_streams, (id(loop), key), call)
+            # Keep a reference so the feeding task is not garbage collected mid-stream
+            call.task = loop.create_task(run())
+        async for chunk in call.read():
+            yield chunk
+
+    def stats(self):
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._streams) + len(self._async_calls) + len(self._async_streams),
+            }
+
+
+class NoFlight:
+    """Drop-in for SingleFlight that shares nothing: every call runs on the caller's thread.
+
+    stream() hands back the upstream iterator itself, so a caller that stops reading closes
+    the HTTP response instead of leaving a drain thread to finish (and pay for) the completion.
+    """
+
+    def do(self, key, func):
+        return func()
+
+    def stream(self, key, func):
+        return func()
+
+    async def do_async(self, key, func):
+        return await func()
+
+    async def stream_async(self, key, func):
+        async for chunk in func():
+            yield chunk
+
+    def stats(self):
+        return {"leaders": 0, "coalesced": 0, "in_flight": 0}
+
+
+# Process-wide, so identical generations from different sessions meet here
+default_single_flight = SingleFlight()
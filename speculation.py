@@ -0,0 +1,199 @@
+"""Speculative pre-generation of the pipeline step a user is likely to ask for next.
+
+While the user reads the generated concepts, the treatment of each one is already being written;
+once a treatment exists, so is the outline. A background job whose request matches a speculation
+of its own session (same node and input fingerprint) takes its result instead of making a new call. Speculations the
+user did not pick are cancelled, and each session may start only a limited number of them per
+budget window.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_SPECULATION = os.environ.get("VADIS_SPECULATION", "0") == "1"
+# Speculative generations one session may start per window of this many seconds
+DEFAULT_SPECULATION_BUDGET = int(os.environ.get("VADIS_SPECULATION_BUDGET", "6"))
+DEFAULT_SPECULATION_BUDGET_WINDOW = float(os.environ.get("VADIS_SPECULATION_BUDGET_WINDOW", "3600"))
+DEFAULT_SPECULATION_WORKERS = int(os.environ.get("VADIS_SPECULATION_WORKERS", "3"))
+# Finished speculations nobody asked for are dropped after this many seconds
+DEFAULT_SPECULATION_TTL = float(os.environ.get("VADIS_SPECULATION_TTL", "900"))
+
+PENDING_STATUSES = ("queued", "running")
+
+
+class SpeculationCancelled(Exception):
+    pass
+
+
+class Speculation:
+    def __init__(self, key, session_id):
+        self.key = key
+        self.session_id = session_id
+        self.status = "queued"
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.finished_at = None
+        self.started_at = time.monotonic()
+        self.future = None
+        self.cancelled = threading.Event()
+        self.condition = threading.Condition()
+
+    def on_delta(self, delta):
+        # Raising here ends the stream, which closes the HTTP response of an abandoned speculation
+        if self.cancelled.is_set():
+            raise SpeculationCancelled(self.key)
+        if not delta:
+            return
+        with self.condition:
+            self.chunks.append(delta)
+            self.condition.notify_all()
+
+    def finish(self, status, result=None, error=None):
+        with self.condition:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.monotonic()
+            self.condition.notify_all()
+
+
+class Speculator:
+    """Runs speculative generations on a small thread pool and hands matching results to real requests."""
+
+    def __init__(self, max_workers=DEFAULT_SPECULATION_WORKERS, budget=DEFAULT_SPECULATION_BUDGET,
+                 ttl=DEFAULT_SPECULATION_TTL, budget_window=DEFAULT_SPECULATION_BUDGET_WINDOW):
+        self.budget = budget
+        self.ttl = ttl
+        self.budget_window = budget_window
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="vadis-speculation")
+        self._lock = threading.Lock()
+        # (session id, input fingerprint) -> Speculation; a session only ever takes its own, which was
+        # made with its API key
+        self._speculations = {}
+        # session id -> start times of its speculations in the current budget window
+        self._spent = {}
+        self.started = 0
+        self.hits = 0
+        self.cancelled = 0
+        self.wasted = 0
+        self.failed = 0
+        self.over_budget = 0
+
+    def _expire(self):
+        now = time.monotonic()
+        for key, speculation in list(self._speculations.items()):
+            if speculation.finished_at is not None and now - speculation.finished_at > self.ttl:
+                del self._speculations[key]
+                self.wasted += 1
+        # Sessions end without notice, so their budget entries go once the window has passed them
+        for session_id, started in list(self._spent.items()):
+            while started and now - started[0] > self.budget_window:
+                started.popleft()
+            if not started:
+                del self._spent[session_id]
+
+    def speculate(self, session_id, key, func):
+        """Starts func(on_delta) in the background unless the session already speculates on key or its
+        budget for the window is spent. Returns True when a speculation was started.
+
+        func may raise SpeculationCancelled from on_delta; one that does not stream should still call
+        on_delta("") before its request, so a speculation cancelled while queued for it stops there.
+        """
+        with self._lock:
+            self._expire()
+            if (session_id, key) in self._speculations:
+                return False
+            if len(self._spent.get(session_id, ())) >= self.budget:
+                self.over_budget += 1
+                return False
+            speculation = Speculation(key, session_id)
+            self._spent.setdefault(session_id, deque()).append(speculation.started_at)
+            self._speculations[session_id, key] = speculation
+            self.started += 1
+        speculation.future = self._executor.submit(self._run, speculation, func)
+        return True
+
+    def _run(self, speculation, func):
+        if speculation.cancelled.is_set():
+            speculation.finish("cancelled")
+            return
+        with speculation.condition:
+            speculation.status = "running"
+        try:
+            result = func(speculation.on_delta)
+        except SpeculationCancelled:
+            speculation.finish("cancelled")
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            speculation.finish("failed", error=e)
+        else:
+            speculation.finish("done", result)
+
+    def take(self, session_id, key, on_delta=None):
+        """The result the session speculated for key, waiting for it if it is still running; None if
+        there is none.
+
+        Text streamed so far is replayed to on_delta, then the rest as it arrives.
+        """
+        with self._lock:
+            speculation = self._speculations.pop((session_id, key), None)
+        if speculation is None:
+            return None
+        index = 0
+        while True:
+            with speculation.condition:
+                while index >= len(speculation.chunks) and speculation.status in PENDING_STATUSES:
+                    speculation.condition.wait()
+                pending = speculation.chunks[index:]
+                index += len(pending)
+                finished = speculation.status not in PENDING_STATUSES and index >= len(speculation.chunks)
+            if on_delta is not None:
+                for chunk in pending:
+                    on_delta(chunk)
+            if finished:
+                break
+        if speculation.status != "done":
+            return None
+        with self._lock:
+            self.hits += 1
+        return speculation.result
+
+    def cancel(self, session_id, keep=()):
+        # Drops the session's speculations other than keep: queued ones never start, running
+        # ones stop at their next streamed chunk, finished ones are discarded
+        with self._lock:
+            losers = [speculation for (owner, key), speculation in self._speculations.items()
+                      if owner == session_id and key not in keep]
+            for speculation in losers:
+                del self._speculations[session_id, speculation.key]
+                speculation.cancelled.set()
+                if speculation.status == "done":
+                    self.wasted += 1
+                    continue
+                self.cancelled += 1
+                if speculation.future is not None and speculation.future.cancel():
+                    # Never started, so it does not count against the budget
+                    started = self._spent.get(session_id)
+                    if started and speculation.started_at in started:
+                        started.remove(speculation.started_at)
+                    speculation.finish("cancelled")
+        return len(losers)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.started if self.started else 0.0,
+                "cancelled": self.cancelled,
+                "wasted": self.wasted,
+                "failed": self.failed,
+                "over_budget": self.over_budget,
+                "pending": sum(1 for speculation in self._speculations.values()
+                               if speculation.status in PENDING_STATUSES),
+            }
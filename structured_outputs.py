@@ -0,0 +1,209 @@
+import json
+import os
+
+
+# "json_schema" has the API enforce the schema (gpt-4o-2024-08-06 and later); "json_object"
+# only guarantees valid JSON, with the schema given in the prompt, for older models
+STRUCTURED_OUTPUT_MODE = os.environ.get("VADIS_STRUCTURED_OUTPUT_MODE", "json_schema")
+
+
+class StructuredOutputError(ValueError):
+    pass
+
+
+def strict_object(**properties):
+    # Strict mode requires every property to be listed as required and no extras allowed
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+def array_of(items):
+    return {"type": "array", "items": items}
+
+
+STRING = {"type": "string"}
+INTEGER = {"type": "integer"}
+COST_LEVEL = {"type": "string", "enum": ["high", "medium", "low"]}
+
+
+def validate(value, schema, path="$"):
+    expected = schema.get("type")
+    if expected == "object":
+        if not isinstance(value, dict):
+            raise StructuredOutputError(f"{path} should be an object")
+        for name in schema.get("required", []):
+            if name not in value:
+                raise StructuredOutputError(f"{path}.{name} is missing")
+        for name, subschema in schema.get("properties", {}).items():
+            if name in value:
+                validate(value[name], subschema, f"{path}.{name}")
+    elif expected == "array":
+        if not isinstance(value, list):
+            raise StructuredOutputError(f"{path} should be an array")
+        for index, item in enumerate(value):
+            validate(item, schema["items"], f"{path}[{index}]")
+    elif expected == "string":
+        if not isinstance(value, str):
+            raise StructuredOutputError(f"{path} should be a string")
+        if "enum" in schema and value not in schema["enum"]:
+            raise StructuredOutputError(f"{path} should be one of {schema['enum']}")
+    elif expected == "integer":
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise StructuredOutputError(f"{path} should be an integer")
+
+
+class OutputSchema:
+    """A JSON schema an agent can be asked to answer in, plus its Markdown rendering."""
+
+    def __init__(self, name, schema, render):
+        self.name = name
+        self.schema = schema
+        self._render = render
+
+    def response_format(self, mode=STRUCTURED_OUTPUT_MODE):
+        if mode == "json_object":
+            return {"type": "json_object"}
+        return {"type": "json_schema", "json_schema": {"name": self.name, "schema": self.schema, "strict": True}}
+
+    def instructions(self, mode=STRUCTURED_OUTPUT_MODE):
+        if mode == "json_object":
+            return f"\n        Respond only with a JSON object that follows this JSON schema:\n        {json.dumps(self.schema)}\n"
+        return "\n        Respond only with JSON that follows the provided schema.\n"
+
+    def parse(self, content):
+        try:
+            data = json.loads(content)
+        except (TypeError, ValueError) as e:
+            raise StructuredOutputError(f"response is not valid JSON: {e}") from e
+        validate(data, self.schema)
+        return data
+
+    def render(self, data):
+        return self._render(data)
+
+
+def render_concept(concept):
+    selling_points = "\n".join(f"- {point}" for point in concept["selling_points"])
+    return (
+        f"**{concept['title']}**\n\n"
+        f"**Logline:** {concept['logline']}\n\n"
+        f"{concept['synopsis']}\n\n"
+        f"**Key selling points**\n{selling_points}\n\n"
+        f"**Audience appeal:** {concept['audience_appeal']}"
+    )
+
+
+def render_concepts(data):
+    return "\n\n".join(
+        f"### CONCEPT {index}: {concept['title']}\n\n{render_concept(concept)}"
+        for index, concept in enumerate(data["concepts"], start=1)
+    )
+
+
+def render_outline(data):
+    # Same "Scene N" layout that agents.parse_script_outline reads back for the full draft
+    return "\n\n".join(
+        f"Scene {scene['number']}: {scene['heading']}\n"
+        f"Setting: {scene['setting']}\n"
+        f"Characters present: {', '.join(scene['characters'])}\n"
+        f"Summary of the action: {scene['action']}\n"
+        f"Purpose: {scene['purpose']}"
+        for scene in data["scenes"]
+    )
+
+
+def render_cast(data):
+    sections = []
+    for role in data["roles"]:
+        lines = [f"### {role['character']}"]
+        for suggestion in role["suggestions"]:
+            similar = ", ".join(suggestion["similar_roles"])
+            lines.append(f"- **{suggestion['actor']}**: {suggestion['rationale']} (Similar roles: {similar})")
+        lines.append(f"\n*Considerations:* {role['challenges']}")
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def render_locations(data):
+    return "\n\n".join(
+        f"### {setting['setting']}\n"
+        f"- **Primary location:** {setting['primary_location']}\n"
+        f"- **Alternatives:** {', '.join(setting['alternatives'])}\n"
+        f"- **Benefits:** {setting['benefits']}\n"
+        f"- **Practical considerations:** {setting['practical_considerations']}\n"
+        f"- **Cost impact:** {setting['cost_impact']}"
+        for setting in data["settings"]
+    )
+
+
+def render_placements(data):
+    return "\n\n".join(
+        f"### {index}. {placement['category']}: {placement['scene']}\n"
+        f"- **Brands:** {', '.join(placement['brands'])}\n"
+        f"- **Integration:** {placement['integration']}\n"
+        f"- **Why it works:** {placement['rationale']}\n"
+        f"- **Value tier:** {placement['value_tier']}"
+        for index, placement in enumerate(data["placements"], start=1)
+    )
+
+
+CONCEPT = OutputSchema("film_concept", strict_object(
+    title=STRING,
+    logline=STRING,
+    synopsis=STRING,
+    selling_points=array_of(STRING),
+    audience_appeal=STRING,
+), render_concept)
+
+CONCEPTS = OutputSchema("film_concepts", strict_object(
+    concepts=array_of(CONCEPT.schema),
+), render_concepts)
+
+SCRIPT_OUTLINE = OutputSchema("script_outline", strict_object(
+    scenes=array_of(strict_object(
+        number=INTEGER,
+        heading=STRING,
+        setting=STRING,
+        characters=array_of(STRING),
+        action=STRING,
+        purpose=STRING,
+    )),
+), render_outline)
+
+CAST = OutputSchema("cast_suggestions", strict_object(
+    roles=array_of(strict_object(
+        character=STRING,
+        suggestions=array_of(strict_object(
+            actor=STRING,
+            rationale=STRING,
+            similar_roles=array_of(STRING),
+        )),
+        challenges=STRING,
+    )),
+), render_cast)
+
+LOCATIONS = OutputSchema("location_suggestions", strict_object(
+    settings=array_of(strict_object(
+        setting=STRING,
+        primary_location=STRING,
+        alternatives=array_of(STRING),
+        benefits=STRING,
+        practical_considerations=STRING,
+        cost_impact=COST_LEVEL,
+    )),
+), render_locations)
+
+PLACEMENTS = OutputSchema("product_placements", strict_object(
+    placements=array_of(strict_object(
+        scene=STRING,
+        category=STRING,
+        brands=array_of(STRING),
+        integration=STRING,
+        rationale=STRING,
+        value_tier=COST_LEVEL,
+    )),
+), render_placements)
@@ -0,0 +1,16 @@
+import os
+import sys
+
+# The modules live at the top level of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from benchmarks.mock_openai_server import MockConfig, MockOpenAIServer
+
+
+@pytest.fixture
+def mock_server():
+    # The OpenAI-compatible stand-in from benchmarks/, answering at once
+    with MockOpenAIServer(config=MockConfig(latency_ms=0, completion_tokens=60, seed=0)) as server:
+        yield server
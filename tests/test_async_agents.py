@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+from agents import AsyncFilmAISystem, FilmAISystem, SyncFilmAISystem
+from async_runtime import SyncFacade
+from metrics import CallMetrics
+from rate_limit import RateLimiter
+from response_cache import ResponseCache
+from single_flight import NoFlight
+
+PROJECT = {"title": "Dune", "genre": "Drama", "concept": "A desert planet", "treatment": "Act one",
+           "script_outline": "Scene 1 - INT. TENT - NIGHT"}
+
+
+def agent_options():
+    return dict(single_flight=NoFlight(), metrics=CallMetrics(),
+                rate_limiter=RateLimiter(requests_per_minute=1000, tokens_per_minute=10 ** 7))
+
+
+@pytest.fixture
+def async_system(mock_server):
+    client = openai.AsyncOpenAI(api_key="sk-test", base_url=mock_server.base_url, max_retries=0)
+    return AsyncFilmAISystem("sk-test", client=client, **agent_options())
+
+
+@pytest.fixture
+def sync_system(mock_server):
+    client = openai.OpenAI(api_key="sk-test", base_url=mock_server.base_url, max_retries=0)
+    return FilmAISystem("sk-test", client=client, **agent_options())
+
+
+def test_async_agents_match_the_sync_ones(async_system, sync_system):
+    async def main():
+        text = await async_system.develop_treatment("A desert planet")
+        chunks = [chunk async for chunk in async_system.develop_treatment("A desert planet", stream=True)]
+        return text, chunks
+
+    text, chunks = asyncio.run(main())
+    assert text == sync_system.develop_treatment("A desert planet")
+    assert "".join(chunks) == text and len(chunks) > 1
+
+
+def test_async_agents_use_the_cache(mock_server):
+    client = openai.AsyncOpenAI(api_key="sk-test", base_url=mock_server.base_url, max_retries=0)
+    system = AsyncFilmAISystem("sk-test", client=client, cache=ResponseCache(), **agent_options())
+
+    async def main():
+        first = await system.suggest_cast("A fisherman", "low")
+        return first, await system.suggest_cast("A fisherman", "low")
+
+    first, second = asyncio.run(main())
+    assert first == second
+    assert mock_server.stats.snapshot()["requests"] == 1
+
+
+def test_async_downstream_assets_run_concurrently(async_system, mock_server):
+    mock_server.config.latency_ms = 200
+    started = time.monotonic()
+    results = asyncio.run(async_system.generate_downstream_assets(PROJECT))
+    assert time.monotonic() - started < 0.6
+    assert set(results) == {"cast_suggestions", "location_suggestions", "product_placements", "marketing_assets"}
+
+
+def test_sync_facade_drives_async_agents_from_plain_threads(mock_server):
+    client = openai.AsyncOpenAI(api_key="sk-test", base_url=mock_server.base_url, max_retries=0)
+    system = SyncFilmAISystem(AsyncFilmAISystem("sk-test", client=client, **agent_options()))
+    text = system.develop_treatment("A desert planet")
+    assert isinstance(text, str) and text
+    assert "".join(system.develop_treatment("A desert planet", stream=True)) == text
+    landed = []
+    results = system.generate_downstream_assets(PROJECT, on_result=lambda key, value: landed.append(key))
+    assert set(results) == set(landed) and len(results) == 4
+
+
+def test_sync_facade_passes_through_plain_attributes():
+    class Target:
+        name = "target"
+
+        async def double(self, value):
+            await asyncio.sleep(0)
+            return value * 2
+
+        async def count(self, limit):
+            for number in range(limit):
+                yield number
+
+        def plain(self):
+            return "plain"
+
+    facade = SyncFacade(Target())
+    assert facade.name == "target"
+    assert facade.double(21) == 42
+    assert list(facade.count(3)) == [0, 1, 2]
+    assert facade.plain() == "plain"
@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+
+import openai
+
+from agents import FilmConceptAgent, GenerationError
+from batch_concepts import (_repair_tail, collect_batch_output, execute_batch_file, load_inputs, read_records,
+                            run_batch, run_bounded, write_batch_file)
+from metrics import CallMetrics
+from rate_limit import RateLimiter
+from single_flight import NoFlight
+
+INPUTS = [(f"row-{number}", {"genre": "Drama", "themes": f"theme {number}"}, 2) for number in range(1, 5)]
+
+
+class SweepAgent:
+    # Stands in for FilmConceptAgent; rows whose themes are in `failing` raise
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate_concepts(self, user_inputs, num_concepts=3, structured=False):
+        with self._lock:
+            self.calls.append(user_inputs["themes"])
+        if user_inputs["themes"] in self.failing:
+            raise GenerationError("FilmConceptAgent", RuntimeError("quota"))
+        return {"concepts": [{"title": user_inputs["themes"]}] * num_concepts}
+
+
+def test_inputs_load_from_csv_and_jsonl(tmp_path):
+    csv_path = tmp_path / "sweep.csv"
+    csv_path.write_text("genre,themes,num_concepts\nDrama,memory,2\nComedy,,\n")
+    assert load_inputs(str(csv_path)) == [("row-1", {"genre": "Drama", "themes": "memory"}, 2),
+                                          ("row-2", {"genre": "Comedy"}, 3)]
+    jsonl_path = tmp_path / "sweep.jsonl"
+    jsonl_path.write_text(json.dumps({"id": "a", "genre": "Drama", "ignored": "x"}) + "\n\n")
+    assert load_inputs(str(jsonl_path)) == [("a", {"genre": "Drama"}, 3)]
+
+
+def test_repair_tail_drops_a_half_written_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_bytes(b'{"id": "row-1"}\n{"id": "ro')
+    _repair_tail(str(path))
+    assert path.read_bytes() == b'{"id": "row-1"}\n'
+    path.write_bytes(b'{"id": "ro')
+    _repair_tail(str(path))
+    assert path.read_bytes() == b""
+    _repair_tail(str(tmp_path / "missing.jsonl"))
+
+
+def test_later_records_supersede_earlier_ones(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"id": "a", "error": "quota"}\nnot json\n{"id": "a", "error": null}\n')
+    assert read_records(str(path)) == {"a": {"id": "a", "error": None}}
+
+
+def test_run_bounded_caps_rows_in_flight():
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def work(item):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        if item == 3:
+            raise ValueError(item)
+        return item * 2
+
+    results = {item: (result, error) for item, result, error in run_bounded(work, range(8), 3)}
+    assert peak[0] == 3
+    assert results[2] == (4, None) and isinstance(results[3][1], ValueError)
+
+
+def test_resume_skips_completed_rows_and_retries_failures(tmp_path):
+    output = str(tmp_path / "concepts.jsonl")
+    agent = SweepAgent(failing={"theme 2"})
+    assert run_batch(agent, INPUTS, output, max_concurrency=2) == {"completed": 3, "failed": 1, "skipped": 0}
+
+    # A crash mid-write leaves a partial line behind
+    with open(output, "a") as f:
+        f.write('{"id": "row-9", "conc')
+    agent = SweepAgent()
+    assert run_batch(agent, INPUTS, output) == {"completed": 1, "failed": 0, "skipped": 3}
+    assert agent.calls == ["theme 2"]
+    records = read_records(output)
+    assert set(records) == {"row-1", "row-2", "row-3", "row-4"}
+    assert all(record["error"] is None for record in records.values())
+    assert records["row-2"]["concepts"] == [{"title": "theme 2"}] * 2
+    assert run_batch(agent, INPUTS, output) == {"completed": 0, "failed": 0, "skipped": 4}
+
+
+def test_batch_file_round_trip_against_the_mock_server(tmp_path, mock_server):
+    client = openai.OpenAI(api_key="sk-test", base_url=mock_server.base_url, max_retries=0)
+    agent = FilmConceptAgent("sk-test", client=client, single_flight=NoFlight(), metrics=CallMetrics(log_path=""),
+                             rate_limiter=RateLimiter(requests_per_minute=1000, tokens_per_minute=10 ** 7))
+    batch_path, batch_output, output = (str(tmp_path / name) for name in ("in.jsonl", "raw.jsonl", "out.jsonl"))
+    assert write_batch_file(agent, INPUTS[:2], batch_path) == 2
+    request = json.loads(open(batch_path).readline())
+    assert request["custom_id"] == "row-1" and request["body"]["response_format"]
+
+    assert execute_batch_file(client, batch_path, batch_output) == {"completed": 2, "failed": 0, "skipped": 0}
+    assert execute_batch_file(client, batch_path, batch_output)["skipped"] == 2
+    assert collect_batch_output(batch_output, output, INPUTS) == {"completed": 2, "failed": 0}
+    records = read_records(output)
+    assert records["row-1"]["user_inputs"] == INPUTS[0][1]
+    assert records["row-1"]["concepts"][0]["title"]
@@ -0,0 +1,106 @@
+import json
+
+import openai
+import pytest
+
+from benchmarks.mock_openai_server import synthetic_completion
+from benchmarks.run_benchmarks import (STEPS, deep_sizeof, find_regressions, format_report, main, percentile,
+                                       run_workload, summarize)
+from metrics import cached_prompt_tokens
+from structured_outputs import CONCEPTS
+
+
+@pytest.fixture
+def client(mock_server):
+    return openai.OpenAI(api_key="sk-test", base_url=mock_server.base_url, max_retries=0)
+
+
+def chat(client, content="Write a scene.", **params):
+    return client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": content}], **params)
+
+
+def test_mock_server_returns_n_deterministic_choices(client, mock_server):
+    first, second = chat(client, n=3), chat(client, n=3)
+    texts = [choice.message.content for choice in first.choices]
+    assert len(set(texts)) == 3
+    assert texts == [choice.message.content for choice in second.choices]
+    assert first.usage.completion_tokens > 0
+    assert mock_server.stats.snapshot()["requests"] == 2
+
+
+def test_mock_server_streams_the_same_text(client, mock_server):
+    streamed = "".join(chunk.choices[0].delta.content or "" for chunk in chat(client, stream=True))
+    assert streamed == chat(client).choices[0].message.content
+    assert mock_server.stats.snapshot()["streamed"] == 1
+
+
+def test_mock_server_fills_json_schemas(client):
+    response = chat(client, response_format=CONCEPTS.response_format("json_schema"))
+    assert CONCEPTS.parse(response.choices[0].message.content)
+
+
+def test_mock_server_injects_errors(client, mock_server):
+    mock_server.config.error_rate = 1.0
+    with pytest.raises(openai.RateLimitError):
+        chat(client)
+    mock_server.config.error_status = 500
+    with pytest.raises(openai.InternalServerError):
+        chat(client)
+    assert mock_server.stats.snapshot()["errors"] == 2
+
+
+def test_mock_server_reports_repeated_prefixes_as_cached(client):
+    system = {"role": "system", "content": "Stable instructions. " * 400}
+    usages = [client.chat.completions.create(
+        model="gpt-4o", messages=[system, {"role": "user", "content": f"Request {index}"}]).usage
+        for index in range(2)]
+    assert cached_prompt_tokens(usages[0]) == 0
+    assert cached_prompt_tokens(usages[1]) >= 1024
+
+
+def test_synthetic_outline_has_the_requested_scenes():
+    outline = synthetic_completion("Create a script outline.\nNumber of scenes: 5", 200)
+    assert outline.count("Scene ") == 5
+
+
+def test_percentile_uses_nearest_rank():
+    assert percentile([], 0.5) is None
+    assert percentile([3, 1, 2, 4], 0.5) == 2
+    assert percentile(list(range(1, 101)), 0.95) == 95
+
+
+def test_deep_sizeof_counts_shared_values_once():
+    text = "x" * 10000
+    assert deep_sizeof({"a": text, "b": text}) < deep_sizeof({"a": text, "b": "y" * 10000})
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_workload_completes_every_session(mock_server, mode):
+    recorders, elapsed, extra = run_workload(mock_server.base_url, users=2, mode=mode)
+    report = summarize(recorders, elapsed, extra)
+    assert report["completed_sessions"] == 2 and report["errors"] == {}
+    assert set(report["steps"]) == set(STEPS)
+    assert all(report["steps"][step]["count"] == 2 for step in STEPS)
+    assert "2 users, 2 completed" in format_report(report)
+
+
+def test_regressions_are_found_against_a_baseline():
+    baseline = {"users": 2, "completed_sessions": 2, "throughput_sessions_per_second": 10.0,
+                "steps": {"concept": {"p95": 1.0}}}
+    report = {"users": 2, "completed_sessions": 1, "throughput_sessions_per_second": 7.0,
+              "steps": {"concept": {"p95": 1.5}}}
+    assert len(find_regressions(report, baseline, 0.2)) == 3
+    assert find_regressions(dict(baseline), baseline, 0.2) == []
+
+
+def test_main_gates_on_the_baseline(tmp_path, capsys):
+    results = tmp_path / "results.json"
+    options = ["--users", "1", "--latency-ms", "0", "--completion-tokens", "40", "--json", str(results)]
+    assert main(options) == 0
+    report = json.loads(results.read_text())
+    assert report["server"]["requests"] > 0
+    report["throughput_sessions_per_second"] *= 1000
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(report))
+    assert main(options + ["--baseline", str(baseline)]) == 1
+    assert "Regressions against baseline" in capsys.readouterr().out
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import types
+
+import openai
+import pytest
+
+from agents import AsyncFilmConceptAgent, FilmConceptAgent, GenerationError
+from metrics import CallMetrics
+from model_routing import ModelRouter
+from rate_limit import RateLimiter, RetryPolicy
+from response_cache import ResponseCache
+from single_flight import NoFlight
+from structured_outputs import CONCEPT
+
+INPUTS = {"genre": "Drama", "themes": "memory"}
+CONCEPT_DATA = {"title": "Dune", "logline": "Sand.", "synopsis": "Spice.", "selling_points": ["Scale"],
+                "audience_appeal": "Adults"}
+
+
+def router(supports_n):
+    return ModelRouter({"FilmConceptAgent.generate_concepts": {"model": "gpt-4o-mini", "supports_n": supports_n}})
+
+
+def agent_options(supports_n=True, **options):
+    return dict(single_flight=NoFlight(), metrics=CallMetrics(log_path=""), router=router(supports_n),
+                rate_limiter=RateLimiter(requests_per_minute=1000, tokens_per_minute=10 ** 7),
+                retry_policy=RetryPolicy(max_retries=0), **options)
+
+
+@pytest.fixture
+def client(mock_server):
+    return openai.OpenAI(api_key="sk-test", base_url=mock_server.base_url, max_retries=0)
+
+
+class ChoicesClient:
+    # Answers every request with the given choice contents
+    def __init__(self, contents):
+        self.contents = contents
+        self.requests = []
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, **params):
+        self.requests.append(params)
+        choices = [types.SimpleNamespace(index=index, message=types.SimpleNamespace(content=content))
+                   for index, content in reversed(list(enumerate(self.contents)))]
+        return types.SimpleNamespace(choices=choices, usage=None)
+
+
+def test_candidates_come_from_one_request_with_n(client, mock_server):
+    agent = FilmConceptAgent("sk-test", client=client, **agent_options())
+    concepts = agent.generate_concepts(INPUTS, 3, candidates=True)
+    assert len(concepts) == 3 and len(set(concepts)) == 3
+    assert mock_server.stats.snapshot()["requests"] == 1
+    assert [call["model"] for call in agent.metrics.recent_calls()] == ["gpt-4o-mini"]
+
+
+def test_candidates_are_requested_in_parallel_without_n(client, mock_server):
+    agent = FilmConceptAgent("sk-test", client=client, **agent_options(supports_n=False))
+    concepts = agent.generate_concepts(INPUTS, 3, candidates=True)
+    assert len(concepts) == 3 and all(concepts)
+    assert mock_server.stats.snapshot()["requests"] == 3
+    assert len(agent.metrics.recent_calls()) == 3
+
+
+def test_structured_candidates_are_records(client):
+    agent = FilmConceptAgent("sk-test", client=client, **agent_options())
+    concepts = agent.generate_concepts(INPUTS, 2, structured=True, candidates=True)
+    assert len(concepts) == 2
+    for concept in concepts:
+        assert set(concept) == set(CONCEPT.schema["properties"])
+
+
+def test_candidates_are_cached_as_one_list(client, mock_server):
+    agent = FilmConceptAgent("sk-test", client=client, cache=ResponseCache(), **agent_options())
+    first = agent.generate_concepts(INPUTS, 3, candidates=True)
+    assert agent.generate_concepts(INPUTS, 3, candidates=True) == first
+    assert mock_server.stats.snapshot()["requests"] == 1
+    # A different candidate count is a different request
+    assert len(agent.generate_concepts(INPUTS, 2, candidates=True)) == 2
+    assert mock_server.stats.snapshot()["requests"] == 2
+
+
+def test_choices_are_returned_in_index_order():
+    client = ChoicesClient([json.dumps(dict(CONCEPT_DATA, title=f"Title {index}")) for index in range(3)])
+    agent = FilmConceptAgent("sk-test", client=client, **agent_options())
+    concepts = agent.generate_concepts(INPUTS, 3, structured=True, candidates=True)
+    assert [concept["title"] for concept in concepts] == ["Title 0", "Title 1", "Title 2"]
+    assert client.requests[0]["n"] == 3
+
+
+def test_one_invalid_choice_fails_the_call_and_is_not_cached():
+    cache = ResponseCache()
+    client = ChoicesClient([json.dumps(CONCEPT_DATA), '{"title": "half a concept"}'])
+    agent = FilmConceptAgent("sk-test", client=client, cache=cache, **agent_options())
+    with pytest.raises(GenerationError):
+        agent.generate_concepts(INPUTS, 2, structured=True, candidates=True)
+    client.contents = [json.dumps(CONCEPT_DATA)] * 2
+    assert agent.generate_concepts(INPUTS, 2, structured=True, candidates=True) == [CONCEPT_DATA] * 2
+    assert len(client.requests) == 2
+
+
+def test_candidates_cannot_be_streamed(client):
+    agent = FilmConceptAgent("sk-test", client=client, **agent_options())
+    with pytest.raises(ValueError):
+        agent.generate_concepts(INPUTS, 3, candidates=True, stream=True)
+
+
+@pytest.mark.parametrize("supports_n, requests", [(True, 1), (False, 3)])
+def test_async_candidates_follow_the_route(mock_server, supports_n, requests):
+    client = openai.AsyncOpenAI(api_key="sk-test", base_url=mock_server.base_url, max_retries=0)
+    agent = AsyncFilmConceptAgent("sk-test", client=client, **agent_options(supports_n))
+    concepts = asyncio.run(agent.generate_concepts(INPUTS, 3, candidates=True))
+    assert len(concepts) == 3
+    assert mock_server.stats.snapshot()["requests"] == requests
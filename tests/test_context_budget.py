@@ -0,0 +1,60 @@
+import pytest
+
+import context_budget
+from context_budget import ContextBudget, SummaryCache, count_message_tokens, count_tokens
+
+
+def test_summary_cache_summarizes_each_text_once():
+    cache = SummaryCache()
+    calls = []
+
+    def summarize(text):
+        calls.append(text)
+        return text[:5]
+
+    assert cache.get_or_create("first text", summarize) == "first"
+    assert cache.get_or_create("first text", summarize) == "first"
+    assert calls == ["first text"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_summary_cache_evicts_least_recently_used():
+    cache = SummaryCache(max_entries=2)
+    for text in ("a", "b"):
+        cache.get_or_create(text, str.upper)
+    cache.get_or_create("a", str.upper)
+    cache.get_or_create("c", str.upper)
+    assert len(cache) == 2
+    assert cache.evictions == 1
+    misses = cache.misses
+    cache.get_or_create("a", str.upper)
+    assert cache.misses == misses
+    cache.get_or_create("b", str.upper)
+    assert cache.misses == misses + 1
+
+
+def test_fit_history_keeps_recent_turns_and_summarizes_older_ones():
+    budget = ContextBudget(max_tokens=400, cache=SummaryCache())
+    history = [{"role": "assistant", "content": f"Turn {index}. " + "word " * 60} for index in range(6)]
+    fitted = budget.fit_history(history)
+    assert count_message_tokens(fitted) <= 400
+    assert len(fitted) < len(history)
+    assert fitted[-1] == history[-1]
+    assert fitted[0]["content"].startswith("Summary of earlier conversation:")
+
+
+def test_fit_history_returns_short_history_unchanged():
+    history = [{"role": "user", "content": "hello"}]
+    assert ContextBudget(max_tokens=200, cache=SummaryCache()).fit_history(history) is history
+
+
+@pytest.mark.skipif(context_budget.tiktoken is not None, reason="exact counts with tiktoken")
+def test_estimate_does_not_under_count_code_or_non_latin_text():
+    # Roughly what the o200k encoding gives for each text
+    samples = {
+        "The crew hauls the nets as the storm rolls in.": 11,
+        "def f(x):\n    return {k: v for k, v in x.items()}": 17,
+        "漁船の上で家族が再会する": 10,
+    }
+    for text, tokens in samples.items():
+        assert count_tokens(text) >= tokens
@@ -0,0 +1,70 @@
+import os
+
+from conversation_log import ConversationHistory, prune_history_logs
+
+
+def message(number):
+    return {"role": "assistant", "content": f"output {number}", "agent_type": "treatment"}
+
+
+def contents(entries):
+    return [entry["content"] for entry in entries]
+
+
+def test_oldest_entries_spill_to_disk(tmp_path):
+    history = ConversationHistory("session", str(tmp_path), capacity=3)
+    for number in range(5):
+        history.append(message(number), project_id=1)
+
+    assert len(history) == 5
+    assert contents(history.recent(limit=10)) == ["output 2", "output 3", "output 4"]
+    stats = history.stats()
+    assert (stats["in_memory"], stats["spilled"]) == (3, 2)
+    assert stats["disk_bytes"] == os.path.getsize(tmp_path / "session" / "1.jsonl")
+
+
+def test_pages_run_newest_first_across_memory_and_disk(tmp_path):
+    history = ConversationHistory("session", str(tmp_path), capacity=3)
+    for number in range(8):
+        history.append(message(number), project_id=1)
+
+    assert history.count(project_id=1) == 8
+    assert contents(history.page(1, page=0, page_size=3)) == ["output 7", "output 6", "output 5"]
+    assert contents(history.page(1, page=1, page_size=3)) == ["output 4", "output 3", "output 2"]
+    assert contents(history.page(1, page=2, page_size=3)) == ["output 1", "output 0"]
+    assert history.page(1, page=3, page_size=3) == []
+    assert [entry["seq"] for entry in history.page(1, page=0, page_size=8)] == list(range(7, -1, -1))
+
+
+def test_pages_are_kept_per_project(tmp_path):
+    history = ConversationHistory("session", str(tmp_path), capacity=2)
+    for number in range(6):
+        history.append(message(number), project_id=number % 2 or None)
+
+    assert contents(history.page(1, page_size=5)) == ["output 5", "output 3", "output 1"]
+    assert contents(history.page(None, page_size=5)) == ["output 4", "output 2", "output 0"]
+    assert sorted(os.listdir(tmp_path / "session")) == ["1.jsonl", "none.jsonl"]
+
+
+def test_before_seq_skips_entries_already_shown(tmp_path):
+    history = ConversationHistory("session", str(tmp_path), capacity=4)
+    for number in range(4):
+        history.append(message(number), project_id=1)
+
+    assert history.count(project_id=1, before_seq=2) == 2
+    assert contents(history.page(1, page_size=5, before_seq=2)) == ["output 1", "output 0"]
+
+
+def test_prune_removes_idle_session_logs(tmp_path):
+    for session in ("idle", "active"):
+        history = ConversationHistory(session, str(tmp_path), capacity=1)
+        history.append(message(0))
+        history.append(message(1))
+    idle = tmp_path / "idle"
+    old = os.path.getmtime(idle) - 3600
+    for path in [idle, *idle.iterdir()]:
+        os.utime(path, (old, old))
+
+    assert prune_history_logs(str(tmp_path), max_age=60) == 1
+    assert os.listdir(tmp_path) == ["active"]
+    assert prune_history_logs(str(tmp_path / "missing")) == 0
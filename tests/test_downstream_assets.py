@@ -0,0 +1,58 @@
+import time
+
+import openai
+import pytest
+
+from agents import FilmAISystem, GenerationError
+from metrics import CallMetrics
+from rate_limit import RateLimiter
+from single_flight import NoFlight
+
+PROJECT = {"title": "Dune", "genre": "Drama", "concept": "A desert planet", "treatment": "Act one",
+           "script_outline": "Scene 1 - INT. TENT - NIGHT"}
+
+
+@pytest.fixture
+def system(mock_server):
+    client = openai.OpenAI(api_key="sk-test", base_url=mock_server.base_url, max_retries=0)
+    return FilmAISystem("sk-test", client=client, single_flight=NoFlight(), metrics=CallMetrics(),
+                        rate_limiter=RateLimiter(requests_per_minute=1000, tokens_per_minute=10 ** 7))
+
+
+def test_tasks_depend_on_the_artifacts_present(system):
+    assert set(system.downstream_tasks(PROJECT)) == {
+        "cast_suggestions", "location_suggestions", "product_placements", "marketing_assets"}
+    assert set(system.downstream_tasks(dict(PROJECT, script_outline=None))) == {"marketing_assets"}
+    assert system.downstream_tasks({"title": "Dune"}) == {}
+    method, args = system.downstream_tasks(PROJECT, {"budget_level": "low"})["cast_suggestions"]
+    assert args == (PROJECT["script_outline"], "low", None)
+
+
+def test_assets_are_generated_concurrently(system, mock_server):
+    mock_server.config.latency_ms = 200
+    landed = []
+    started = time.perf_counter()
+    results = system.generate_downstream_assets(PROJECT, on_result=lambda key, value: landed.append(key))
+    elapsed = time.perf_counter() - started
+    assert set(results) == set(landed) == set(system.downstream_tasks(PROJECT))
+    assert all(results.values())
+    # Four calls of 200 ms each would take at least 0.8 s one after another
+    assert elapsed < 0.7
+    assert mock_server.stats.snapshot()["requests"] == 4
+
+
+def test_one_failed_agent_does_not_stop_the_others(system, monkeypatch):
+    def fail(*args, **options):
+        raise GenerationError("CastingAgent", RuntimeError("quota"))
+
+    monkeypatch.setattr(system.casting_agent, "suggest_cast", fail)
+    errors = {}
+    results = system.generate_downstream_assets(PROJECT, on_error=errors.__setitem__)
+    assert set(errors) == {"cast_suggestions"}
+    assert set(results) == {"location_suggestions", "product_placements", "marketing_assets"}
+
+
+def test_bugs_are_not_reported_as_generation_failures(system, monkeypatch):
+    monkeypatch.setattr(system.location_agent, "suggest_locations", lambda *args, **options: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        system.generate_downstream_assets(PROJECT, max_workers=1)
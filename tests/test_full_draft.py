@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from agents import (AsyncFilmAISystem, FilmAISystem, GenerationError, assemble_script_draft,
+                    build_scene_context, parse_script_outline)
+
+OUTLINE = """**Scene 1**
+Scene heading: INT. TENT - NIGHT
+Characters present: Paul, Jessica
+Summary of the action: Paul wakes from a dream of the desert.
+
+**Scene 2**
+Scene heading: EXT. DUNES - DAY
+Characters present: Paul
+Summary of the action: Paul walks without rhythm.
+
+**Scene 3**
+Scene heading: INT. SIETCH - NIGHT
+Characters: Stilgar, Paul
+Action: The Fremen decide Paul's fate.
+"""
+
+
+class ScriptedSystem(FilmAISystem):
+    # Writes each scene from its description; scenes whose description mentions `failing` raise
+    def __init__(self, failing=None):
+        self.failing = failing
+        self.calls = []
+
+    def write_scene(self, scene_description, characters, previous_scenes=None, **options):
+        self.calls.append((scene_description.splitlines()[0], previous_scenes))
+        if self.failing and self.failing in scene_description:
+            raise GenerationError("ScriptAgent", RuntimeError("quota"))
+        return f"WRITTEN {characters}"
+
+
+class AsyncScriptedSystem(AsyncFilmAISystem):
+    def __init__(self, failing=None):
+        self.failing = failing
+
+    async def write_scene(self, scene_description, characters, previous_scenes=None, **options):
+        await asyncio.sleep(0)
+        if self.failing and self.failing in scene_description:
+            raise GenerationError("ScriptAgent", RuntimeError("quota"))
+        return f"WRITTEN {characters}"
+
+
+def test_outline_is_split_on_scene_labels():
+    scenes = parse_script_outline(OUTLINE)
+    assert [scene["number"] for scene in scenes] == [1, 2, 3]
+    assert [scene["heading"] for scene in scenes] == ["INT. TENT - NIGHT", "EXT. DUNES - DAY", "INT. SIETCH - NIGHT"]
+    assert scenes[0]["characters"] == "Paul, Jessica"
+    assert scenes[2]["characters"] == "Stilgar, Paul"
+    assert scenes[1]["summary"] == "Paul walks without rhythm."
+
+
+@pytest.mark.parametrize("outline", [
+    "1. INT. TENT - NIGHT\nPaul wakes.\n\n2. EXT. DUNES - DAY\nPaul walks.",
+    "INT. TENT - NIGHT\nPaul wakes.\n\nEXT. DUNES - DAY\nPaul walks.",
+])
+def test_outline_falls_back_to_numbered_headings_and_sluglines(outline):
+    scenes = parse_script_outline(outline)
+    assert [scene["heading"] for scene in scenes] == ["INT. TENT - NIGHT", "EXT. DUNES - DAY"]
+    assert scenes[0]["characters"] == "As described in the scene"
+
+
+def test_outline_without_scenes_parses_to_nothing():
+    assert parse_script_outline("A film about sand.") == []
+
+
+def test_scene_context_is_a_window_of_summaries():
+    scenes = parse_script_outline(OUTLINE)
+    assert build_scene_context(scenes, 0) is None
+    assert build_scene_context(scenes, 2) == (
+        "Scene 1 - INT. TENT - NIGHT: Paul wakes from a dream of the desert.\n"
+        "Scene 2 - EXT. DUNES - DAY: Paul walks without rhythm.")
+    assert build_scene_context(scenes, 2, context_scenes=1) == (
+        "(Scenes before scene 2 omitted.)\nScene 2 - EXT. DUNES - DAY: Paul walks without rhythm.")
+
+
+def test_draft_marks_unwritten_scenes():
+    scenes = parse_script_outline(OUTLINE)
+    draft = assemble_script_draft(scenes, {"1": "ONE", "3": "THREE"})
+    assert draft == "ONE\n\n[Scene 2 - EXT. DUNES - DAY: not yet written]\n\nTHREE"
+
+
+def test_full_draft_writes_every_scene_with_its_context():
+    system = ScriptedSystem()
+    results = {number: (text, error) for number, text, error in system.iter_full_draft(OUTLINE, max_workers=2)}
+    assert results == {1: ("WRITTEN Paul, Jessica", None), 2: ("WRITTEN Paul", None), 3: ("WRITTEN Stilgar, Paul", None)}
+    contexts = dict(system.calls)
+    assert contexts["**Scene 1**"] is None
+    assert contexts["**Scene 3**"].startswith("Scene 1 - INT. TENT - NIGHT")
+
+
+def test_full_draft_resumes_after_a_failed_scene():
+    system = ScriptedSystem(failing="SIETCH")
+    written, failed = {}, []
+    for number, text, error in system.iter_full_draft(OUTLINE):
+        if error is not None:
+            failed.append(number)
+            continue
+        written[str(number)] = text
+    assert failed == [3] and set(written) == {"1", "2"}
+
+    system.failing = None
+    system.calls.clear()
+    resumed = list(system.iter_full_draft(OUTLINE, written))
+    assert [number for number, text, error in resumed] == [3]
+    assert [heading for heading, context in system.calls] == ["**Scene 3**"]
+    assert list(system.iter_full_draft(OUTLINE, dict(written, **{"3": "THREE"}))) == []
+
+
+def test_async_full_draft_reports_failures_per_scene():
+    async def collect(system, written=None):
+        return {number: error async for number, text, error in system.iter_full_draft(OUTLINE, written)}
+
+    results = asyncio.run(collect(AsyncScriptedSystem(failing="DUNES")))
+    assert set(results) == {1, 2, 3}
+    assert isinstance(results[2], GenerationError) and results[1] is None and results[3] is None
+    assert set(asyncio.run(collect(AsyncScriptedSystem(), {"1": "ONE", "3": "THREE"}))) == {2}
@@ -0,0 +1,196 @@
+import time
+import types
+
+import fakeredis
+import pytest
+
+import jobs
+from jobs import JobQueue, JobWorkers, RedisJobQueue
+from project_store import CachedProjectStore, ProjectStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(jobs, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    yield queue
+    queue.close()
+
+
+def test_jobs_are_claimed_once_in_creation_order(queue, clock):
+    first = queue.enqueue("treatment", project_id=1, params={"node": "treatment"})
+    clock[0] += 1
+    second = queue.enqueue("cast", project_id=1)
+
+    job = queue.claim(lease=60)
+    assert job["id"] == first
+    assert job["params"] == {"node": "treatment"}
+    assert (job["status"], job["attempts"], job["lease_until"]) == ("running", 1, 1061.0)
+    assert queue.claim(lease=60)["id"] == second
+    assert queue.claim() is None
+
+
+def test_claim_can_be_limited_to_job_ids(queue, clock):
+    first = queue.enqueue("treatment")
+    second = queue.enqueue("cast")
+    assert queue.claim(job_ids=[]) is None
+    assert queue.claim(job_ids=[second])["id"] == second
+    assert queue.claim(job_ids=[second]) is None
+    assert queue.claim()["id"] == first
+
+
+def test_expired_lease_is_reclaimed(queue, clock):
+    job_id = queue.enqueue("treatment")
+    queue.claim(lease=60)
+    clock[0] += 59
+    assert queue.claim() is None
+
+    # A live worker keeps its job by renewing the lease
+    queue.renew([job_id], lease=60)
+    clock[0] += 59
+    assert queue.claim() is None
+
+    # A dead one stops renewing, and the job is claimed again
+    clock[0] += 2
+    reclaimed = queue.claim(lease=60)
+    assert reclaimed["id"] == job_id
+    assert reclaimed["attempts"] == 2
+
+
+def test_finished_jobs_are_never_reclaimed(queue, clock):
+    done = queue.enqueue("treatment", project_id=7)
+    failed = queue.enqueue("cast", project_id=7)
+    queue.enqueue("marketing", project_id=8)
+    queue.claim(lease=1)
+    queue.claim(lease=1)
+    queue.finish(done, {"treatment": "text"})
+    queue.fail(failed, RuntimeError("quota"))
+    clock[0] += 10
+
+    assert queue.get(done)["result"] == {"treatment": "text"}
+    assert queue.get(failed)["error"] == "quota"
+    assert queue.active(project_id=7) == []
+    assert [job["kind"] for job in queue.active()] == ["marketing"]
+    assert queue.claim()["kind"] == "marketing"
+    assert queue.claim() is None
+
+
+def test_prune_drops_only_old_finished_jobs(queue, clock):
+    old = queue.enqueue("treatment")
+    queue.claim()
+    queue.finish(old)
+    clock[0] += 100
+    recent = queue.enqueue("cast")
+    queue.claim()
+    queue.finish(recent)
+    running = queue.enqueue("marketing")
+    queue.claim()
+
+    queue.prune(older_than=50)
+    assert queue.get(old) is None
+    assert queue.get(recent)["status"] == "done"
+    assert queue.get(running)["status"] == "running"
+
+
+def test_queue_is_shared_between_connections(tmp_path, clock):
+    path = str(tmp_path / "jobs.db")
+    producer, worker = JobQueue(path), JobQueue(path)
+    job_id = producer.enqueue("treatment")
+    assert worker.claim()["id"] == job_id
+    assert producer.claim() is None
+    worker.report(job_id, "Half way")
+    assert producer.get(job_id)["progress"] == "Half way"
+    producer.close()
+    worker.close()
+
+
+@pytest.fixture
+def redis_queue():
+    return RedisJobQueue(fakeredis.FakeRedis(decode_responses=True), prefix="test")
+
+
+def test_redis_jobs_are_claimed_once_in_creation_order(redis_queue):
+    first = redis_queue.enqueue("treatment", project_id=1, params={"node": "treatment"})
+    second = redis_queue.enqueue("cast", project_id=2)
+    job = redis_queue.claim(lease=60)
+    assert (job["id"], job["params"], job["status"], job["attempts"]) == (first, {"node": "treatment"}, "running", 1)
+    assert job["project_id"] == 1
+    assert redis_queue.claim(job_ids=[first]) is None
+    assert redis_queue.claim(lease=60)["id"] == second
+    assert redis_queue.claim() is None
+    assert [job["id"] for job in redis_queue.active(project_id=2)] == [second]
+
+
+def test_redis_expired_lease_is_reclaimed(redis_queue):
+    job_id = redis_queue.enqueue("treatment")
+    redis_queue.claim(lease=0.05)
+    assert redis_queue.claim() is None
+    time.sleep(0.1)
+    reclaimed = redis_queue.claim(lease=60)
+    assert (reclaimed["id"], reclaimed["attempts"]) == (job_id, 2)
+    redis_queue.renew([job_id], lease=60)
+    time.sleep(0.1)
+    assert redis_queue.claim() is None
+
+
+def test_redis_finished_jobs_leave_the_queue_and_are_pruned(redis_queue):
+    done = redis_queue.enqueue("treatment", project_id=7)
+    failed = redis_queue.enqueue("cast", project_id=7)
+    redis_queue.claim(lease=0.01)
+    redis_queue.claim(lease=0.01)
+    redis_queue.report(done, "Half way")
+    redis_queue.finish(done, {"treatment": "text"})
+    redis_queue.fail(failed, RuntimeError("quota"))
+    time.sleep(0.05)
+
+    assert redis_queue.claim() is None
+    assert redis_queue.active() == []
+    assert redis_queue.get(done)["result"] == {"treatment": "text"}
+    assert redis_queue.get(done)["progress"] == "Half way"
+    assert redis_queue.get(failed)["error"] == "quota"
+    redis_queue.prune(older_than=3600)
+    assert redis_queue.get(done) is not None
+    redis_queue.prune(older_than=0)
+    assert redis_queue.get(done) is None and redis_queue.get(failed) is None
+
+
+def test_saved_results_merge_into_the_stored_input_records(tmp_path):
+    # Two replicas, each with a local copy of the project read before the other's job finished
+    path = str(tmp_path / "projects.sqlite3")
+    stores = [CachedProjectStore(ProjectStore(path), ttl=60) for _ in range(2)]
+    project_id = stores[0].create("Dune", "Drama", "A desert planet")["id"]
+    stores[0].update(project_id, "treatment", "Act one")
+    workers = [JobWorkers(JobQueue(str(tmp_path / "jobs.db")), store, system_factory=None) for store in stores]
+    for store in stores:
+        store.get(project_id)
+
+    outline = workers[0].pipeline.nodes["script_outline"]
+    workers[0].save(project_id, "script_outline", {"script_outline": "Scene 1"},
+                    outline.record({"treatment": "Act one", "num_scenes": 12}))
+    workers[1].save(project_id, "marketing_assets", {"marketing_assets": "Poster"},
+                    {"fingerprint": "m", "params": {}})
+
+    project = ProjectStore(path).get(project_id)
+    # The concept and treatment had no records yet, so they are pinned to their current inputs
+    assert set(project["artifact_inputs"]) == {"concept", "treatment", "script_outline", "marketing_assets"}
+    assert (project["script_outline"], project["marketing_assets"]) == ("Scene 1", "Poster")
+
+
+def test_progress_is_written_as_it_streams(queue, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(jobs.time, "monotonic", lambda: now[0])
+    job_id = queue.enqueue("artifact")
+    on_delta = JobWorkers(queue, None, system_factory=None).progress_reporter(job_id, interval=0.1)
+    for delta in ("INT. ", "", "BOAT", " - NIGHT"):
+        now[0] += 0.05
+        on_delta(delta)
+    assert queue.get(job_id)["progress"] == "INT. BOAT"
+    now[0] += 0.1
+    on_delta(".")
+    assert queue.get(job_id)["progress"] == "INT. BOAT - NIGHT."
@@ -0,0 +1,58 @@
+from async_runtime import get_background_loop
+from llm_clients import ClientRegistry, key_fingerprint
+
+
+def ask(client, prompt="Hello"):
+    return client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": prompt}])
+
+
+def test_one_client_per_api_key(mock_server):
+    registry = ClientRegistry(base_url=mock_server.base_url)
+    first = registry.get("sk-one")
+    assert registry.get("sk-one") is first
+    assert registry.get("sk-two") is not first
+    assert first.max_retries == 0
+    assert registry.stats()["clients"] == 2
+    registry.close()
+    assert registry.stats()["clients"] == 0
+
+
+def test_requests_reuse_pooled_connections(mock_server):
+    registry = ClientRegistry(base_url=mock_server.base_url)
+    client = registry.get("sk-one")
+    for _ in range(3):
+        assert ask(client).choices[0].message.content
+    stats = registry.stats("sk-one")
+    assert (stats["requests"], stats["connections_opened"], stats["reused_requests"]) == (3, 1, 2)
+    assert registry.stats("sk-unused")["requests"] == 0
+    registry.close()
+
+
+def test_rotating_a_key_drops_the_old_client(mock_server):
+    registry = ClientRegistry(base_url=mock_server.base_url)
+    old = registry.get("sk-old")
+    ask(old)
+    new = registry.rotate("sk-old", "sk-new")
+    assert new is registry.get("sk-new")
+    assert registry.get("sk-old") is not old
+    assert registry.rotate("sk-new", "sk-new") is new
+    registry.close()
+
+
+def test_async_clients_are_pooled_on_the_background_loop(mock_server):
+    registry = ClientRegistry(base_url=mock_server.base_url)
+    client = registry.get_async("sk-one")
+    assert registry.get_async("sk-one") is client
+    loop = get_background_loop()
+    for _ in range(2):
+        response = loop.run(client.chat.completions.create(
+            model="gpt-4o", messages=[{"role": "user", "content": "Hello"}]), timeout=5)
+        assert response.choices[0].message.content
+    assert registry.stats("sk-one")["connections_opened"] == 1
+    registry.close()
+
+
+def test_key_fingerprint_hides_the_key():
+    fingerprint = key_fingerprint("sk-secret")
+    assert fingerprint == key_fingerprint("sk-secret") != key_fingerprint("sk-other")
+    assert "secret" not in fingerprint and len(fingerprint) == 16
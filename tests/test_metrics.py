@@ -0,0 +1,100 @@
+import json
+import types
+import urllib.request
+
+import openai
+import pytest
+
+from agents import FilmAISystem
+from metrics import CallMetrics, CallRecord, cached_prompt_tokens, call_cost, start_metrics_server
+from rate_limit import RateLimiter
+from response_cache import ResponseCache
+from single_flight import NoFlight
+
+
+def test_cost_uses_the_longest_price_prefix_and_discounts_cached_tokens():
+    assert call_cost("gpt-4o-mini-2024-07-18", 1_000_000, 0) == pytest.approx(0.15)
+    assert call_cost("gpt-4o", 1_000_000, 1_000_000) == pytest.approx(12.50)
+    assert call_cost("gpt-4o", 1_000_000, 0, cached_tokens=1_000_000) == pytest.approx(1.25)
+    assert call_cost("unknown-model", 1000, 1000) == 0.0
+
+
+def test_cached_tokens_are_read_from_objects_and_dicts():
+    assert cached_prompt_tokens(types.SimpleNamespace(prompt_tokens_details={"cached_tokens": 7})) == 7
+    details = types.SimpleNamespace(cached_tokens=5)
+    assert cached_prompt_tokens(types.SimpleNamespace(prompt_tokens_details=details)) == 5
+    assert cached_prompt_tokens(types.SimpleNamespace()) == 0
+
+
+def test_prometheus_text_has_counters_and_cumulative_histograms():
+    metrics = CallMetrics(log_path="")
+    metrics.record(CallRecord("ScriptAgent", "gpt-4o", "miss", 0.3, 100, 50, ttft=0.2, stream=True, cached_tokens=40))
+    metrics.record(CallRecord("ScriptAgent", "gpt-4o", "miss", 3.0, 100, 50))
+    metrics.record(CallRecord("ScriptAgent", "gpt-4o", "hit", 0.001))
+    metrics.record(CallRecord("ScriptAgent", "gpt-4o", "miss", 1.0, error="RateLimitError"))
+    lines = metrics.render_prometheus().splitlines()
+    series = 'agent="ScriptAgent",model="gpt-4o"'
+    assert f'vadis_llm_calls_total{{{series},cache="miss",error=""}} 2' in lines
+    assert f'vadis_llm_calls_total{{{series},cache="hit",error=""}} 1' in lines
+    assert f'vadis_llm_calls_total{{{series},cache="miss",error="RateLimitError"}} 1' in lines
+    assert f'vadis_llm_tokens_total{{{series},kind="prompt"}} 200' in lines
+    assert f'vadis_llm_tokens_total{{{series},kind="cached_prompt"}} 40' in lines
+    # The cache hit is kept out of the latency histogram
+    assert f'vadis_llm_latency_seconds_bucket{{{series},le="0.5"}} 1' in lines
+    assert f'vadis_llm_latency_seconds_bucket{{{series},le="1.0"}} 2' in lines
+    assert f'vadis_llm_latency_seconds_bucket{{{series},le="+Inf"}} 3' in lines
+    assert f'vadis_llm_ttft_seconds_count{{{series}}} 1' in lines
+    assert "# TYPE vadis_llm_cost_usd_total counter" in lines
+
+
+def test_calls_are_appended_to_the_jsonl_log(tmp_path):
+    log_path = tmp_path / "calls.jsonl"
+    metrics = CallMetrics(log_path=str(log_path))
+    metrics.record(CallRecord("CastingAgent", "gpt-4o", "miss", 0.5, 10, 20, usage_estimated=True))
+    metrics.record(CallRecord("CastingAgent", "gpt-4o", "hit", 0.0))
+    rows = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert [row["cache"] for row in rows] == ["miss", "hit"]
+    assert rows[0]["completion_tokens"] == 20 and rows[0]["usage_estimated"] is True
+    assert rows[0]["cost_usd"] == pytest.approx(call_cost("gpt-4o", 10, 20))
+
+
+def test_summary_rolls_calls_up_per_agent():
+    metrics = CallMetrics(log_path="")
+    for latency in (1.0, 2.0, 3.0):
+        metrics.record(CallRecord("LocationAgent", "gpt-4o", "miss", latency, 10, 10))
+    metrics.record(CallRecord("LocationAgent", "gpt-4o", "hit", 0.0))
+    metrics.record(CallRecord("MarketingAgent", "gpt-4o-mini", "miss", 1.0, error="APITimeoutError"))
+    location, marketing = metrics.summary()
+    assert (location["calls"], location["cache_hits"], location["prompt_tokens"]) == (4, 1, 30)
+    assert location["p50_latency"] == 2.0
+    assert marketing["errors"] == 1
+    metrics.reset()
+    assert metrics.summary() == [] and metrics.recent_calls() == []
+
+
+def test_metrics_endpoint_serves_the_prometheus_text():
+    metrics = CallMetrics(log_path="")
+    metrics.record(CallRecord("ScriptAgent", "gpt-4o", "miss", 0.3, 1, 1))
+    server = start_metrics_server(metrics, port=0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            assert response.read().decode("utf-8") == metrics.render_prometheus()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_agents_record_upstream_calls_and_cache_hits(mock_server):
+    metrics = CallMetrics(log_path="")
+    client = openai.OpenAI(api_key="sk-test", base_url=mock_server.base_url, max_retries=0)
+    system = FilmAISystem("sk-test", client=client, cache=ResponseCache(), single_flight=NoFlight(), metrics=metrics,
+                          rate_limiter=RateLimiter(requests_per_minute=1000, tokens_per_minute=10 ** 7))
+    system.suggest_cast("A fisherman", "low")
+    system.suggest_cast("A fisherman", "low")
+    "".join(system.develop_treatment("A desert planet", stream=True))
+    calls = metrics.recent_calls()
+    assert [(call["agent"], call["cache"]) for call in calls] == [
+        ("CastingAgent", "miss"), ("CastingAgent", "hit"), ("ScriptAgent", "miss")]
+    assert calls[0]["prompt_tokens"] > 0 and calls[0]["usage_estimated"] is False
+    assert calls[2]["stream"] is True and calls[2]["ttft_seconds"] is not None
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import types
+
+import httpx
+import openai
+import pytest
+
+from agents import AsyncScriptAgent, CastingAgent, FilmConceptAgent, GenerationError, ScriptAgent
+from metrics import CallMetrics
+from model_routing import DEFAULT_ROUTES, ModelRouter, load_routes
+from rate_limit import RateLimiter, RetryPolicy
+from single_flight import NoFlight
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+def rate_limited():
+    return openai.RateLimitError("Rate limit reached", response=httpx.Response(429, request=REQUEST), body=None)
+
+
+def timed_out():
+    return openai.APITimeoutError(request=REQUEST)
+
+
+def server_error():
+    return openai.InternalServerError("Server error", response=httpx.Response(500, request=REQUEST), body=None)
+
+
+class ModelClient:
+    # Fails every call to the models in `failures` with the given error factory
+    def __init__(self, failures=None):
+        self.failures = failures or {}
+        self.models = []
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def response(self, **params):
+        self.models.append(params["model"])
+        if params["model"] in self.failures:
+            raise self.failures[params["model"]]()
+        message = types.SimpleNamespace(content=f"from {params['model']}")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=None)
+
+    create = response
+
+
+class AsyncModelClient(ModelClient):
+    async def create(self, **params):
+        return self.response(**params)
+
+
+ROUTES = {
+    "ScriptAgent.generate_treatment": {"model": "primary", "fallbacks": ["secondary", "last"], "max_tokens": 100},
+    "ScriptAgent": {"model": "agent-wide", "max_tokens": 50},
+}
+
+
+def make_agent(cls, client, router, retries=0):
+    return cls("sk-test", client=client, router=router, single_flight=NoFlight(), metrics=CallMetrics(log_path=""),
+               rate_limiter=RateLimiter(requests_per_minute=1000, tokens_per_minute=10 ** 7),
+               retry_policy=RetryPolicy(max_retries=retries, base_delay=0, max_delay=0))
+
+
+def test_method_routes_win_over_agent_routes():
+    router = ModelRouter(ROUTES)
+    agent = make_agent(ScriptAgent, ModelClient(), router)
+    treatment = router.resolve(agent, "generate_treatment")
+    assert (treatment.name, treatment.models, treatment.max_tokens) == (
+        "ScriptAgent.generate_treatment", ("primary", "secondary", "last"), 100)
+    scene = router.resolve(agent, "generate_scene")
+    assert (scene.name, scene.model, scene.fallbacks) == ("ScriptAgent", "agent-wide", ())
+    casting = router.resolve(make_agent(CastingAgent, ModelClient(), router), "suggest_cast")
+    assert (casting.name, casting.model, casting.max_tokens) == (None, "gpt-4o", CastingAgent.max_tokens)
+
+
+def test_async_agents_resolve_through_the_sync_class_name():
+    router = ModelRouter(ROUTES)
+    route = router.resolve(make_agent(AsyncScriptAgent, AsyncModelClient(), router), "generate_treatment")
+    assert route.name == "ScriptAgent.generate_treatment"
+
+
+def test_routes_overlay_the_defaults(tmp_path, monkeypatch):
+    monkeypatch.delenv("VADIS_MODEL_ROUTING", raising=False)
+    routes = load_routes(json.dumps({"CastingAgent.suggest_cast": None, "ScriptAgent": {"model": "gpt-4o-mini"}}))
+    assert "CastingAgent.suggest_cast" not in routes
+    assert routes["ScriptAgent"] == {"model": "gpt-4o-mini"}
+    path = tmp_path / "routes.json"
+    path.write_text(json.dumps({"MarketingAgent": {"model": "gpt-4o"}}))
+    assert load_routes(str(path))["MarketingAgent"] == {"model": "gpt-4o"}
+    assert load_routes("") == DEFAULT_ROUTES
+    monkeypatch.setenv("VADIS_MODEL_ROUTING", "0")
+    assert load_routes() == {}
+
+
+@pytest.mark.parametrize("error", [rate_limited, timed_out])
+def test_rate_limits_and_timeouts_fall_back_to_the_next_model(error):
+    router = ModelRouter(ROUTES)
+    client = ModelClient({"primary": error})
+    agent = make_agent(ScriptAgent, client, router, retries=3)
+    assert agent.generate_treatment("A concept") == "from secondary"
+    # No backoff on the first model: it is given up on after one attempt
+    assert client.models == ["primary", "secondary"]
+    error_name = type(error()).__name__
+    assert router.fallbacks == {("ScriptAgent.generate_treatment", "primary", error_name): 1}
+    assert [row["fallback_calls"] for row in router.stats() if row["route"] == "ScriptAgent.generate_treatment"] == [1]
+    assert agent.metrics.recent_calls()[-1]["model"] == "secondary"
+
+
+def test_the_last_model_retries_before_giving_up():
+    router = ModelRouter(ROUTES)
+    client = ModelClient({model: rate_limited for model in ("primary", "secondary", "last")})
+    agent = make_agent(ScriptAgent, client, router, retries=2)
+    with pytest.raises(GenerationError) as raised:
+        agent.generate_treatment("A concept")
+    assert isinstance(raised.value.cause, openai.RateLimitError)
+    assert client.models == ["primary", "secondary", "last", "last", "last"]
+
+
+def test_other_errors_do_not_fall_back():
+    client = ModelClient({"primary": server_error})
+    agent = make_agent(ScriptAgent, client, ModelRouter(ROUTES))
+    with pytest.raises(GenerationError):
+        agent.generate_treatment("A concept")
+    assert client.models == ["primary"]
+
+
+def test_unrouted_agents_use_their_own_model():
+    client = ModelClient()
+    agent = make_agent(FilmConceptAgent, client, ModelRouter({}))
+    assert agent.generate_concepts({"genre": "Drama"}) == "from gpt-4o"
+
+
+def test_async_agents_fall_back_too():
+    router = ModelRouter(ROUTES)
+    client = AsyncModelClient({"primary": timed_out, "secondary": rate_limited})
+    agent = make_agent(AsyncScriptAgent, client, router)
+    assert asyncio.run(agent.generate_treatment("A concept")) == "from last"
+    assert client.models == ["primary", "secondary", "last"]
+    assert sum(router.fallbacks.values()) == 2
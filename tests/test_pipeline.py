@@ -0,0 +1,139 @@
+import threading
+import time
+
+import pytest
+
+from agents import GenerationError
+from pipeline import DEFAULT_NODES, Node, Pipeline, run_project_pipeline
+from project_store import ProjectStore
+
+
+def make_nodes(calls, fail=()):
+    # A small chain (a -> b -> c) plus an independent d, each producing "<name>:<inputs>"
+    def runner(name, requires):
+        def run(system, values, **options):
+            calls.append((name, options))
+            if name in fail:
+                raise GenerationError(name, RuntimeError("upstream failed"))
+            inputs = ",".join(str(values[required]) for required in requires)
+            return {name: f"{name}({inputs}|{values.get('setting') or ''})"}
+        return run
+
+    graph = {"a": (), "b": ("a",), "c": ("b",), "d": ()}
+    return [Node(name, (name,), requires, ("setting",), runner(name, requires)) for name, requires in graph.items()]
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+def test_first_run_generates_everything_in_dependency_order(calls):
+    result = Pipeline(nodes=make_nodes(calls)).run({})
+    assert result.ok
+    assert set(result.statuses.values()) == {"ran"}
+    order = [name for name, _ in calls]
+    assert order.index("a") < order.index("b") < order.index("c")
+    assert result.state["c"] == "c(b(a(|)|)|)"
+    assert set(result.artifact_inputs) == {"a", "b", "c", "d"}
+
+
+def test_rerun_skips_fresh_nodes(calls):
+    pipeline = Pipeline(nodes=make_nodes(calls))
+    first = pipeline.run({})
+    calls.clear()
+    second = pipeline.run(first.state, first.artifact_inputs)
+    assert calls == []
+    assert set(second.statuses.values()) == {"skipped"}
+    assert pipeline.stale_nodes(first.state, first.artifact_inputs) == []
+
+
+def test_changed_param_marks_node_and_downstream_stale(calls):
+    pipeline = Pipeline(nodes=make_nodes(calls))
+    first = pipeline.run({})
+    assert pipeline.stale_nodes(first.state, first.artifact_inputs, params={"setting": "x"}) == ["a", "b", "c", "d"]
+    assert pipeline.stale_nodes(first.state, first.artifact_inputs, targets=["b"]) == []
+
+    # Editing b's output by hand leaves b itself fresh but makes c stale
+    state = dict(first.state, b="edited")
+    assert pipeline.stale_nodes(state, first.artifact_inputs) == ["c"]
+    calls.clear()
+    result = pipeline.run(state, first.artifact_inputs)
+    assert [name for name, _ in calls] == ["c"]
+    assert result.state["c"] == "c(edited|)"
+    assert result.statuses == {"a": "skipped", "b": "skipped", "c": "ran", "d": "skipped"}
+
+
+def test_targets_select_upstream_only(calls):
+    result = Pipeline(nodes=make_nodes(calls)).run({}, targets=["b"])
+    assert sorted(name for name, _ in calls) == ["a", "b"]
+    assert "c" not in result.statuses
+    with pytest.raises(ValueError):
+        Pipeline(nodes=make_nodes(calls)).select(["missing"])
+
+
+def test_failure_blocks_downstream_only(calls):
+    errors = []
+    result = Pipeline(nodes=make_nodes(calls, fail={"b"})).run({}, on_error=lambda name, e: errors.append(name))
+    assert not result.ok
+    assert result.statuses == {"a": "ran", "b": "failed", "c": "blocked", "d": "ran"}
+    assert errors == ["b"]
+    assert "b" not in result.state
+
+
+def test_untracked_artifacts_count_as_fresh_until_upstream_changes(calls):
+    pipeline = Pipeline(nodes=DEFAULT_NODES)
+    state = {"concept": "A heist", "title": "Heist", "treatment": "Old treatment", "script_outline": "Scene 1"}
+    pinned = pipeline.untracked_inputs(state)
+    assert set(pinned) == {"concept", "treatment", "script_outline"}
+    assert pipeline.stale_nodes(state, {}, targets=["script_outline"]) == []
+    assert pipeline.stale_nodes(dict(state, treatment="New treatment"), pinned,
+                                targets=["script_outline"]) == ["script_outline"]
+
+
+def test_regenerated_nodes_bypass_the_cache(calls):
+    pipeline = Pipeline(nodes=make_nodes(calls))
+    first = pipeline.run({})
+    assert all("bypass_cache" not in options for _, options in calls)
+
+    calls.clear()
+    pipeline.run(dict(first.state, b="edited"), first.artifact_inputs)
+    assert calls == [("c", {"bypass_cache": True})]
+
+    calls.clear()
+    pipeline.run(first.state, first.artifact_inputs, targets=["a"], force=["a"])
+    assert calls == [("a", {"bypass_cache": True})]
+
+
+class ConcurrencyProbe:
+    # Stands in for FilmAISystem's suggestion methods and records how many ran at once
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def _suggest(self, *args, **options):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        return "Suggestions"
+
+    suggest_cast = suggest_locations = suggest_product_placements = _suggest
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_project_pipeline_honours_max_workers(tmp_path, max_workers):
+    store = ProjectStore(str(tmp_path / "projects.sqlite3"))
+    project_id = store.create("Dune", "Drama", "A desert planet")["id"]
+    store.update(project_id, "treatment", "Act one")
+    store.update(project_id, "script_outline", "Scene 1")
+    probe = ConcurrencyProbe()
+    result = run_project_pipeline(store, project_id, probe, max_workers=max_workers,
+                                  targets=["cast_suggestions", "location_suggestions", "product_placements"])
+    assert result.ok
+    assert probe.peak == max_workers
+    assert store.get(project_id)["cast_suggestions"] == "Suggestions"
+    store.close()
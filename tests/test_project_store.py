@@ -0,0 +1,120 @@
+import threading
+import time
+
+import fakeredis
+import pytest
+
+from project_store import CachedProjectStore, ProjectStore, RedisProjectStore
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def open_store(request, tmp_path):
+    # open_store() returns one more connection to the same shared store, as another replica would have
+    server = fakeredis.FakeServer()
+    stores = []
+
+    def open_store():
+        if request.param == "sqlite":
+            store = ProjectStore(str(tmp_path / "projects.sqlite3"))
+        else:
+            store = RedisProjectStore(fakeredis.FakeRedis(server=server, decode_responses=True), prefix="test")
+        stores.append(store)
+        return store
+
+    yield open_store
+    for store in stores:
+        store.close()
+
+
+def test_create_update_list_and_delete(open_store):
+    store = open_store()
+    first = store.create("Dune", "Science Fiction", "A desert planet")
+    second = store.create("Heat", "Crime", None)
+    assert (first["title"], first["genre"], first["concept"]) == ("Dune", "Science Fiction", "A desert planet")
+    assert second["concept"] is None
+
+    store.update(first["id"], "treatment", "Act one")
+    store.update(first["id"], "script_scenes", {"outline_hash": "abc", "scenes": {"1": "INT. TENT"}})
+    project = open_store().get(first["id"])
+    assert project["treatment"] == "Act one"
+    assert project["script_scenes"] == {"outline_hash": "abc", "scenes": {"1": "INT. TENT"}}
+    with pytest.raises(ValueError):
+        store.update(first["id"], "owner", "someone")
+
+    assert [summary["title"] for summary in store.list_summaries()] == ["Dune", "Heat"]
+    store.delete(first["id"])
+    assert store.get(first["id"]) is None
+    assert [summary["id"] for summary in store.list_summaries()] == [second["id"]]
+    store.update(first["id"], "treatment", "Ignored")
+    assert store.get(first["id"]) is None
+
+
+def test_save_artifact_merges_into_the_stored_record(open_store):
+    store = open_store()
+    project_id = store.create("Dune", "Drama", "A desert planet")["id"]
+    store.update(project_id, "artifact_inputs", {"concept": {"fingerprint": "c", "params": {}}})
+
+    def add(name):
+        def merge_inputs(project):
+            return dict(project["artifact_inputs"] or {}, **{name: {"fingerprint": name, "params": {}}})
+        return merge_inputs
+
+    assert store.save_artifact(project_id, {"treatment": "Act one"}, add("treatment")) is not None
+    project = store.get(project_id)
+    assert project["treatment"] == "Act one"
+    assert set(project["artifact_inputs"]) == {"concept", "treatment"}
+    assert store.save_artifact(project_id + 100, {"treatment": "x"}, add("treatment")) is None
+    with pytest.raises(ValueError):
+        store.save_artifact(project_id, {"owner": "someone"}, add("treatment"))
+
+
+def test_replicas_finishing_together_keep_each_others_records(open_store):
+    # Each replica reads through a local copy taken before the other wrote; the merge must not use it
+    replicas = [CachedProjectStore(open_store(), ttl=60) for _ in range(2)]
+    project_id = replicas[0].create("Dune", "Drama", "A desert planet")["id"]
+    for replica in replicas:
+        replica.get(project_id)
+    both_reading = threading.Barrier(2, timeout=5)
+    merges = []
+
+    def finish(replica, name):
+        def merge_inputs(project):
+            merges.append(name)
+            if merges.count(name) == 1:
+                # Both jobs are past their reads before either writes; SQLite makes the second wait
+                try:
+                    both_reading.wait(timeout=0.2)
+                except threading.BrokenBarrierError:
+                    pass
+                time.sleep(0.05)
+            return dict(project["artifact_inputs"] or {}, **{name: {"fingerprint": name, "params": {}}})
+        replica.save_artifact(project_id, {name: f"{name} text"}, merge_inputs)
+
+    threads = [threading.Thread(target=finish, args=(replica, name))
+               for replica, name in zip(replicas, ("cast_suggestions", "location_suggestions"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    for replica in replicas:
+        project = replica.get(project_id)
+        assert set(project["artifact_inputs"]) == {"cast_suggestions", "location_suggestions"}
+        assert project["cast_suggestions"] and project["location_suggestions"]
+
+
+def test_cached_store_serves_copies_and_drops_them_on_write(open_store):
+    store = CachedProjectStore(open_store(), ttl=60)
+    other = open_store()
+    project_id = store.create("Dune", "Drama", "A desert planet")["id"]
+    project = store.get(project_id)
+    project["title"] = "Edited locally"
+    assert store.get(project_id)["title"] == "Dune"
+
+    other.update(project_id, "treatment", "Written elsewhere")
+    assert store.get(project_id)["treatment"] is None
+    store.invalidate(project_id)
+    assert store.get(project_id)["treatment"] == "Written elsewhere"
+    store.update(project_id, "treatment", "Written here")
+    assert store.get(project_id)["treatment"] == "Written here"
+    assert store.stats()["hits"] >= 2
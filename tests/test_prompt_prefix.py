@@ -0,0 +1,85 @@
+import types
+
+import openai
+import pytest
+
+from agents import (Agent, CastingAgent, FilmConceptAgent, LocationAgent, MarketingAgent, ProductPlacementAgent,
+                    ScriptAgent, prompt_block)
+from metrics import CallMetrics
+from rate_limit import RateLimiter, RetryPolicy
+from single_flight import NoFlight
+from structured_outputs import CAST
+
+
+class RecordingClient:
+    def __init__(self):
+        self.requests = []
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, **params):
+        self.requests.append(params)
+        message = types.SimpleNamespace(content='{"roles": []}' if "response_format" in params else "Reply")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=None)
+
+
+def agent_options(**options):
+    return dict(single_flight=NoFlight(), metrics=CallMetrics(log_path=""), retry_policy=RetryPolicy(max_retries=0),
+                rate_limiter=RateLimiter(requests_per_minute=1000, tokens_per_minute=10 ** 7), **options)
+
+
+def test_prompt_block_ignores_source_indentation():
+    nested = """
+            First line.
+              Indented detail.
+            """
+    flat = "First line.\n  Indented detail."
+    assert prompt_block(nested) == prompt_block(flat) == flat
+
+
+CALLS = [
+    (FilmConceptAgent, lambda agent, value: agent.generate_concepts({"genre": value}, num_concepts=len(value))),
+    (ScriptAgent, lambda agent, value: agent.generate_treatment(value, additional_details=value)),
+    (ScriptAgent, lambda agent, value: agent.generate_script_outline(value, num_scenes=len(value))),
+    (ScriptAgent, lambda agent, value: agent.generate_scene(value, value, previous_scenes=[value])),
+    (CastingAgent, lambda agent, value: agent.suggest_cast(value, "low", exclude_actors=value)),
+    (CastingAgent, lambda agent, value: agent.suggest_cast(value, structured=True)),
+    (LocationAgent, lambda agent, value: agent.suggest_locations(value, "high", special_requirements=value)),
+    (ProductPlacementAgent, lambda agent, value: agent.suggest_placements(value, value, value)),
+    (MarketingAgent, lambda agent, value: agent.generate_marketing_assets(value, value)),
+]
+
+
+@pytest.mark.parametrize("cls, call", CALLS)
+def test_user_data_only_changes_the_last_message(cls, call):
+    client = RecordingClient()
+    agent = cls("sk-test", client=client, **agent_options())
+    call(agent, "Drama")
+    call(agent, "Science fiction noir")
+    first, second = (request["messages"] for request in client.requests)
+    assert first[:-1] == second[:-1]
+    assert [message["role"] for message in first] == ["system", "user"]
+    assert "Drama" not in first[0]["content"] and "Drama" in first[-1]["content"]
+    assert "Science fiction noir" in second[-1]["content"]
+
+
+def test_schema_instructions_join_the_fixed_prefix():
+    agent = CastingAgent("sk-test", client=RecordingClient(), **agent_options())
+    plain = agent.task_message(agent.casting_instructions)
+    structured = agent.task_message(agent.casting_instructions, CAST)
+    assert plain.startswith(agent.system_message)
+    assert structured.startswith(plain) and structured != plain
+
+
+def test_cached_prompt_tokens_are_recorded(mock_server):
+    metrics = CallMetrics(log_path="")
+    client = openai.OpenAI(api_key="sk-test", base_url=mock_server.base_url, max_retries=0)
+    agent = Agent("sk-test", client=client, **dict(agent_options(), metrics=metrics))
+    system_message = prompt_block("You are a careful script reader. " * 200)
+    agent.generate_response("First request", system_message)
+    agent.generate_response("Second request", system_message)
+    first, second = metrics.recent_calls()
+    assert first["cached_tokens"] == 0
+    assert second["cached_tokens"] >= 1024
+    assert second["cost_usd"] < first["cost_usd"]
+    assert metrics.summary()[0]["cached_prompt_tokens"] == second["cached_tokens"]
+    assert 'kind="cached_prompt"' in metrics.render_prometheus()
@@ -0,0 +1,95 @@
+import time
+
+import httpx
+import openai
+import pytest
+
+import rate_limit
+from agents import FilmConceptAgent, GenerationError
+from rate_limit import RateLimiter, RetryPolicy, retry_after_seconds
+
+
+def api_error(error_class, status, headers=None):
+    response = httpx.Response(status, headers=headers or {}, request=httpx.Request("POST", "http://api.test"))
+    return error_class("failed", response=response, body=None)
+
+
+def rate_limited(**headers):
+    return api_error(openai.RateLimitError, 429, headers)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(rate_limit.time, "sleep", slept.append)
+    return slept
+
+
+def test_retry_after_seconds_reads_every_header_form():
+    assert retry_after_seconds(rate_limited(**{"retry-after-ms": "1500"})) == 1.5
+    assert retry_after_seconds(rate_limited(**{"retry-after": "7"})) == 7.0
+    future = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 30))
+    assert 25 < retry_after_seconds(rate_limited(**{"retry-after": future})) <= 30
+    assert retry_after_seconds(rate_limited()) is None
+
+
+@pytest.mark.parametrize("value", ["soon", "Mon, 99 Foo 2024 25:61:00 GMT", "Wed, 21 Oct"])
+def test_malformed_retry_after_falls_back_to_backoff(value):
+    error = rate_limited(**{"retry-after": value})
+    assert retry_after_seconds(error) is None
+    assert 0 <= RetryPolicy(base_delay=1.0).delay(2, error) <= 4.0
+
+
+def test_retry_after_is_honored_and_capped(sleeps):
+    errors = [rate_limited(**{"retry-after": "3"}), rate_limited(**{"retry-after": "600"})]
+
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert RetryPolicy(max_retries=5, max_delay=60.0).call(call) == "ok"
+    assert sleeps == [3.0, 60.0]
+
+
+def test_retries_stop_after_max_retries(sleeps):
+    policy = RetryPolicy(max_retries=2, base_delay=0.0)
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise api_error(openai.InternalServerError, 500)
+
+    with pytest.raises(openai.InternalServerError):
+        policy.call(call)
+    assert len(calls) == 3
+    assert policy.retries == 2
+
+
+def test_non_retryable_and_give_up_errors_are_raised_at_once(sleeps):
+    policy = RetryPolicy(max_retries=5)
+    with pytest.raises(ValueError):
+        policy.call(lambda: (_ for _ in ()).throw(ValueError("bad")))
+    with pytest.raises(openai.RateLimitError):
+        policy.call(lambda: (_ for _ in ()).throw(rate_limited()), give_up_on=(openai.RateLimitError,))
+    assert sleeps == []
+
+
+class FailingCompletions:
+    def create(self, **params):
+        raise api_error(openai.InternalServerError, 500)
+
+
+class FailingClient:
+    def __init__(self):
+        self.chat = type("Chat", (), {"completions": FailingCompletions()})()
+
+
+def test_failed_call_refunds_its_token_reservation():
+    limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=100000)
+    agent = FilmConceptAgent("sk-test", client=FailingClient(), rate_limiter=limiter,
+                             retry_policy=RetryPolicy(max_retries=0))
+    with pytest.raises(GenerationError) as raised:
+        agent.generate_concepts({"genre": "Drama"})
+    assert raised.value.retryable
+    assert limiter.stats()["tokens_available"] == pytest.approx(100000, abs=5)
@@ -0,0 +1,137 @@
+import types
+
+import fakeredis
+import pytest
+
+import response_cache
+from response_cache import (MemoryCacheBackend, ReadThroughBackend, RedisCacheBackend, ResponseCache,
+                            SQLiteCacheBackend, cache_key)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Replaces the module's time source, so expiry is tested without sleeping
+    now = [1000.0]
+    monkeypatch.setattr(response_cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def make_backend(request, tmp_path):
+    def make(max_entries=3, ttl=60):
+        if request.param == "memory":
+            return MemoryCacheBackend(max_entries=max_entries, ttl=ttl)
+        if request.param == "redis":
+            return RedisCacheBackend(fakeredis.FakeRedis(decode_responses=True), prefix="test",
+                                     max_entries=max_entries, ttl=ttl)
+        return SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_entries=max_entries, ttl=ttl)
+    make.kind = request.param
+    return make
+
+
+def test_cache_key_depends_on_every_input():
+    messages = [{"role": "user", "content": "hi"}]
+    key = cache_key("gpt-4o", 0.7, "system", messages, max_tokens=100)
+    assert key == cache_key("gpt-4o", 0.7, "system", [dict(messages[0])], max_tokens=100)
+    assert key != cache_key("gpt-4o-mini", 0.7, "system", messages, max_tokens=100)
+    assert key != cache_key("gpt-4o", 0.2, "system", messages, max_tokens=100)
+    assert key != cache_key("gpt-4o", 0.7, "system", messages, max_tokens=200)
+
+
+def test_least_recently_used_entry_is_evicted(clock, make_backend):
+    backend = make_backend(max_entries=3)
+    for key in "abc":
+        clock[0] += 1
+        backend.set(key, key.upper())
+    clock[0] += 1
+    assert backend.get("a") == "A"
+    clock[0] += 1
+    backend.set("d", "D")
+    assert backend.get("b") is None
+    assert [backend.get(key) for key in "acd"] == ["A", "C", "D"]
+    assert len(backend) == 3
+    assert backend.evictions == 1
+
+
+def test_entries_expire_after_ttl(clock, make_backend):
+    if make_backend.kind == "redis":
+        pytest.skip("Redis expires entries itself (test_redis_entries_expire_through_redis)")
+    backend = make_backend(ttl=60)
+    backend.set("a", "A")
+    clock[0] += 59
+    assert backend.get("a") == "A"
+    clock[0] += 2
+    assert backend.get("a") is None
+
+
+def test_set_replaces_value_and_delete_removes_it(make_backend):
+    backend = make_backend()
+    backend.set("a", "old")
+    backend.set("a", "new")
+    assert backend.get("a") == "new"
+    assert len(backend) == 1
+    backend.delete("a")
+    assert backend.get("a") is None
+
+
+def test_sqlite_entries_are_shared_between_connections(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SQLiteCacheBackend(path).set("a", "A")
+    assert SQLiteCacheBackend(path).get("a") == "A"
+
+
+def test_redis_entries_expire_through_redis():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    backend = RedisCacheBackend(client, prefix="test", ttl=60)
+    backend.set("a", "A")
+    assert 0 < client.ttl("test:response:a") <= 60
+    client.delete("test:response:a")
+    assert backend.get("a") is None
+    assert len(backend) == 0
+
+
+def test_redis_entries_are_shared_between_replicas():
+    server = fakeredis.FakeServer()
+    first, second = (RedisCacheBackend(fakeredis.FakeRedis(server=server, decode_responses=True), prefix="test")
+                     for _ in range(2))
+    first.set("a", "A")
+    assert second.get("a") == "A"
+    second.clear()
+    assert first.get("a") is None
+
+
+def test_read_through_backend_serves_local_copy_until_written():
+    shared = MemoryCacheBackend()
+    replica, other = ReadThroughBackend(shared, ttl=60), ReadThroughBackend(shared, ttl=60)
+    other.set("a", "old")
+    assert replica.get("a") == "old"
+    shared.set("a", "changed elsewhere")
+    assert replica.get("a") == "old"
+    replica.set("a", "new")
+    assert replica.get("a") == "new"
+    replica.delete("a")
+    assert replica.get("a") is None
+
+
+def test_response_cache_counts_hits_misses_and_bypasses():
+    cache = ResponseCache(MemoryCacheBackend())
+    assert cache.get("a") is None
+    cache.set("a", "A")
+    assert cache.get("a") == "A"
+    cache.record_bypass()
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["bypasses"], stats["entries"]) == (1, 1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_cache_from_env_follows_the_state_backend(monkeypatch, tmp_path):
+    monkeypatch.delenv("VADIS_CACHE_BACKEND", raising=False)
+    monkeypatch.setenv("VADIS_CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(response_cache, "DEFAULT_STATE_BACKEND", "sqlite")
+    cache = response_cache.cache_from_env()
+    cache.set("a", "A")
+    # A second process opening the same file sees the entry
+    assert SQLiteCacheBackend(str(tmp_path / "cache.sqlite3")).get("a") == "A"
+
+    monkeypatch.setenv("VADIS_CACHE_BACKEND", "memory")
+    assert isinstance(response_cache.cache_from_env().backend, MemoryCacheBackend)
@@ -0,0 +1,106 @@
+import types
+
+import pytest
+
+from agents import FilmConceptAgent, ScriptAgent
+from rate_limit import RateLimiter
+from response_cache import MemoryCacheBackend, ResponseCache
+from semantic_cache import SemanticIndex, embed
+from single_flight import NoFlight
+
+CONCEPT_PROMPT = """Genre: Drama
+Key Themes: redemption, family
+Additional Notes: set on a fishing boat off the coast of Maine"""
+
+
+@pytest.fixture
+def cache():
+    return ResponseCache(MemoryCacheBackend(), SemanticIndex(threshold=0.9))
+
+
+def test_exact_key_hit_skips_the_index(cache):
+    cache.set("key", "response", ("scope", CONCEPT_PROMPT))
+    assert cache.get("key", ("other scope", "unrelated")) == "response"
+    assert cache.semantic.lookups == 0
+    assert cache.semantic_hits == 0
+
+
+def test_near_duplicate_hits_within_a_scope(cache):
+    cache.set("key", "response", ("scope", CONCEPT_PROMPT))
+    reordered = CONCEPT_PROMPT.replace("redemption, family", "family, redemption")
+    assert cache.get("other key", ("scope", reordered)) == "response"
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_near_duplicate_misses_across_scopes(cache):
+    cache.set("key", "response", ("scope", CONCEPT_PROMPT))
+    assert cache.get("other key", ("other scope", CONCEPT_PROMPT)) is None
+    assert cache.get("other key", None) is None
+
+
+def test_different_numbers_never_match(cache):
+    twelve = CONCEPT_PROMPT.replace("a fishing boat", "a fishing boat with a crew of 12")
+    eight = CONCEPT_PROMPT.replace("a fishing boat", "a fishing boat with a crew of 8")
+    cache.set("key", "response", ("scope", twelve))
+    assert embed(twelve) @ embed(eight) > cache.semantic.threshold
+    assert cache.get("other key", ("scope", eight)) is None
+
+
+def test_match_whose_response_was_evicted_is_discarded():
+    cache = ResponseCache(MemoryCacheBackend(max_entries=1), SemanticIndex(threshold=0.9))
+    cache.set("key", "response", ("scope", CONCEPT_PROMPT))
+    cache.set("newer", "other response", ("other scope", "Genre: Western"))
+    assert len(cache.semantic) == 2
+    assert cache.get("other key", ("scope", CONCEPT_PROMPT + " tonight")) is None
+    assert len(cache.semantic) == 1
+    assert cache.semantic.stats()["stale"] == 1
+
+
+def test_index_evicts_least_recently_matched():
+    index = SemanticIndex(threshold=0.9, max_entries=2)
+    index.add("a", "scope", "Genre: Drama")
+    index.add("b", "scope", "Genre: Comedy")
+    assert index.search("scope", "Genre: Drama") == "a"
+    index.add("c", "scope", "Genre: Horror")
+    assert index.search("scope", "Genre: Comedy") is None
+    assert index.search("scope", "Genre: Drama") == "a"
+    assert index.evictions == 1
+
+
+class CountingClient:
+    def __init__(self):
+        self.prompts = []
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, messages, **params):
+        self.prompts.append(messages[-1]["content"])
+        message = types.SimpleNamespace(content=f"Response {len(self.prompts)}")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=None)
+
+
+def make_agent(agent_class, client, cache):
+    return agent_class("sk-test", client=client, cache=cache, single_flight=NoFlight(),
+                       rate_limiter=RateLimiter(requests_per_minute=1000, tokens_per_minute=10 ** 7))
+
+
+def test_concepts_reuse_a_near_duplicate_response(cache):
+    client = CountingClient()
+    agent = make_agent(FilmConceptAgent, client, cache)
+    first = agent.generate_concepts({"genre": "Drama", "themes": "redemption, family"})
+    assert agent.generate_concepts({"genre": "Drama", "themes": "family, redemption"}) == first
+    assert len(client.prompts) == 1
+
+
+def test_edited_upstream_artifact_misses_the_tier(cache):
+    treatment = "ACT ONE. " + " ".join(f"Mara hauls net {number} and argues with her brother." for number in range(80))
+    edited = treatment.replace("net 40 and argues with her brother", "net 40 and forgives her brother")
+    # Close enough to match, had the outline opted in to near-duplicates
+    assert embed(treatment) @ embed(edited) > cache.semantic.threshold
+
+    client = CountingClient()
+    agent = make_agent(ScriptAgent, client, cache)
+    first = agent.generate_script_outline(treatment)
+    assert agent.generate_script_outline(edited) != first
+    assert len(client.prompts) == 2
+    assert len(cache.semantic) == 0
+    assert cache.stats()["semantic_hits"] == 0
@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import types
+
+import httpx
+import openai
+import pytest
+
+from agents import FilmConceptAgent, GenerationError
+from rate_limit import RateLimiter, RetryPolicy
+from single_flight import SingleFlight
+
+
+def run_concurrently(flight, key, func, callers):
+    results = [None] * callers
+    started = threading.Barrier(callers)
+
+    def caller(index):
+        started.wait()
+        try:
+            results[index] = flight.do(key, func)
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=caller, args=(index,)) for index in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return results
+
+
+def blocking(release, result=None, error=None):
+    calls = []
+
+    def func():
+        calls.append(1)
+        release.wait(timeout=5)
+        if error is not None:
+            raise error
+        return result
+
+    return func, calls
+
+
+def release_when_joined(flight, callers):
+    release = threading.Event()
+
+    def watch():
+        while flight.stats()["coalesced"] < callers - 1:
+            threading.Event().wait(0.001)
+        release.set()
+
+    threading.Thread(target=watch, daemon=True).start()
+    return release
+
+
+def test_concurrent_callers_share_one_result():
+    flight = SingleFlight()
+    release = release_when_joined(flight, 4)
+    func, calls = blocking(release, result={"title": "Dune"})
+    results = run_concurrently(flight, "key", func, 4)
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"leaders": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_concurrent_callers_share_one_error():
+    flight = SingleFlight()
+    release = release_when_joined(flight, 3)
+    error = RuntimeError("upstream failed")
+    func, calls = blocking(release, error=error)
+    results = run_concurrently(flight, "key", func, 3)
+    assert len(calls) == 1
+    assert results == [error, error, error]
+
+
+def test_finished_calls_are_not_reused():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: (_ for _ in ()).throw(ValueError()))
+    assert flight.do("key", lambda: 3) == 3
+    assert flight.stats()["coalesced"] == 0
+
+
+def test_stream_is_replayed_to_late_joiners():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def upstream():
+        yield "a"
+        release.wait(timeout=5)
+        yield "b"
+
+    first = flight.stream("key", upstream)
+    assert next(first) == "a"
+    second = flight.stream("key", lambda: iter(["unused"]))
+    release.set()
+    assert list(first) == ["b"]
+    assert list(second) == ["a", "b"]
+
+
+def test_async_callers_share_result_and_error():
+    flight = SingleFlight()
+    calls = []
+
+    async def func(outcome):
+        calls.append(outcome)
+        await asyncio.sleep(0.01)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def main():
+        shared = await asyncio.gather(*(flight.do_async("ok", lambda: func("done")) for _ in range(3)))
+        error = KeyError("gone")
+        failed = await asyncio.gather(*(flight.do_async("bad", lambda: func(error)) for _ in range(3)),
+                                      return_exceptions=True)
+        return shared, failed, error
+
+    shared, failed, error = asyncio.run(main())
+    assert shared == ["done"] * 3
+    assert failed == [error] * 3
+    assert len(calls) == 2
+
+
+class BlockingClient:
+    # Holds every completion until release is set, then fails with error or answers with content
+    def __init__(self, release, content=None, error=None):
+        self.release = release
+        self.content = content
+        self.error = error
+        self.calls = 0
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, **params):
+        self.calls += 1
+        self.release.wait(timeout=5)
+        if self.error is not None:
+            raise self.error
+        message = types.SimpleNamespace(content=self.content)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=None)
+
+
+def test_calls_are_not_shared_across_api_keys():
+    flight = SingleFlight()
+    release = threading.Event()
+    response = httpx.Response(401, request=httpx.Request("POST", "http://api.test"))
+    failing = BlockingClient(release, error=openai.AuthenticationError("bad key", response=response, body=None))
+    working = BlockingClient(release, content="A heist on the moon")
+    options = dict(single_flight=flight, retry_policy=RetryPolicy(max_retries=0),
+                   rate_limiter=RateLimiter(requests_per_minute=1000, tokens_per_minute=10 ** 7))
+    leader = FilmConceptAgent("sk-revoked", client=failing, **options)
+    other = FilmConceptAgent("sk-valid", client=working, **options)
+    same_key = FilmConceptAgent("sk-revoked", client=failing, **options)
+
+    outcomes = {}
+
+    def call(name, agent):
+        try:
+            outcomes[name] = agent.generate_concepts({"genre": "Drama"})
+        except GenerationError as e:
+            outcomes[name] = e
+
+    threads = [threading.Thread(target=call, args=(name, agent))
+               for name, agent in (("leader", leader), ("other", other), ("same_key", same_key))]
+    for thread in threads:
+        thread.start()
+    while flight.stats()["leaders"] < 2 or flight.stats()["coalesced"] < 1:
+        threading.Event().wait(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert isinstance(outcomes["leader"], GenerationError)
+    assert outcomes["same_key"] is outcomes["leader"]
+    assert outcomes["other"] == "A heist on the moon"
+    assert (failing.calls, working.calls) == (1, 1)
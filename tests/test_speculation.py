@@ -0,0 +1,112 @@
+import threading
+import types
+
+import pytest
+
+import speculation
+from pipeline import DEFAULT_NODES
+from speculation import SpeculationCancelled, Speculator
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(speculation, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def speculator():
+    speculator = Speculator(max_workers=1, budget=2, ttl=60, budget_window=300)
+    yield speculator
+    speculator._executor.shutdown(wait=True)
+
+
+def test_take_returns_streamed_result(speculator):
+    def func(on_delta):
+        on_delta("Once ")
+        on_delta("upon")
+        return {"treatment": "Once upon"}
+
+    assert speculator.speculate("session", "key", func)
+    deltas = []
+    assert speculator.take("session", "key", deltas.append) == {"treatment": "Once upon"}
+    assert deltas == ["Once ", "upon"]
+    assert speculator.take("session", "key") is None
+    assert speculator.stats()["hits"] == 1
+
+
+def test_sessions_only_take_their_own_speculations(speculator):
+    assert speculator.speculate("session", "key", lambda on_delta: "mine")
+    assert speculator.speculate("other", "key", lambda on_delta: "theirs")
+    assert speculator.take("third", "key") is None
+    assert speculator.take("other", "key") == "theirs"
+    assert speculator.cancel("other") == 0
+    assert speculator.take("session", "key") == "mine"
+    assert speculator.stats()["hits"] == 2
+
+
+def test_budget_is_per_window(speculator, clock):
+    assert speculator.speculate("session", "a", lambda on_delta: 1)
+    assert speculator.speculate("session", "b", lambda on_delta: 2)
+    assert not speculator.speculate("session", "c", lambda on_delta: 3)
+    assert speculator.speculate("other", "c", lambda on_delta: 3)
+    assert speculator.stats()["over_budget"] == 1
+
+    clock[0] += 301
+    assert speculator.speculate("session", "d", lambda on_delta: 4)
+    assert set(speculator._spent) == {"session"}
+
+
+def test_idle_sessions_are_pruned(speculator, clock):
+    for number in range(3):
+        speculator.speculate(f"session {number}", f"key {number}", lambda on_delta: None)
+    clock[0] += 301
+    speculator.speculate("new", "key", lambda on_delta: None)
+    assert list(speculator._spent) == ["new"]
+
+
+def test_cancelled_before_start_refunds_the_budget(speculator):
+    release = threading.Event()
+    speculator.speculate("other", "blocker", lambda on_delta: release.wait(timeout=5))
+    speculator.speculate("session", "a", lambda on_delta: "a")
+    assert speculator.cancel("session") == 1
+    assert "session" not in speculator._spent or not speculator._spent["session"]
+    release.set()
+
+
+def test_structured_node_stops_at_checkpoint_when_cancelled(speculator):
+    calls = []
+    system = types.SimpleNamespace(create_script_outline=lambda *args, **options: calls.append(args))
+    outline = next(node for node in DEFAULT_NODES if node.name == "script_outline")
+    started, release = threading.Event(), threading.Event()
+
+    def func(on_delta):
+        # Stands in for the wait before the request (e.g. a queue or rate limit)
+        started.set()
+        release.wait(timeout=5)
+        return outline.run(system, {"treatment": "A heist", "num_scenes": 12}, on_delta=on_delta)
+
+    speculator.speculate("session", "outline", func)
+    started.wait(timeout=5)
+    speculator.cancel("session")
+    release.set()
+    speculator._executor.shutdown(wait=True)
+    assert calls == []
+    assert speculator.stats()["cancelled"] == 1
+
+
+def test_streamed_speculation_stops_on_cancel():
+    seen = []
+
+    def func(on_delta):
+        for chunk in ("a", "b", "c"):
+            seen.append(chunk)
+            on_delta(chunk)
+        return "abc"
+
+    cancelled = speculation.Speculation("key", "session")
+    cancelled.cancelled.set()
+    with pytest.raises(SpeculationCancelled):
+        func(cancelled.on_delta)
+    assert seen == ["a"]
@@ -0,0 +1,113 @@
+import json
+import types
+
+import pytest
+
+from agents import Agent, GenerationError, ScriptAgent, parse_script_outline
+from metrics import CallMetrics
+from rate_limit import RateLimiter, RetryPolicy
+from response_cache import ResponseCache
+from single_flight import NoFlight
+from structured_outputs import (CONCEPT, LOCATIONS, SCRIPT_OUTLINE, StructuredOutputError, array_of,
+                                strict_object, validate)
+
+CONCEPT_DATA = {
+    "title": "Dune",
+    "logline": "A boy inherits a desert.",
+    "synopsis": "Sand, spice and prophecy.",
+    "selling_points": ["Scale", "Myth"],
+    "audience_appeal": "Adults who like epics",
+}
+OUTLINE_DATA = {"scenes": [
+    {"number": 1, "heading": "INT. TENT - NIGHT", "setting": "A stillsuit tent", "characters": ["Paul", "Jessica"],
+     "action": "Paul wakes from a dream.", "purpose": "Sets up the visions"},
+    {"number": 2, "heading": "EXT. DUNES - DAY", "setting": "Open desert", "characters": ["Paul"],
+     "action": "Paul walks without rhythm.", "purpose": "Shows what he has learned"},
+]}
+
+
+class FakeClient:
+    def __init__(self, content):
+        self.content = content
+        self.requests = []
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, **params):
+        self.requests.append(params)
+        message = types.SimpleNamespace(content=self.content)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=None)
+
+
+def script_agent(content, cache=None):
+    return ScriptAgent("sk-test", client=FakeClient(content), cache=cache, single_flight=NoFlight(),
+                       rate_limiter=RateLimiter(requests_per_minute=1000, tokens_per_minute=10 ** 7),
+                       retry_policy=RetryPolicy(max_retries=0), metrics=CallMetrics(log_path=""))
+
+
+def test_valid_records_pass():
+    validate(CONCEPT_DATA, CONCEPT.schema)
+    assert SCRIPT_OUTLINE.parse(json.dumps(OUTLINE_DATA)) == OUTLINE_DATA
+
+
+@pytest.mark.parametrize("change, message", [
+    (lambda data: data.pop("logline"), "$.logline is missing"),
+    (lambda data: data.update(title=7), "$.title should be a string"),
+    (lambda data: data.update(selling_points="Scale"), "$.selling_points should be an array"),
+    (lambda data: data["selling_points"].append(None), "$.selling_points[2] should be a string"),
+])
+def test_invalid_records_name_the_offending_field(change, message):
+    data = json.loads(json.dumps(CONCEPT_DATA))
+    change(data)
+    with pytest.raises(StructuredOutputError, match=message.replace("$", r"\$").replace("[", r"\[")):
+        validate(data, CONCEPT.schema)
+
+
+def test_integers_enums_and_objects_are_checked():
+    schema = strict_object(count=array_of({"type": "integer"}), cost={"type": "string", "enum": ["low", "high"]})
+    validate({"count": [1, 2], "cost": "low"}, schema)
+    for bad in ({"count": [True], "cost": "low"}, {"count": [1.5], "cost": "low"},
+                {"count": [], "cost": "cheap"}, ["count"]):
+        with pytest.raises(StructuredOutputError):
+            validate(bad, schema)
+
+
+@pytest.mark.parametrize("content", ["not json", "", None, '{"scenes": [{"number": "one"}]}'])
+def test_parse_rejects_bad_payloads(content):
+    with pytest.raises(StructuredOutputError):
+        SCRIPT_OUTLINE.parse(content)
+
+
+def test_response_format_follows_the_mode():
+    assert LOCATIONS.response_format("json_object") == {"type": "json_object"}
+    response_format = LOCATIONS.response_format("json_schema")
+    assert response_format["json_schema"]["strict"] is True
+    assert response_format["json_schema"]["schema"] is LOCATIONS.schema
+    assert json.dumps(LOCATIONS.schema) in LOCATIONS.instructions("json_object")
+
+
+def test_rendered_outline_reads_back_as_scenes():
+    scenes = parse_script_outline(SCRIPT_OUTLINE.render(OUTLINE_DATA))
+    assert [(scene["number"], scene["heading"], scene["characters"]) for scene in scenes] == [
+        (1, "INT. TENT - NIGHT", "Paul, Jessica"), (2, "EXT. DUNES - DAY", "Paul")]
+
+
+def test_structured_agent_call_returns_the_record():
+    agent = script_agent(json.dumps(OUTLINE_DATA))
+    assert agent.generate_script_outline("A treatment", structured=True) == OUTLINE_DATA
+    assert agent.client.requests[0]["response_format"]["type"] in ("json_schema", "json_object")
+
+
+def test_invalid_structured_reply_is_an_error_and_not_cached():
+    cache = ResponseCache()
+    agent = script_agent('{"scenes": "none"}', cache=cache)
+    with pytest.raises(GenerationError) as raised:
+        agent.generate_script_outline("A treatment", structured=True)
+    assert isinstance(raised.value.cause, StructuredOutputError)
+    agent.client.content = json.dumps(OUTLINE_DATA)
+    assert agent.generate_script_outline("A treatment", structured=True) == OUTLINE_DATA
+    assert len(agent.client.requests) == 2
+
+
+def test_plain_agents_still_return_text():
+    assert Agent("sk-test", client=FakeClient("Plain text"), single_flight=NoFlight(),
+                 metrics=CallMetrics(log_path="")).generate_response("Hi", "System") == "Plain text"